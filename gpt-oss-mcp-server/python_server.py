@@ -1,30 +1,41 @@
-from mcp.server.fastmcp import FastMCP
+import os
+import uuid
+
+from mcp.server.fastmcp import Context, FastMCP
 from gpt_oss.tools.python_docker.docker_tool import PythonTool
+from gpt_oss.tools.python_docker.kernel import default_kernel_sessions
 from openai_harmony import Message, TextContent, Author, Role
 
+# PYTHON_SESSIONS=1 keeps python state per MCP client session
+sessions = default_kernel_sessions() if os.environ.get("PYTHON_SESSIONS") == "1" else None
+instructions = PythonTool(sessions=sessions).instruction
+
 # Pass lifespan to server
 mcp = FastMCP(
     name="python",
-    instructions=r"""
-Use this tool to execute Python code in your chain of thought. The code will not be shown to the user. This tool should be used for internal reasoning, but not for code that is intended to be visible to the user (e.g. when creating plots, tables, or files).
-When you send a message containing python code to python, it will be executed in a stateless docker container, and the stdout of that process will be returned to you.
-""".strip(),
+    instructions=instructions,
 )
 
 
+def session_key(ctx: Context) -> str:
+    # stored on the client session, since id() values of sessions that are
+    # gone get reused by new ones
+    key = getattr(ctx.session, "python_session_id", None)
+    if key is None:
+        key = ctx.session.python_session_id = f"mcp-{uuid.uuid4().hex}"
+    return key
+
+
 @mcp.tool(
     name="python",
     title="Execute Python code",
-    description="""
-Use this tool to execute Python code in your chain of thought. The code will not be shown to the user. This tool should be used for internal reasoning, but not for code that is intended to be visible to the user (e.g. when creating plots, tables, or files).
-When you send a message containing python code to python, it will be executed in a stateless docker container, and the stdout of that process will be returned to you.
-    """,
+    description=instructions,
     annotations={
         # Harmony format don't want this schema to be part of it because it's simple text in text out
         "include_in_prompt": False,
     })
-async def python(code: str) -> str:
-    tool = PythonTool()
+async def python(code: str, ctx: Context) -> str:
+    tool = PythonTool(sessions=sessions, session_id=session_key(ctx))
     messages = []
     async for message in tool.process(
             Message(author=Author(role=Role.TOOL, name="python"),
@@ -21,6 +21,7 @@ from gpt_oss.tools import apply_patch
 from gpt_oss.tools.simple_browser import SimpleBrowserTool
 from gpt_oss.tools.simple_browser.backend import ExaBackend
 from gpt_oss.tools.python_docker.docker_tool import PythonTool
+from gpt_oss.tools.python_docker.kernel import default_kernel_sessions
 
 from openai_harmony import (
     Author,
@@ -92,7 +93,7 @@ def main(args):
         system_message_content = system_message_content.with_tools(browser_tool.tool_config)
 
     if args.python:
-        python_tool = PythonTool()
+        python_tool = PythonTool(sessions=default_kernel_sessions() if args.python_session else None)
         system_message_content = system_message_content.with_tools(python_tool.tool_config)
 
     system_message = Message.from_role_and_content(Role.SYSTEM, system_message_content)
@@ -243,8 +244,8 @@ def main(args):
 
         parser = StreamableParser(encoding, role=Role.ASSISTANT)
         field_created = False
-        current_output_text = ""
-        output_text_delta_buffer = ""
+        # one per final message, flushed when the message ends
+        citation_normalizer = None
         for predicted_token in generator.generate(tokens, encoding.stop_tokens_for_assistant_actions()):
             parser.process(predicted_token)
             if args.raw:
@@ -252,6 +253,9 @@ def main(args):
                 continue
 
             if parser.state == StreamState.EXPECT_START:
+                if citation_normalizer is not None:
+                    print(citation_normalizer.flush(), end="")
+                    citation_normalizer = None
                 print("")  # new line
                 field_created = False
 
@@ -267,17 +271,13 @@ def main(args):
                 else:
                     print(termcolor.colored("CoT:", "yellow"), flush=True)
 
-            should_send_output_text_delta = True
-            output_text_delta_buffer += parser.last_content_delta
-            if args.browser:
-                updated_output_text, _annotations, has_partial_citations = browser_tool.normalize_citations(current_output_text + output_text_delta_buffer)
-                output_text_delta_buffer = updated_output_text[len(current_output_text):]
-                if has_partial_citations:
-                    should_send_output_text_delta = False
-            if should_send_output_text_delta:
-                print(output_text_delta_buffer, end="", flush=True)
-                current_output_text += output_text_delta_buffer
-                output_text_delta_buffer = ""
+            output_text_delta = parser.last_content_delta
+            if args.browser and parser.current_channel == "final":
+                if citation_normalizer is None:
+                    citation_normalizer = browser_tool.citation_normalizer()
+                output_text_delta, _annotations = citation_normalizer.feed(output_text_delta)
+            if output_text_delta:
+                print(output_text_delta, end="", flush=True)
 
         messages += parser.messages
 
@@ -328,6 +328,12 @@ if __name__ == "__main__":
         action="store_true",
         help="Use python tool",
     )
+    parser.add_argument(
+        "--python-session",
+        default=False,
+        action="store_true",
+        help="Keep python state between tool calls, like a Jupyter notebook",
+    )
     parser.add_argument(
         "--developer-message",
         default="",
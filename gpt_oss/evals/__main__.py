@@ -68,11 +68,19 @@ def main():
     parser.add_argument(
         "--examples", type=int, help="Number of examples to use (overrides default)"
     )
+    parser.add_argument(
+        "--use-n",
+        action="store_true",
+        help="Request the repeats of a prompt together with `n` so the prompt is "
+        "prefilled once (gpt-oss responses server only)",
+    )
 
     args = parser.parse_args()
 
     sampler_cls = ResponsesSampler if args.sampler == "responses" else ChatCompletionsSampler
 
+    sampler_kwargs = {"use_n": True} if args.use_n else {}
+
     models = {}
     for model_name in args.model.split(","):
         for reasoning_effort in args.reasoning_effort.split(","):
@@ -83,6 +91,7 @@ def main():
                 temperature=args.temperature,
                 base_url=args.base_url,
                 max_tokens=131_072,
+                **sampler_kwargs,
             )
 
     print(f"Running with args {args}")
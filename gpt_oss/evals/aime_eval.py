@@ -64,13 +64,14 @@ class AIME25Eval(Eval):
         self.n_threads = n_threads
 
     def __call__(self, sampler: SamplerBase) -> EvalResult:
-        def fn(row: dict):
-            prompt_messages = [
+        def prompt(row: dict):
+            return [
                 sampler._pack_message(
                     content=format_aime_question(row), role="user"
                 )
             ]
-            sampler_response = sampler(prompt_messages)
+
+        def grade(row: dict, sampler_response) -> SingleEvalResult:
             response_text = sampler_response.response_text
             actual_queried_prompt_messages = sampler_response.actual_queried_message_list
             extracted_answer = extract_boxed_text(response_text)
@@ -92,6 +93,19 @@ class AIME25Eval(Eval):
                 html=html, score=score, convo=convo, metrics={"chars": len(response_text)}
             )
 
-        results = report.map_with_progress(fn, self.examples, num_threads=self.n_threads)
-        return report.aggregate_results(results)
+        def fn(row: dict):
+            return grade(row, sampler(prompt(row)))
+
+        if sampler.supports_n and self.n_repeats > 1:
+            # the repeats of a question have the same prompt (the permutation is
+            # unused), so they are sampled in one request that prefills it once
+            def fn_n(row: dict):
+                responses = sampler.sample_n(prompt(row), self.n_repeats)
+                return [grade(row, response) for response in responses]
 
+            questions = self.examples[: len(self.examples) // self.n_repeats]
+            groups = report.map_with_progress(fn_n, questions, num_threads=self.n_threads)
+            results = [result for group in groups for result in group]
+        else:
+            results = report.map_with_progress(fn, self.examples, num_threads=self.n_threads)
+        return report.aggregate_results(results)
@@ -21,6 +21,7 @@ class ResponsesSampler(SamplerBase):
         reasoning_model: bool = False,
         reasoning_effort: str | None = None,
         base_url: str = "http://localhost:8000/v1",
+        use_n: bool = False,
     ):
         self.client = OpenAI(base_url=base_url, timeout=24*60*60)
         self.model = model
@@ -30,10 +31,33 @@ class ResponsesSampler(SamplerBase):
         self.image_format = "url"
         self.reasoning_model = reasoning_model
         self.reasoning_effort = reasoning_effort
+        # the gpt-oss responses server accepts `n` and prefills the prompt once
+        self.supports_n = use_n
 
     def _pack_message(self, role: str, content: Any) -> dict[str, Any]:
         return {"role": role, "content": content}
 
+    def _create(self, message_list: MessageList, **kwargs):
+        if self.reasoning_model:
+            reasoning = (
+                {"effort": self.reasoning_effort}
+                if self.reasoning_effort
+                else None
+            )
+            return self.client.responses.create(
+                model=self.model,
+                input=message_list,
+                reasoning=reasoning,
+                **kwargs,
+            )
+        return self.client.responses.create(
+            model=self.model,
+            input=message_list,
+            temperature=self.temperature,
+            max_output_tokens=self.max_tokens,
+            **kwargs,
+        )
+
     def __call__(self, message_list: MessageList) -> SamplerResponse:
         if self.developer_message:
             message_list = [
@@ -42,24 +66,7 @@ class ResponsesSampler(SamplerBase):
         trial = 0
         while True:
             try:
-                if self.reasoning_model:
-                    reasoning = (
-                        {"effort": self.reasoning_effort}
-                        if self.reasoning_effort
-                        else None
-                    )
-                    response = self.client.responses.create(
-                        model=self.model,
-                        input=message_list,
-                        reasoning=reasoning,
-                    )
-                else:
-                    response = self.client.responses.create(
-                        model=self.model,
-                        input=message_list,
-                        temperature=self.temperature,
-                        max_output_tokens=self.max_tokens,
-                    )
+                response = self._create(message_list)
 
                 for output in response.output:
                     if hasattr(output, "text"):
@@ -90,3 +97,52 @@ class ResponsesSampler(SamplerBase):
                 time.sleep(exception_backoff)
                 trial += 1
             # unknown error shall throw exception
+
+    def sample_n(self, message_list: MessageList, n: int) -> list[SamplerResponse]:
+        if not self.supports_n or n == 1:
+            return super().sample_n(message_list, n)
+        if self.developer_message:
+            message_list = [
+                self._pack_message("developer", self.developer_message)
+            ] + message_list
+        trial = 0
+        while True:
+            try:
+                response = self._create(message_list, extra_body={"n": n})
+                # extra field of the gpt-oss server: one response per sample
+                return [
+                    SamplerResponse(
+                        response_text=_output_text(sample["output"]),
+                        response_metadata={"usage": sample.get("usage")},
+                        actual_queried_message_list=list(message_list),
+                    )
+                    for sample in response.samples
+                ]
+            except openai.BadRequestError as e:
+                print("Bad Request Error", e)
+                return [
+                    SamplerResponse(
+                        response_text="",
+                        response_metadata={"usage": None},
+                        actual_queried_message_list=list(message_list),
+                    )
+                    for _ in range(n)
+                ]
+            except Exception as e:
+                exception_backoff = 2**trial  # expontial back off
+                print(
+                    f"Rate limit exception so wait and retry {trial} after {exception_backoff} sec",
+                    e,
+                )
+                time.sleep(exception_backoff)
+                trial += 1
+
+
+def _output_text(output: list[dict[str, Any]]) -> str:
+    return "".join(
+        content["text"]
+        for item in output
+        if item.get("type") == "message"
+        for content in item.get("content", [])
+        if content.get("type") == "output_text"
+    )
@@ -21,12 +21,23 @@ class SamplerBase:
     or used as part of the grading process.
     """
 
+    # whether sample_n() draws all samples in a single request
+    supports_n: bool = False
+
     def __call__(
         self, 
         message_list: MessageList,
     ) -> SamplerResponse:
         raise NotImplementedError
 
+    def sample_n(
+        self,
+        message_list: MessageList,
+        n: int,
+    ) -> list[SamplerResponse]:
+        """Draw n independent samples for the same messages."""
+        return [self(list(message_list)) for _ in range(n)]
+
 
 @dataclass
 class EvalResult:
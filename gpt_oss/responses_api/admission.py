@@ -0,0 +1,170 @@
+"""
+Admission control for ``/v1/responses``.
+
+Every request reserves an estimate of the KV cache it can grow to (prompt
+tokens plus ``max_output_tokens``) for as long as it runs. Requests that do not
+fit wait in a bounded FIFO queue; when the queue is full, or a request waited
+too long, it is rejected so the client can back off (HTTP 429 with
+Retry-After) instead of every stream slowing down together.
+"""
+
+import asyncio
+import math
+import time
+from collections import deque
+from dataclasses import dataclass
+from typing import Optional
+
+from .metrics import Histogram
+
+DEFAULT_MAX_QUEUED = 64
+DEFAULT_MAX_QUEUE_WAIT_S = 30.0
+# weight of the latest request in the running mean of request durations
+_HOLD_TIME_DECAY = 0.1
+
+
+class AdmissionRejected(Exception):
+    def __init__(self, reason: str, retry_after: int):
+        super().__init__(reason)
+        self.reason = reason
+        self.retry_after = retry_after
+
+
+@dataclass
+class AdmissionStats:
+    admitted: int = 0
+    # admitted after waiting in the queue
+    queued: int = 0
+    rejected: int = 0
+    timed_out: int = 0
+
+
+class AdmissionTicket:
+    """Reservation held by an admitted request; ``release`` is idempotent."""
+
+    def __init__(self, controller: "AdmissionController", tokens: int):
+        self.tokens = tokens
+        self.admitted_at = time.monotonic()
+        self.released = False
+        self._controller = controller
+
+    def release(self) -> None:
+        if not self.released:
+            self.released = True
+            self._controller._release(self)
+
+
+class AdmissionController:
+    """
+    Admits requests while the reserved tokens stay within ``max_tokens`` and
+    the number of running requests within ``max_active`` (None disables either
+    limit). Requests are admitted in arrival order.
+    """
+
+    def __init__(
+        self,
+        max_tokens: Optional[int] = None,
+        max_active: Optional[int] = None,
+        max_queued: int = DEFAULT_MAX_QUEUED,
+        max_queue_wait_s: Optional[float] = DEFAULT_MAX_QUEUE_WAIT_S,
+    ):
+        self.max_tokens = max_tokens
+        self.max_active = max_active
+        self.max_queued = max_queued
+        self.max_queue_wait_s = max_queue_wait_s
+        self.stats = AdmissionStats()
+        self.queue_wait = Histogram(
+            "gpt_oss_admission_wait_seconds",
+            "Time requests spent queued before being admitted.",
+        )
+        self.reserved_tokens = 0
+        self.active = 0
+        self._waiters: deque[tuple[int, asyncio.Future]] = deque()
+        # running mean of how long admitted requests hold their reservation
+        self._mean_hold_s = 1.0
+
+    @property
+    def queue_depth(self) -> int:
+        return len(self._waiters)
+
+    def estimate_tokens(
+        self, prompt_tokens: int, max_output_tokens: Optional[int]
+    ) -> int:
+        tokens = prompt_tokens + (max_output_tokens or 0)
+        # a request bigger than the whole budget can still run on its own
+        if self.max_tokens is not None:
+            tokens = min(tokens, self.max_tokens)
+        return tokens
+
+    def _fits(self, tokens: int) -> bool:
+        if self.max_active is not None and self.active >= self.max_active:
+            return False
+        if self.max_tokens is not None:
+            return self.reserved_tokens + tokens <= self.max_tokens
+        return True
+
+    def _admit(self, tokens: int) -> AdmissionTicket:
+        self.reserved_tokens += tokens
+        self.active += 1
+        self.stats.admitted += 1
+        return AdmissionTicket(self, tokens)
+
+    def retry_after(self) -> int:
+        """Seconds until a rejected request is likely to be admitted."""
+        waves = (len(self._waiters) + 1) / max(self.active, 1)
+        return max(1, math.ceil(self._mean_hold_s * waves))
+
+    async def acquire(self, tokens: int) -> AdmissionTicket:
+        """Reserve ``tokens``, waiting in line if needed."""
+        if not self._waiters and self._fits(tokens):
+            self.queue_wait.observe(0.0)
+            return self._admit(tokens)
+        if len(self._waiters) >= self.max_queued:
+            self.stats.rejected += 1
+            raise AdmissionRejected("server is at capacity", self.retry_after())
+
+        future = asyncio.get_running_loop().create_future()
+        waiter = (tokens, future)
+        self._waiters.append(waiter)
+        start = time.monotonic()
+        try:
+            ticket = await asyncio.wait_for(
+                asyncio.shield(future), self.max_queue_wait_s
+            )
+        except asyncio.TimeoutError:
+            if future.done() and not future.cancelled():
+                # admitted right as the timeout fired
+                ticket = future.result()
+            else:
+                self._waiters.remove(waiter)
+                self._drain()
+                self.stats.rejected += 1
+                self.stats.timed_out += 1
+                raise AdmissionRejected(
+                    "timed out waiting for capacity", self.retry_after()
+                )
+        except asyncio.CancelledError:
+            # the client went away while queued
+            if future.done() and not future.cancelled():
+                future.result().release()
+            else:
+                self._waiters.remove(waiter)
+                future.cancel()
+                self._drain()
+            raise
+        self.stats.queued += 1
+        self.queue_wait.observe(time.monotonic() - start)
+        return ticket
+
+    def _release(self, ticket: AdmissionTicket) -> None:
+        self.reserved_tokens -= ticket.tokens
+        self.active -= 1
+        held = time.monotonic() - ticket.admitted_at
+        self._mean_hold_s += _HOLD_TIME_DECAY * (held - self._mean_hold_s)
+        self._drain()
+
+    def _drain(self) -> None:
+        # strictly FIFO: a large request at the head is not overtaken
+        while self._waiters and self._fits(self._waiters[0][0]):
+            tokens, future = self._waiters.popleft()
+            future.set_result(self._admit(tokens))
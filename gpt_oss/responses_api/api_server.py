@@ -1,27 +1,39 @@
+import asyncio
 import datetime
+import time
 import uuid
-from typing import Callable, Literal, Optional
+from contextlib import asynccontextmanager
+from dataclasses import asdict
+from typing import Callable, Literal, Optional, Union
 
-from fastapi import FastAPI, Request
-from fastapi.responses import StreamingResponse
+from fastapi import FastAPI, HTTPException, Request
+from fastapi.responses import PlainTextResponse, Response, StreamingResponse
+from starlette.background import BackgroundTask
 from openai_harmony import (
     Author,
     Conversation,
-    DeveloperContent,
     HarmonyEncoding,
     Message,
     ReasoningEffort,
     Role,
     StreamableParser,
     StreamState,
-    SystemContent,
-    ToolDescription,
 )
 
 from gpt_oss.tools.python_docker.docker_tool import PythonTool
+from gpt_oss.tools.python_docker.kernel import KernelSessions
+from gpt_oss.tools.python_docker.sandbox import SandboxPool
 from gpt_oss.tools.simple_browser import SimpleBrowserTool
 from gpt_oss.tools.simple_browser.backend import ExaBackend
 
+from .admission import AdmissionController, AdmissionRejected, AdmissionTicket
+from .engine import (
+    BatchedModel,
+    EngineSession,
+    InferenceEngine,
+    SessionCancelled,
+    SessionModel,
+)
 from .events import (
     ResponseCodeInterpreterCallCompleted,
     ResponseCodeInterpreterCallInProgress,
@@ -42,12 +54,21 @@ from .events import (
     ResponseWebSearchCallInProgress,
     ResponseWebSearchCallSearching,
 )
+from .inference.session import InferenceBackend, InferNextTokenBackend
+from .metrics import Counter, Gauge, MetricsRegistry
+from .preamble import PreambleRenderer
+from .profiler import EngineProfiler, ProfileInProgress
+from .sse import DeltaEmitter, format_sse
+from .store import MemoryResponsesStore, ResponsesStore, StoredResponse
+from .tool_executor import ToolExecutor
 from .types import (
     CodeInterpreterCallItem,
     Error,
     FunctionCallItem,
+    InputTokensDetails,
     Item,
     ReasoningItem,
+    ProfileRequest,
     ReasoningTextContentItem,
     ResponseObject,
     ResponsesRequest,
@@ -82,10 +103,281 @@ def is_not_builtin_tool(recipient: str) -> bool:
 
 
 def create_api_server(
-    infer_next_token: Callable[[list[int], float], int], encoding: HarmonyEncoding
+    backend: Union[
+        InferenceBackend, BatchedModel, Callable[[list[int], float], int], None
+    ] = None,
+    encoding: Optional[HarmonyEncoding] = None,
+    *,
+    infer_next_token: Optional[Callable[[list[int], float], int]] = None,
+    responses_store: Optional[ResponsesStore] = None,
+    profile_dir: Optional[str] = None,
+    admission: Optional[AdmissionController] = None,
+    tool_executor: Optional[ToolExecutor] = None,
+    sandbox_pool: Optional[SandboxPool] = None,
+    python_sessions: Optional[KernelSessions] = None,
 ) -> FastAPI:
-    app = FastAPI()
-    responses_store: dict[str, tuple[ResponsesRequest, ResponseObject]] = {}
+    # `infer_next_token` functions are still accepted for custom backends
+    if backend is None:
+        backend = infer_next_token
+    if backend is None or encoding is None:
+        raise TypeError("create_api_server() requires a backend and an encoding")
+    if callable(backend) and not isinstance(backend, (InferenceBackend, BatchedModel)):
+        backend = InferNextTokenBackend(backend)
+
+    if responses_store is None:
+        responses_store = MemoryResponsesStore()
+    if admission is None:
+        # no limits: every request is admitted right away
+        admission = AdmissionController()
+    if tool_executor is None:
+        tool_executor = ToolExecutor()
+
+    @asynccontextmanager
+    async def lifespan(app: FastAPI):
+        if sandbox_pool is not None:
+            sandbox_pool.start()
+        if python_sessions is not None:
+            python_sessions.start()
+        yield
+        responses_store.close()
+        tool_executor.close()
+        if sandbox_pool is not None:
+            sandbox_pool.close()
+        if python_sessions is not None:
+            python_sessions.close()
+        # backends that stream from elsewhere own a client and an event loop
+        close_backend = getattr(backend, "close", None)
+        if close_backend is not None:
+            close_backend()
+
+    app = FastAPI(lifespan=lifespan)
+    app.state.responses_store = responses_store
+    app.state.admission = admission
+    app.state.tool_executor = tool_executor
+    # python tools fall back to the process-wide default pool
+    app.state.sandbox_pool = sandbox_pool
+    # when set, the python tool keeps its state across a conversation
+    app.state.python_sessions = python_sessions
+    # all requests share one engine that owns the model and batches sessions
+    model = backend if isinstance(backend, BatchedModel) else SessionModel(backend)
+    engine = InferenceEngine(
+        model, stop_tokens=encoding.stop_tokens_for_assistant_actions()
+    )
+    app.state.engine = engine
+
+    # system and developer messages, shared by requests with the same settings
+    preamble_renderer = PreambleRenderer(encoding)
+    app.state.preamble_renderer = preamble_renderer
+
+    # scraped from /metrics; histograms are updated from the event loop only
+    metrics = MetricsRegistry()
+    for histogram in engine.metrics:
+        metrics.register(histogram)
+    metrics.register(tool_executor.latency)
+    metrics.register(
+        Gauge(
+            "gpt_oss_active_sessions",
+            "Sessions currently held by the engine.",
+            lambda: engine.num_sessions,
+        )
+    )
+    metrics.register(
+        Gauge(
+            "gpt_oss_kv_cache_usage_ratio",
+            "Fraction of the KV cache in use.",
+            engine.kv_cache_usage,
+        )
+    )
+    metrics.register(
+        Gauge(
+            "gpt_oss_prefix_cache_hit_ratio",
+            "Fraction of prompt tokens served from the prefix cache.",
+            lambda: engine.stats.prefix_cache_hit_ratio,
+        )
+    )
+    metrics.register(
+        Counter(
+            "gpt_oss_engine_steps_total",
+            "Batches run through the model.",
+            lambda: engine.stats.steps,
+        )
+    )
+    metrics.register(
+        Counter(
+            "gpt_oss_cancelled_sessions_total",
+            "Sessions cancelled because the client disconnected.",
+            lambda: engine.stats.cancelled_sessions,
+        )
+    )
+    metrics.register(
+        Counter(
+            "gpt_oss_prompt_tokens_total",
+            "Prompt tokens scheduled for prefill.",
+            lambda: engine.stats.prompt_tokens,
+        )
+    )
+    metrics.register(
+        Counter(
+            "gpt_oss_generated_tokens_total",
+            "Tokens sampled by the model.",
+            lambda: engine.stats.generated_tokens,
+        )
+    )
+    metrics.register(admission.queue_wait)
+    metrics.register(
+        Gauge(
+            "gpt_oss_admission_queue_depth",
+            "Requests waiting for capacity.",
+            lambda: admission.queue_depth,
+        )
+    )
+    metrics.register(
+        Gauge(
+            "gpt_oss_admission_reserved_tokens",
+            "KV tokens reserved by admitted requests.",
+            lambda: admission.reserved_tokens,
+        )
+    )
+    metrics.register(
+        Counter(
+            "gpt_oss_admission_rejected_total",
+            "Requests rejected with 429 because the server was at capacity.",
+            lambda: admission.stats.rejected,
+        )
+    )
+    if sandbox_pool is not None:
+        sandbox_stats = sandbox_pool.stats
+        metrics.register(
+            Gauge(
+                "gpt_oss_python_sandbox_idle",
+                "Started python sandboxes waiting for a script.",
+                lambda: sandbox_pool.idle,
+            )
+        )
+        for start in ("warm", "cold"):
+            metrics.register(
+                Counter(
+                    f"gpt_oss_python_sandbox_{start}_runs_total",
+                    f"Python tool calls that ran in a {start} sandbox.",
+                    lambda start=start: getattr(sandbox_stats, f"{start}_runs"),
+                )
+            )
+            metrics.register(
+                Counter(
+                    f"gpt_oss_python_sandbox_{start}_seconds_total",
+                    f"Time spent in python tool calls that ran in a {start} "
+                    "sandbox, including starting it.",
+                    lambda start=start: getattr(sandbox_stats, f"{start}_seconds"),
+                )
+            )
+        metrics.register(
+            Counter(
+                "gpt_oss_python_sandbox_recycled_total",
+                "Python sandboxes replaced after reaching their maximum uses.",
+                lambda: sandbox_stats.recycled,
+            )
+        )
+        metrics.register(
+            Counter(
+                "gpt_oss_python_sandbox_discarded_total",
+                "Python sandboxes replaced after a timeout or an error.",
+                lambda: sandbox_stats.discarded,
+            )
+        )
+    if python_sessions is not None:
+        session_stats = python_sessions.stats
+        metrics.register(
+            Gauge(
+                "gpt_oss_python_sessions",
+                "Stateful python sessions alive.",
+                lambda: len(python_sessions),
+            )
+        )
+        metrics.register(
+            Gauge(
+                "gpt_oss_python_session_hit_ratio",
+                "Fraction of python tool calls that continued an existing session.",
+                lambda: session_stats.hit_ratio,
+            )
+        )
+        metrics.register(
+            Counter(
+                "gpt_oss_python_sessions_evicted_total",
+                "Python sessions closed because they were idle or the session "
+                "limit was reached.",
+                lambda: session_stats.evicted_idle + session_stats.evicted_lru,
+            )
+        )
+    metrics.register(
+        Gauge(
+            "gpt_oss_responses_store_hit_ratio",
+            "Fraction of previous_response_id lookups found in the store.",
+            lambda: responses_store.stats.hit_ratio,
+        )
+    )
+    metrics.register(
+        Gauge(
+            "gpt_oss_preamble_cache_hit_ratio",
+            "Fraction of preambles served from the render cache.",
+            lambda: preamble_renderer.stats.hit_ratio,
+        )
+    )
+    app.state.metrics = metrics
+
+    # `<|start|>assistant`, appended to the prompt to ask for a completion
+    completion_header = encoding.render_conversation_for_completion(
+        Conversation.from_messages([]), Role.ASSISTANT
+    )
+    start_token, message_token, end_token, return_token, call_token = (
+        encoding.encode(t, allowed_special="all")[0]
+        for t in ("<|start|>", "<|message|>", "<|end|>", "<|return|>", "<|call|>")
+    )
+
+    def drop_analysis_messages(tokens: list[int]) -> list[int]:
+        """Remove assistant analysis messages from a run of rendered messages."""
+        starts = [i for i, t in enumerate(tokens) if t == start_token]
+        kept = []
+        for start, end in zip(starts, starts[1:] + [len(tokens)]):
+            message = tokens[start:end]
+            try:
+                header = encoding.decode(message[1 : message.index(message_token)])
+            except ValueError:
+                header = ""
+            if header.startswith("assistant") and "<|channel|>analysis" in header:
+                continue
+            kept.extend(message)
+        return kept
+
+    def followup_conversation(
+        tokens: list[int], turn_start: int
+    ) -> tuple[Optional[list[int]], int]:
+        """
+        Returns the rendered conversation a follow-up request can extend, given
+        the tokens of a finished generation, or None if it did not end on a
+        message boundary. As in `render_conversation_for_completion`, analysis
+        messages are dropped once a turn ends in a final answer; during a tool
+        call they are kept, so the follow-up extends the exact sequence the
+        backend already has cached.
+        """
+        if tokens and tokens[-1] == call_token:
+            return tokens, turn_start
+        if tokens and tokens[-1] == return_token:
+            history = tokens[:turn_start] + drop_analysis_messages(
+                tokens[turn_start:-1] + [end_token]
+            )
+            return history, len(history)
+        return None, 0
+
+    def ensure_item_list(inp) -> list:
+        if isinstance(inp, str):
+            return [
+                Item(
+                    type="message",
+                    role="user",
+                    content=[TextContentItem(type="input_text", text=inp)],
+                )
+            ]
+        return list(inp)
 
     def generate_response(
         input_tokens: list[int],
@@ -99,6 +391,7 @@ def create_api_server(
         browser_call_ids: Optional[list[str]] = None,
         python_tool: Optional[PythonTool] = None,
         python_call_ids: Optional[list[str]] = None,
+        cached_tokens: int = 0,
     ) -> ResponseObject:
         output = []
         error = None
@@ -275,6 +568,7 @@ def create_api_server(
                 input_tokens=len(input_tokens),
                 output_tokens=len(output_tokens),
                 total_tokens=len(input_tokens) + len(output_tokens),
+                input_tokens_details=InputTokensDetails(cached_tokens=cached_tokens),
             )
             if len(output_tokens) > 0
             else None
@@ -332,11 +626,12 @@ def create_api_server(
             as_sse: bool = False,
             request: Optional[Request] = None,
             response_id: Optional[str] = None,
-            store_callback: Optional[
-                Callable[[str, ResponsesRequest, ResponseObject], None]
-            ] = None,
+            store_callback: Optional[Callable[..., None]] = None,
             browser_tool: Optional[SimpleBrowserTool] = None,
             python_tool: Optional[PythonTool] = None,
+            turn_start: Optional[int] = None,
+            admission_ticket: Optional[AdmissionTicket] = None,
+            session: Optional[EngineSession] = None,
         ):
             self.initial_tokens = initial_tokens
             self.tokens = initial_tokens.copy()
@@ -359,25 +654,128 @@ def create_api_server(
             self.function_call_ids: list[tuple[str, str]] = []
             self.response_id = response_id
             self.store_callback = store_callback
-            self.new_request = True
+            # offset in `tokens` of the current turn's first assistant message;
+            # None if unknown, in which case the conversation tokens are not
+            # stored for follow-ups
+            self.turn_start = turn_start
+            self.admission_ticket = admission_ticket
+            # opened by run() unless the caller already opened it
+            self.session: Optional[EngineSession] = session
+            # sessions of other samples of the same request, cancelled together
+            self.sibling_sessions: list[EngineSession] = []
+            self.disconnected = False
             self.browser_tool = browser_tool
             self.use_browser_tool = browser_tool is not None
             self.browser_call_ids: list[str] = []
             self.python_tool = python_tool
             self.use_code_interpreter = python_tool is not None
             self.python_call_ids: list[str] = []
+            stream_options = request_body.stream_options
+            coalesce_tokens, coalesce_s = 1, None
+            if stream_options is not None and (
+                stream_options.coalesce_tokens or stream_options.coalesce_ms
+            ):
+                coalesce_tokens = stream_options.coalesce_tokens
+                if stream_options.coalesce_ms:
+                    coalesce_s = stream_options.coalesce_ms / 1000
+            self.delta_emitter = DeltaEmitter(
+                self._next_sequence_number,
+                max_tokens=coalesce_tokens,
+                max_delay_s=coalesce_s,
+            )
+            # next_token() still awaited after a coalesced delta fell due first
+            self.pending_token: Optional[asyncio.Future] = None
 
-        def _send_event(self, event: ResponseEvent):
-            event.sequence_number = self.sequence_number
+        def _next_sequence_number(self) -> int:
+            sequence_number = self.sequence_number
             self.sequence_number += 1
+            return sequence_number
+
+        def _send_event(self, event: ResponseEvent):
             if self.as_sse:
-                return f"event: {event.type}\ndata: {event.model_dump_json(indent=None)}\n\n"
-            else:
-                return event
+                # buffered deltas go out first to keep the stream in order
+                frames = self.delta_emitter.flush()
+                event.sequence_number = self._next_sequence_number()
+                return frames + format_sse(event)
+            event.sequence_number = self._next_sequence_number()
+            return event
+
+        def _send_delta(
+            self, event_type: str, output_index: int, content_index: int, delta: str
+        ):
+            """Returns the frames to send for a text delta ("" while coalescing)."""
+            if self.as_sse:
+                return self.delta_emitter.add(
+                    event_type, output_index, content_index, delta
+                )
+            event_cls = (
+                ResponseOutputTextDelta
+                if event_type == "response.output_text.delta"
+                else ResponseReasoningTextDelta
+            )
+            return self._send_event(
+                event_cls(
+                    type=event_type,
+                    output_index=output_index,
+                    content_index=content_index,
+                    delta=delta,
+                )
+            )
 
         async def run(self):
+            if self.session is None:
+                self.session = engine.open_session(
+                    self.initial_tokens,
+                    temperature=self.temperature,
+                    max_tokens=self.request_body.max_output_tokens,
+                )
+            # listen for the client going away once instead of polling per token
+            watcher = None
+            if self.request is not None:
+                watcher = asyncio.create_task(self._watch_disconnect())
+            try:
+                async for event in self._run():
+                    yield event
+            finally:
+                if watcher is not None:
+                    watcher.cancel()
+                if self.pending_token is not None:
+                    self.pending_token.cancel()
+                self.session.close()
+                if self.admission_ticket is not None:
+                    self.admission_ticket.release()
+
+        async def _next_token(self) -> Optional[int]:
+            """
+            Returns the next token, or None if buffered deltas fell due
+            (``coalesce_ms`` passed) before it arrived.
+            """
+            if self.pending_token is None:
+                deadline = self.delta_emitter.deadline() if self.as_sse else None
+                if deadline is None:
+                    return await self.session.next_token()
+                self.pending_token = asyncio.ensure_future(self.session.next_token())
+            deadline = self.delta_emitter.deadline()
+            if deadline is not None:
+                timeout = max(0.0, deadline - time.monotonic())
+                done, _ = await asyncio.wait({self.pending_token}, timeout=timeout)
+                if not done:
+                    return None
+            pending_token, self.pending_token = self.pending_token, None
+            return await pending_token
+
+        async def _watch_disconnect(self):
+            while (await self.request.receive())["type"] != "http.disconnect":
+                pass
+            print("Client disconnected, stopping token generation.")
+            self.disconnected = True
+            # frees the batch slot and KV state without waiting for the next token
+            self.session.cancel()
+            for session in self.sibling_sessions:
+                session.cancel()
+
+        async def _run(self):
             browser_tool = self.browser_tool
-            self.new_request = True
             initial_response = generate_response(
                 self.initial_tokens,
                 self.output_tokens,
@@ -410,23 +808,19 @@ def create_api_server(
             current_output_index = -1
             sent_output_item_added = False
 
-            # we use this if the model outputs a citation to buffer until completed
-            output_delta_buffer = ""
-            # we use this to track the current output text content for things like providing the right indices in citations
-            current_output_text_content = ""
+            # rewrites citations in the streamed final text, holding back any
+            # unfinished citation until it is complete
+            citation_normalizer = None
             current_annotations = []
 
             while True:
-                # Check for client disconnect
-                if self.request is not None and await self.request.is_disconnected():
-                    print("Client disconnected, stopping token generation.")
+                try:
+                    next_tok = await self._next_token()
+                except SessionCancelled:
                     break
-                next_tok = infer_next_token(
-                    self.tokens,
-                    temperature=self.temperature,
-                    new_request=self.new_request,
-                )
-                self.new_request = False
+                if next_tok is None:
+                    yield self.delta_emitter.flush()
+                    continue
                 self.tokens.append(next_tok)
                 try:
                     self.parser.process(next_tok)
@@ -525,6 +919,19 @@ def create_api_server(
                                 text=normalized_text,
                                 annotations=annotations,
                             )
+                            # text held back as a possible citation start is
+                            # streamed verbatim once the message is over
+                            if citation_normalizer is not None:
+                                tail = citation_normalizer.flush()
+                                if tail:
+                                    frames = self._send_delta(
+                                        "response.output_text.delta",
+                                        current_output_index,
+                                        current_content_index,
+                                        tail,
+                                    )
+                                    if frames:
+                                        yield frames
                             yield self._send_event(
                                 ResponseOutputTextDone(
                                     type="response.output_text.done",
@@ -553,7 +960,7 @@ def create_api_server(
                                 )
                             )
                             current_annotations = []
-                            current_output_text_content = ""
+                            citation_normalizer = None
 
                 if (
                     self.parser.last_content_delta
@@ -578,30 +985,13 @@ def create_api_server(
                             )
                         )
 
-                    output_delta_buffer += self.parser.last_content_delta
-                    should_send_output_text_delta = True
+                    output_delta = self.parser.last_content_delta
                     if browser_tool:
-                        # we normalize on the full current text to get the right indices in citations
-                        updated_output_text, annotations, has_partial_citations = (
-                            browser_tool.normalize_citations(
-                                current_output_text_content + output_delta_buffer
-                            )
+                        if citation_normalizer is None:
+                            citation_normalizer = browser_tool.citation_normalizer()
+                        output_delta, new_annotations = citation_normalizer.feed(
+                            output_delta
                         )
-                        # remove the current text to get back the delta but now normalized
-                        output_delta_buffer = updated_output_text[
-                            len(current_output_text_content) :
-                        ]
-
-                        # Filter annotations to only include those whose start_index is not already present in current_annotations
-                        # this is to avoid sending duplicate annotations as multiple annotations can't be in the same place
-                        existing_start_indices = {
-                            a["start_index"] for a in current_annotations
-                        }
-                        new_annotations = [
-                            a
-                            for a in annotations
-                            if a["start_index"] not in existing_start_indices
-                        ]
                         for a in new_annotations:
                             current_annotations.append(a)
                             citation = UrlCitation(**a)
@@ -610,25 +1000,20 @@ def create_api_server(
                                     type="response.output_text.annotation.added",
                                     output_index=current_output_index,
                                     content_index=current_content_index,
-                                    annotation_index=len(current_annotations),
+                                    annotation_index=len(current_annotations) - 1,
                                     annotation=citation,
                                 )
                             )
 
-                        if has_partial_citations:
-                            should_send_output_text_delta = False
-
-                    if should_send_output_text_delta:
-                        yield self._send_event(
-                            ResponseOutputTextDelta(
-                                type="response.output_text.delta",
-                                output_index=current_output_index,
-                                content_index=current_content_index,
-                                delta=output_delta_buffer,
-                            )
+                    if output_delta:
+                        frames = self._send_delta(
+                            "response.output_text.delta",
+                            current_output_index,
+                            current_content_index,
+                            output_delta,
                         )
-                        current_output_text_content += output_delta_buffer
-                        output_delta_buffer = ""
+                        if frames:
+                            yield frames
 
                 if (
                     self.parser.last_content_delta
@@ -656,14 +1041,14 @@ def create_api_server(
                                 ),
                             )
                         )
-                    yield self._send_event(
-                        ResponseReasoningTextDelta(
-                            type="response.reasoning_text.delta",
-                            output_index=current_output_index,
-                            content_index=current_content_index,
-                            delta=self.parser.last_content_delta,
-                        )
+                    frames = self._send_delta(
+                        "response.reasoning_text.delta",
+                        current_output_index,
+                        current_content_index,
+                        self.parser.last_content_delta,
                     )
+                    if frames:
+                        yield frames
 
                 try:
                     # purely for debugging purposes
@@ -732,12 +1117,6 @@ def create_api_server(
                                     )
                                 )
 
-                            async def run_tool():
-                                results = []
-                                async for msg in browser_tool.process(last_message):
-                                    results.append(msg)
-                                return results
-
                             yield self._send_event(
                                 ResponseWebSearchCallSearching(
                                     type="response.web_search_call.searching",
@@ -745,7 +1124,10 @@ def create_api_server(
                                     id=web_search_call_id,
                                 )
                             )
-                            result = await run_tool()
+                            # the session is parked on <|call|> meanwhile
+                            result = await tool_executor.run(
+                                "browser", browser_tool, last_message
+                            )
 
                             new_tokens = encoding.render_conversation_for_completion(
                                 Conversation.from_messages(result), Role.ASSISTANT
@@ -753,14 +1135,13 @@ def create_api_server(
 
                             print(encoding.decode_utf8(new_tokens))
                             self.output_tokens.append(next_tok)
-                            self.tokens.append(
-                                encoding.encode("<|end|>", allowed_special="all")[0]
-                            )
+                            self.tokens.append(end_token)
 
                             for token in new_tokens:
                                 self.parser.process(token)
                                 self.output_tokens.append(token)
                                 self.tokens.append(token)
+                            self.session.append([end_token, *new_tokens])
 
                             yield self._send_event(
                                 ResponseWebSearchCallCompleted(
@@ -782,7 +1163,6 @@ def create_api_server(
                             )
 
                             current_output_index += 1
-                            self.new_request = True
 
                             continue
 
@@ -811,13 +1191,9 @@ def create_api_server(
                                 )
                             )
 
-                            async def run_python_tool():
-                                results = []
-                                async for msg in self.python_tool.process(last_message):
-                                    results.append(msg)
-                                return results
-
-                            result = await run_python_tool()
+                            result = await tool_executor.run(
+                                "python", self.python_tool, last_message
+                            )
 
                             print(result)
 
@@ -827,14 +1203,13 @@ def create_api_server(
 
                             print(encoding.decode_utf8(new_tokens))
                             self.output_tokens.append(next_tok)
-                            self.tokens.append(
-                                encoding.encode("<|end|>", allowed_special="all")[0]
-                            )
+                            self.tokens.append(end_token)
 
                             for token in new_tokens:
                                 self.parser.process(token)
                                 self.output_tokens.append(token)
                                 self.tokens.append(token)
+                            self.session.append([end_token, *new_tokens])
 
                             yield self._send_event(
                                 ResponseCodeInterpreterCallCompleted(
@@ -855,7 +1230,6 @@ def create_api_server(
                             )
 
                             current_output_index += 1
-                            self.new_request = True
 
                             continue
 
@@ -869,7 +1243,7 @@ def create_api_server(
                 # Adding in the end if we know we are not done
                 self.output_tokens.append(next_tok)
 
-            if self.request is None or not await self.request.is_disconnected():
+            if not self.disconnected:
                 response = generate_response(
                     self.initial_tokens,
                     self.output_tokens,
@@ -880,9 +1254,21 @@ def create_api_server(
                     previous_response_id=self.request_body.previous_response_id,
                     browser_tool=self.browser_tool,
                     browser_call_ids=self.browser_call_ids,
+                    cached_tokens=self.session.cached_tokens,
                 )
                 if self.store_callback and self.request_body.store:
-                    self.store_callback(self.response_id, self.request_body, response)
+                    tokens, turn_start = None, 0
+                    if self.turn_start is not None:
+                        tokens, turn_start = followup_conversation(
+                            self.tokens, self.turn_start
+                        )
+                    self.store_callback(
+                        self.response_id,
+                        self.request_body,
+                        response,
+                        tokens=tokens,
+                        turn_start=turn_start,
+                    )
                 yield self._send_event(
                     ResponseCompletedEvent(
                         type="response.completed",
@@ -890,6 +1276,178 @@ def create_api_server(
                     )
                 )
 
+    def input_items_to_messages(
+        items: list, function_call_map: Optional[dict] = None
+    ) -> list[Message]:
+        messages = []
+        is_last_message_function_call_output = (
+            len(items) > 0 and items[-1].type == "function_call_output"
+        )
+        function_call_map = dict(function_call_map or {})
+        # Find the index of the last assistant message
+        last_assistant_idx = -1
+        for idx, item in enumerate(items):
+            if item.type == "message" and item.role == Role.ASSISTANT:
+                last_assistant_idx = idx
+
+        for idx, item in enumerate(items):
+            if item.type == "message":
+                # TODO: add system prompt handling
+                if isinstance(item.content, str):
+                    messages.append(
+                        Message.from_role_and_content(item.role, item.content)
+                    )
+                else:
+                    for content_item in item.content:
+                        messages.append(
+                            Message.from_role_and_content(item.role, content_item.text)
+                        )
+                # add final channel to the last assistant message if it's from the assistant
+                if item.role == Role.ASSISTANT:
+                    messages[-1] = messages[-1].with_channel("final")
+            elif item.type == "reasoning":
+                # Only include reasoning if it is after the last assistant message and we are handling a function call at the moment
+                if idx > last_assistant_idx and is_last_message_function_call_output:
+                    for content_item in item.content:
+                        messages.append(
+                            Message.from_role_and_content(
+                                Role.ASSISTANT, content_item.text
+                            ).with_channel("analysis")
+                        )
+            elif item.type == "function_call":
+                function_call_map[item.call_id] = item
+                messages.append(
+                    Message.from_role_and_content(Role.ASSISTANT, item.arguments)
+                    .with_recipient(f"functions.{item.name}")
+                    .with_channel("commentary")
+                )
+            elif item.type == "function_call_output":
+                function_call = function_call_map.get(item.call_id, None)
+                if not function_call:
+                    raise ValueError(f"Function call {item.call_id} not found")
+
+                messages.append(
+                    Message.from_author_and_content(
+                        Author.new(Role.TOOL, f"functions.{function_call.name}"),
+                        item.output,
+                    )
+                    .with_recipient("assistant")
+                    .with_channel("commentary")
+                )
+        return messages
+
+    def continue_conversation(
+        prev: StoredResponse, body: ResponsesRequest, new_input
+    ) -> tuple[Optional[list[int]], Optional[int]]:
+        """
+        Renders only the new input of a `previous_response_id` request and
+        appends it to the stored conversation tokens. Returns (None, None) when
+        the conversation has to be rendered in full.
+        """
+        if prev.tokens is None or (
+            body.instructions != prev.request.instructions
+            or body.tools != prev.request.tools
+            or body.reasoning != prev.request.reasoning
+        ):
+            return None, None
+        items = ensure_item_list(new_input)
+        if not items or any(
+            item.type not in ("message", "function_call", "function_call_output")
+            for item in items
+        ):
+            return None, None
+
+        function_call_map = {
+            item.call_id: item
+            for item in prev.response.output
+            if item.type == "function_call"
+        }
+        tokens = prev.tokens.tolist()
+        turn_start = prev.turn_start
+        for message in input_items_to_messages(items, function_call_map):
+            tokens.extend(encoding.render(message))
+            if message.author.role == Role.USER:
+                turn_start = len(tokens)
+        tokens.extend(completion_header)
+        return tokens, turn_start
+
+    async def generate_samples(
+        n: int,
+        first: StreamResponsesEvents,
+        create_tools: Callable[[str, int], tuple],
+        store_callback: Callable[..., None],
+        admission_ticket: AdmissionTicket,
+    ):
+        """Runs ``n`` samples of one request on sessions sharing a prefill."""
+        body = first.request_body
+        sessions = engine.open_sessions(
+            first.initial_tokens,
+            n,
+            temperature=first.temperature,
+            max_tokens=body.max_output_tokens,
+        )
+        first.session = sessions[0]
+        first.sibling_sessions = sessions[1:]
+        # held until every sample is done, not just the first
+        first.admission_ticket = None
+        streams = [first]
+        for sample_index, session in enumerate(sessions[1:], start=1):
+            response_id = f"resp_{uuid.uuid4().hex}"
+            browser_tool, python_tool = create_tools(response_id, sample_index)
+            streams.append(
+                StreamResponsesEvents(
+                    first.initial_tokens,
+                    body,
+                    response_id=response_id,
+                    store_callback=store_callback,
+                    browser_tool=browser_tool,
+                    python_tool=python_tool,
+                    turn_start=first.turn_start,
+                    session=session,
+                )
+            )
+
+        async def last_response(stream: StreamResponsesEvents) -> ResponseObject:
+            last_event = None
+            async for event in stream.run():
+                last_event = event
+            return last_event.response
+
+        try:
+            responses = await asyncio.gather(*[last_response(s) for s in streams])
+        finally:
+            admission_ticket.release()
+        if first.disconnected:
+            return Response(status_code=499)
+        samples = [response.model_copy() for response in responses]
+        response = responses[0]
+        response.samples = samples
+        return response
+
+    @app.get("/metrics")
+    async def get_metrics():
+        return PlainTextResponse(
+            metrics.render(), media_type="text/plain; version=0.0.4"
+        )
+
+    if profile_dir is not None:
+        profiler = EngineProfiler(engine, profile_dir)
+        app.state.profiler = profiler
+
+        @app.post("/admin/profile")
+        async def profile(body: ProfileRequest):
+            try:
+                result = await profiler.capture(steps=body.steps, seconds=body.seconds)
+            except ValueError as e:
+                raise HTTPException(status_code=400, detail=str(e))
+            except ProfileInProgress:
+                raise HTTPException(
+                    status_code=409, detail="a profile is already being captured"
+                )
+            except ImportError:
+                raise HTTPException(status_code=501, detail="profiling requires torch")
+            return asdict(result)
+
     @app.post("/v1/responses", response_model=ResponseObject)
     async def generate(body: ResponsesRequest, request: Request):
         print("request received")
@@ -903,173 +1461,132 @@ def create_api_server(
             for tool in (body.tools or [])
         )
 
-        if use_browser_tool:
-            backend = ExaBackend(
-                source="web",
+        n = body.n if body.n is not None else 1
+        if n < 1:
+            raise HTTPException(status_code=422, detail="n must be at least 1")
+        if n > 1 and body.stream:
+            raise HTTPException(
+                status_code=400, detail="n > 1 is not supported with stream"
             )
-            browser_tool = SimpleBrowserTool(backend=backend)
-        else:
-            browser_tool = None
 
-        if use_code_interpreter:
-            python_tool = PythonTool()
-        else:
-            python_tool = None
+        def create_tools(response_id: str, sample_index: int = 0):
+            # tools keep per-conversation state, so every sample gets its own
+            if use_browser_tool:
+                backend = ExaBackend(
+                    source="web",
+                )
+                browser_tool = SimpleBrowserTool(backend=backend)
+            else:
+                browser_tool = None
+
+            if use_code_interpreter:
+                python_tool = PythonTool(
+                    sandbox_pool=sandbox_pool,
+                    sessions=python_sessions,
+                    session_id=response_id,
+                )
+                if (
+                    python_sessions is not None
+                    and body.previous_response_id
+                    and sample_index == 0
+                ):
+                    # continue the python session of the conversation; a live
+                    # kernel cannot be copied, so the other samples start new
+                    # sessions of their own rather than share its state
+                    python_sessions.alias(response_id, body.previous_response_id)
+            else:
+                python_tool = None
+            return browser_tool, python_tool
 
+        response_id = f"resp_{uuid.uuid4().hex}"
+        browser_tool, python_tool = create_tools(response_id)
+
+        new_input = body.input
+        prev = None
         if body.previous_response_id:
             prev = responses_store.get(body.previous_response_id)
             if prev:
-                prev_req, prev_resp = prev
-
-                def _ensure_list(inp):
-                    if isinstance(inp, str):
-                        return [
-                            Item(
-                                type="message",
-                                role="user",
-                                content=[TextContentItem(type="input_text", text=inp)],
-                            )
-                        ]
-                    return list(inp)
-
-                merged_input = _ensure_list(prev_req.input) + list(prev_resp.output)
-                merged_input.extend(_ensure_list(body.input))
+                merged_input = ensure_item_list(prev.request.input) + list(
+                    prev.response.output
+                )
+                merged_input.extend(ensure_item_list(body.input))
 
                 if body.instructions is None:
-                    body.instructions = prev_req.instructions
+                    body.instructions = prev.request.instructions
                 body.input = merged_input
 
-        system_message_content = SystemContent.new().with_conversation_start_date(
-            datetime.datetime.now().strftime("%Y-%m-%d")
-        )
-
+        reasoning_effort = None
         if body.reasoning is not None:
             try:
 
                 reasoning_effort = get_reasoning_effort(body.reasoning.effort)
             except ValueError as e:
-                from fastapi import HTTPException
-
                 raise HTTPException(status_code=422, detail=str(e))
-            system_message_content = system_message_content.with_reasoning_effort(
-                reasoning_effort
-            )
 
+        tool_configs = []
         if use_browser_tool:
-            system_message_content = system_message_content.with_tools(
-                browser_tool.tool_config
-            )
+            tool_configs.append(browser_tool.tool_config)
         if use_code_interpreter:
-            system_message_content = system_message_content.with_tools(
-                python_tool.tool_config
-            )
-
-        system_message = Message.from_role_and_content(
-            Role.SYSTEM, system_message_content
-        )
-        messages = [system_message]
-
-        if body.instructions or body.tools:
-            developer_message_content = DeveloperContent.new().with_instructions(
-                body.instructions
+            tool_configs.append(python_tool.tool_config)
+
+        initial_tokens, turn_start = None, None
+        if prev is not None:
+            initial_tokens, turn_start = continue_conversation(prev, body, new_input)
+
+        if initial_tokens is None:
+            preamble = preamble_renderer.render(
+                datetime.datetime.now().strftime("%Y-%m-%d"),
+                reasoning_effort,
+                tool_configs,
+                body.instructions,
+                body.tools or [],
             )
 
-            tools = []
-            for tool in body.tools:
-                if tool.type == "function":
-                    tools.append(
-                        ToolDescription.new(
-                            tool.name,
-                            tool.description,
-                            tool.parameters,
-                        )
-                    )
+            if isinstance(body.input, str):
+                messages = [Message.from_role_and_content(Role.USER, body.input)]
+            else:
+                messages = input_items_to_messages(body.input)
+
+            conversation = Conversation.from_messages(messages)
+            initial_tokens = [
+                *preamble,
+                *encoding.render_conversation_for_completion(
+                    conversation, Role.ASSISTANT
+                ),
+            ]
+            input_items = ensure_item_list(body.input)
+            if (
+                input_items
+                and input_items[-1].type == "message"
+                and input_items[-1].role == Role.USER
+            ):
+                turn_start = len(initial_tokens) - len(completion_header)
+            # otherwise the start of the current turn is unknown without
+            # rendering message by message, and follow-ups render in full
+        print(encoding.decode_utf8(initial_tokens))
 
-            if tools:
-                developer_message_content = (
-                    developer_message_content.with_function_tools(tools)
+        try:
+            admission_ticket = await admission.acquire(
+                admission.estimate_tokens(
+                    len(initial_tokens),
+                    body.max_output_tokens * n if body.max_output_tokens else None,
                 )
-
-            developer_message = Message.from_role_and_content(
-                Role.DEVELOPER, developer_message_content
             )
-
-            messages.append(developer_message)
-
-        if isinstance(body.input, str):
-            user_message = Message.from_role_and_content(Role.USER, body.input)
-            messages.append(user_message)
-        else:
-            is_last_message_function_call_output = (
-                len(body.input) > 0 and body.input[-1].type == "function_call_output"
+        except AdmissionRejected as e:
+            raise HTTPException(
+                status_code=429,
+                detail=e.reason,
+                headers={"Retry-After": str(e.retry_after)},
             )
-            function_call_map = {}
-            # Find the index of the last assistant message
-            last_assistant_idx = -1
-            for idx, item in enumerate(body.input):
-                if item.type == "message" and item.role == Role.ASSISTANT:
-                    last_assistant_idx = idx
-
-            for idx, item in enumerate(body.input):
-                if item.type == "message":
-                    # TODO: add system prompt handling
-                    if isinstance(item.content, str):
-                        messages.append(
-                            Message.from_role_and_content(item.role, item.content)
-                        )
-                    else:
-                        for content_item in item.content:
-                            messages.append(
-                                Message.from_role_and_content(
-                                    item.role, content_item.text
-                                )
-                            )
-                    # add final channel to the last assistant message if it's from the assistant
-                    if item.role == Role.ASSISTANT:
-                        messages[-1] = messages[-1].with_channel("final")
-                elif item.type == "reasoning":
-                    # Only include reasoning if it is after the last assistant message and we are handling a function call at the moment
-                    if (
-                        idx > last_assistant_idx
-                        and is_last_message_function_call_output
-                    ):
-                        for content_item in item.content:
-                            messages.append(
-                                Message.from_role_and_content(
-                                    Role.ASSISTANT, content_item.text
-                                ).with_channel("analysis")
-                            )
-                elif item.type == "function_call":
-                    function_call_map[item.call_id] = item
-                    messages.append(
-                        Message.from_role_and_content(Role.ASSISTANT, item.arguments)
-                        .with_recipient(f"functions.{item.name}")
-                        .with_channel("commentary")
-                    )
-                elif item.type == "function_call_output":
-                    function_call = function_call_map.get(item.call_id, None)
-                    if not function_call:
-                        raise ValueError(f"Function call {item.call_id} not found")
-
-                    messages.append(
-                        Message.from_author_and_content(
-                            Author.new(Role.TOOL, f"functions.{function_call.name}"),
-                            item.output,
-                        )
-                        .with_recipient("assistant")
-                        .with_channel("commentary")
-                    )
-
-        conversation = Conversation.from_messages(messages)
-
-        initial_tokens = encoding.render_conversation_for_completion(
-            conversation, Role.ASSISTANT
-        )
-        print(encoding.decode_utf8(initial_tokens))
-        response_id = f"resp_{uuid.uuid4().hex}"
 
-        def store_callback(rid: str, req: ResponsesRequest, resp: ResponseObject):
-            responses_store[rid] = (req, resp)
+        def store_callback(
+            rid: str,
+            req: ResponsesRequest,
+            resp: ResponseObject,
+            tokens: Optional[list[int]] = None,
+            turn_start: int = 0,
+        ):
+            responses_store.put(rid, req, resp, tokens=tokens, turn_start=turn_start)
 
         event_stream = StreamResponsesEvents(
             initial_tokens,
@@ -1080,15 +1597,30 @@ def create_api_server(
             store_callback=store_callback,
             browser_tool=browser_tool,
             python_tool=python_tool,
+            turn_start=turn_start,
+            admission_ticket=admission_ticket,
         )
 
+        if n > 1:
+            return await generate_samples(
+                n, event_stream, create_tools, store_callback, admission_ticket
+            )
+
         if body.stream:
-            return StreamingResponse(event_stream.run(), media_type="text/event-stream")
+            return StreamingResponse(
+                event_stream.run(),
+                media_type="text/event-stream",
+                # in case the stream is never started
+                background=BackgroundTask(admission_ticket.release),
+            )
         else:
             last_event = None
             async for event in event_stream.run():
                 last_event = event
 
+            if event_stream.disconnected:
+                # nobody is listening anymore; nginx's "client closed request"
+                return Response(status_code=499)
             return last_event.response
 
     return app
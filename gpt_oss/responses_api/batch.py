@@ -0,0 +1,206 @@
+"""
+Offline batch inference over a JSONL file of Responses API requests:
+
+    python -m gpt_oss.responses_api.batch requests.jsonl results.jsonl
+
+Each input line is either a ``ResponsesRequest`` or an OpenAI batch entry
+(``{"custom_id": ..., "body": {...}}``). Requests run in-process through the
+same app as ``serve.py``, so rendering, parsing and tools behave exactly as
+over HTTP. Many requests are in flight at once so the engine can batch them,
+and they are started in an order that puts requests with a common prompt
+prefix next to each other, so they reuse the prefix cache.
+
+Results are appended to the output file as they complete. Running again with
+the same output file skips the requests that already succeeded.
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import uuid
+from dataclasses import dataclass
+from typing import Any, Optional
+
+import httpx
+from fastapi import FastAPI
+from openai_harmony import HarmonyEncodingName, load_harmony_encoding
+
+from .api_server import create_api_server
+from .inference import BACKENDS, load_backend
+
+
+@dataclass
+class BatchRequest:
+    custom_id: str
+    body: dict[str, Any]
+
+
+@dataclass
+class BatchSummary:
+    succeeded: int = 0
+    failed: int = 0
+    # completed by a previous run
+    skipped: int = 0
+
+
+def read_requests(path: str) -> list[BatchRequest]:
+    requests = []
+    with open(path) as f:
+        for line_number, line in enumerate(f, 1):
+            if not line.strip():
+                continue
+            entry = json.loads(line)
+            if "body" in entry:
+                requests.append(BatchRequest(entry["custom_id"], entry["body"]))
+            else:
+                requests.append(BatchRequest(f"line-{line_number}", entry))
+    return requests
+
+
+def completed_ids(path: str) -> set[str]:
+    """custom_ids that have a successful result in ``path``."""
+    if not os.path.exists(path):
+        return set()
+    completed = set()
+    with open(path) as f:
+        for line in f:
+            try:
+                result = json.loads(line)
+            except json.JSONDecodeError:
+                # the last line of an interrupted run may be cut off
+                continue
+            if result.get("error") is None:
+                completed.add(result["custom_id"])
+    return completed
+
+
+def prefix_sort_key(body: dict[str, Any]) -> str:
+    # same order as the rendered prompt: the system message (reasoning effort,
+    # built-in tools), the developer message (instructions, function tools),
+    # then the conversation
+    return json.dumps(
+        [
+            body.get("reasoning"),
+            body.get("tools"),
+            body.get("instructions"),
+            body.get("previous_response_id"),
+            body.get("input"),
+        ],
+        sort_keys=True,
+        ensure_ascii=False,
+    )
+
+
+def _result_line(custom_id: str, response: httpx.Response) -> dict[str, Any]:
+    try:
+        body = response.json()
+    except ValueError:
+        body = response.text
+    error = None
+    if response.status_code != 200:
+        error = {"code": str(response.status_code), "message": str(body)}
+    return {
+        "id": f"batch_req_{uuid.uuid4().hex}",
+        "custom_id": custom_id,
+        "response": {"status_code": response.status_code, "body": body},
+        "error": error,
+    }
+
+
+def _ends_with_newline(path: str) -> bool:
+    with open(path, "rb") as f:
+        f.seek(-1, os.SEEK_END)
+        return f.read(1) == b"\n"
+
+
+async def run_batch(
+    app: FastAPI,
+    requests: list[BatchRequest],
+    output_path: str,
+    concurrency: Optional[int] = None,
+) -> BatchSummary:
+    """Runs ``requests`` through ``app`` and appends the results to ``output_path``."""
+    summary = BatchSummary()
+    done = completed_ids(output_path)
+    pending = []
+    for request in requests:
+        if request.custom_id in done:
+            summary.skipped += 1
+        else:
+            pending.append(request)
+    pending.sort(key=lambda request: prefix_sort_key(request.body))
+    if concurrency is None:
+        concurrency = app.state.engine.max_batch_size
+    queue = iter(pending)
+
+    transport = httpx.ASGITransport(app=app)
+    with open(output_path, "a") as output:
+        if output.tell() and not _ends_with_newline(output_path):
+            # terminate the partial line of an interrupted run
+            output.write("\n")
+        async with (
+            app.router.lifespan_context(app),
+            httpx.AsyncClient(
+                transport=transport, base_url="http://batch", timeout=None
+            ) as client,
+        ):
+
+            async def worker():
+                # workers pull from a shared iterator, so requests start in order
+                for request in queue:
+                    body = {**request.body, "stream": False}
+                    response = await client.post("/v1/responses", json=body)
+                    result = _result_line(request.custom_id, response)
+                    if result["error"] is None:
+                        summary.succeeded += 1
+                    else:
+                        summary.failed += 1
+                    output.write(json.dumps(result, ensure_ascii=False) + "\n")
+                    output.flush()
+
+            await asyncio.gather(*[worker() for _ in range(max(concurrency, 1))])
+    return summary
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("input", metavar="INPUT", help="JSONL file of requests")
+    parser.add_argument("output", metavar="OUTPUT", help="JSONL file of results")
+    parser.add_argument(
+        "--checkpoint",
+        metavar="FILE",
+        type=str,
+        help="Path to the SafeTensors checkpoint",
+        default="~/model",
+    )
+    parser.add_argument(
+        "--inference-backend",
+        metavar="BACKEND",
+        choices=BACKENDS,
+        help="Inference backend to use",
+        default="metal" if __import__("platform").system() == "Darwin" else "triton",
+    )
+    parser.add_argument(
+        "--concurrency",
+        metavar="N",
+        type=int,
+        help="Requests in flight at once (default: the backend's batch size)",
+        default=None,
+    )
+    args = parser.parse_args()
+
+    encoding = load_harmony_encoding(HarmonyEncodingName.HARMONY_GPT_OSS)
+    backend = load_backend(args.inference_backend, args.checkpoint)
+    app = create_api_server(backend, encoding)
+    summary = asyncio.run(
+        run_batch(app, read_requests(args.input), args.output, args.concurrency)
+    )
+    print(
+        f"{summary.succeeded} succeeded, {summary.failed} failed, "
+        f"{summary.skipped} already done"
+    )
+
+
+if __name__ == "__main__":
+    main()
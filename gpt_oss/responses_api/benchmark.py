@@ -0,0 +1,109 @@
+"""
+Microbenchmark of streamed Responses API events per second.
+
+Runs concurrent streaming requests against the stub backend (without its
+per-token sleep) and reports how many SSE events and text deltas the server
+produces per second, with and without delta coalescing:
+
+    python -m gpt_oss.responses_api.benchmark --requests 32 --coalesce-tokens 1 8
+
+With ``--simulated`` the requests run against the simulated model instead,
+which takes as long as its latency model says (optionally configured by a
+JSON file of ``SimulationConfig`` fields), to measure the server end to end:
+
+    python -m gpt_oss.responses_api.benchmark --simulated simulation.json
+"""
+
+import argparse
+import asyncio
+import time
+
+import httpx
+from openai_harmony import HarmonyEncodingName, load_harmony_encoding
+
+from .api_server import create_api_server
+from .inference import simulated, stub
+from .sse import DeltaEmitter, format_sse
+from .events import ResponseOutputTextDelta
+
+
+async def run_streams(app, num_requests: int, coalesce_tokens: int) -> tuple[int, int]:
+    body = {
+        "input": "Hello",
+        "stream": True,
+        "stream_options": {"coalesce_tokens": coalesce_tokens},
+    }
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(
+        transport=transport, base_url="http://bench"
+    ) as client:
+
+        async def one():
+            async with client.stream("POST", "/v1/responses", json=body) as response:
+                text = await response.aread()
+            return text.count(b"\ndata: "), text.count(b"text.delta")
+
+        results = await asyncio.gather(*[one() for _ in range(num_requests)])
+    return sum(r[0] for r in results), sum(r[1] for r in results)
+
+
+def bench_encoding(num_events: int) -> tuple[float, float]:
+    """Returns events/sec for pydantic serialization and the delta template."""
+    start = time.perf_counter()
+    for i in range(num_events):
+        format_sse(ResponseOutputTextDelta(sequence_number=i, delta=" token"))
+    pydantic_rate = num_events / (time.perf_counter() - start)
+
+    emitter = DeltaEmitter(iter(range(num_events)).__next__)
+    start = time.perf_counter()
+    for _ in range(num_events):
+        emitter.add("response.output_text.delta", 0, 0, " token")
+    template_rate = num_events / (time.perf_counter() - start)
+    return pydantic_rate, template_rate
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--requests", type=int, default=32)
+    parser.add_argument("--coalesce-tokens", type=int, nargs="+", default=[1, 4, 16])
+    parser.add_argument("--encode-events", type=int, default=100_000)
+    parser.add_argument(
+        "--simulated",
+        metavar="CONFIG",
+        nargs="?",
+        const="",
+        help="Run against the simulated model, configured by an optional JSON file",
+    )
+    args = parser.parse_args()
+
+    pydantic_rate, template_rate = bench_encoding(args.encode_events)
+    print(
+        f"delta encoding: pydantic {pydantic_rate:,.0f}/s, template {template_rate:,.0f}/s"
+    )
+
+    stub.STEP_DELAY_S = 0
+    encoding = load_harmony_encoding(HarmonyEncodingName.HARMONY_GPT_OSS)
+    for coalesce_tokens in args.coalesce_tokens:
+        if args.simulated is not None:
+            model = simulated.setup_model(args.simulated)
+        else:
+            model = stub.setup_model("")
+        app = create_api_server(model, encoding)
+        start = time.perf_counter()
+        events, deltas = asyncio.run(run_streams(app, args.requests, coalesce_tokens))
+        elapsed = time.perf_counter() - start
+        print(
+            f"coalesce_tokens={coalesce_tokens}: {events / elapsed:,.0f} events/s, "
+            f"{deltas} delta events, {elapsed:.2f}s for {args.requests} streams"
+        )
+        if args.simulated is not None:
+            stats = model.stats
+            print(
+                f"  simulated: {stats.steps} steps, {stats.prefill_tokens} prefill "
+                f"and {stats.decode_tokens} decode tokens, "
+                f"{stats.preemptions} preemptions"
+            )
+
+
+if __name__ == "__main__":
+    main()
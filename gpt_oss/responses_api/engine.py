@@ -0,0 +1,594 @@
+"""
+Continuous-batching scheduler for the Responses API server.
+
+The engine owns the model. Every step it collects the sessions that have work
+(decoding, or prompt/tool tokens to prefill), runs them through the model as a
+single batch and hands the sampled tokens back to each session through an
+asyncio queue.
+
+``forward`` runs on a dedicated worker thread so model compute (and backends
+that block on I/O) never stalls the event loop serving the HTTP connections.
+"""
+
+import asyncio
+import itertools
+import time
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from typing import (
+    Callable,
+    Iterable,
+    Optional,
+    Protocol,
+    TypeVar,
+    Union,
+    runtime_checkable,
+)
+
+from .inference.session import InferenceBackend, InferenceSession
+from .metrics import THROUGHPUT_BUCKETS, Histogram
+
+DEFAULT_PREFILL_CHUNK_SIZE = 512
+DEFAULT_MAX_PREFILL_TOKENS = 2048
+
+T = TypeVar("T")
+
+
+class SessionCancelled(Exception):
+    """Raised by ``EngineSession.next_token`` after the session was cancelled."""
+
+
+@dataclass
+class EngineStats:
+    steps: int = 0
+    batched_entries: int = 0
+    cancelled_sessions: int = 0
+    prompt_tokens: int = 0
+    generated_tokens: int = 0
+    # prompt tokens the backend reported as already in its prefix cache
+    cached_prompt_tokens: int = 0
+    # wall time spent inside model.forward on the worker thread
+    forward_seconds: float = 0.0
+    max_forward_seconds: float = 0.0
+
+    @property
+    def mean_batch_size(self) -> float:
+        return self.batched_entries / self.steps if self.steps else 0.0
+
+    @property
+    def prefix_cache_hit_ratio(self) -> float:
+        return (
+            self.cached_prompt_tokens / self.prompt_tokens
+            if self.prompt_tokens
+            else 0.0
+        )
+
+
+class EngineMetrics:
+    """Latency and throughput histograms, updated from the event loop."""
+
+    def __init__(self):
+        self.queue_wait = Histogram(
+            "gpt_oss_queue_wait_seconds",
+            "Time from a session being opened or resumed to its first scheduled batch.",
+        )
+        self.time_to_first_token = Histogram(
+            "gpt_oss_time_to_first_token_seconds",
+            "Time from a session being opened to its first sampled token.",
+        )
+        self.inter_token_latency = Histogram(
+            "gpt_oss_inter_token_latency_seconds",
+            "Time between consecutive sampled tokens of a session.",
+        )
+        self.prefill_throughput = Histogram(
+            "gpt_oss_prefill_tokens_per_second",
+            "Prefilled tokens per second of forward time, per engine step.",
+            THROUGHPUT_BUCKETS,
+        )
+        self.decode_throughput = Histogram(
+            "gpt_oss_decode_tokens_per_second",
+            "Decoded tokens per second of forward time, per engine step.",
+            THROUGHPUT_BUCKETS,
+        )
+
+    def __iter__(self):
+        yield self.queue_wait
+        yield self.time_to_first_token
+        yield self.inter_token_latency
+        yield self.prefill_throughput
+        yield self.decode_throughput
+
+
+@dataclass
+class BatchEntry:
+    # identifies the session; models keep per-slot KV state until released
+    slot: int
+    # tokens to append to the slot's sequence in this step (empty when decoding)
+    tokens: list[int]
+    # whether to sample after appending `tokens` (False for the leading chunks
+    # of a chunked prefill)
+    sample: bool
+    temperature: float = 0.0
+    # True when `tokens` did not come out of the model (prompt or tool output)
+    new_request: bool = False
+    # tokens the slot may generate in total, if limited
+    max_tokens: Optional[int] = None
+
+
+@runtime_checkable
+class BatchedModel(Protocol):
+    max_batch_size: int
+
+    def forward(self, batch: list[BatchEntry]) -> list[list[int]]:
+        """
+        Return the newly sampled tokens per entry (empty if ``sample`` was
+        False). Sampled tokens become part of the slot's sequence.
+        """
+        ...
+
+    def release(self, slot: int) -> None:
+        """Drop all state kept for ``slot``."""
+        ...
+
+
+class SessionModel:
+    """
+    Adapts an ``InferenceBackend`` to ``BatchedModel`` by stepping one
+    ``InferenceSession`` per slot. The sessions sampled in a batch are stepped
+    by the backend's ``step_sessions``.
+    """
+
+    def __init__(self, backend: InferenceBackend):
+        self.backend = backend
+        self.max_batch_size = backend.max_batch_size
+        self._sessions: dict[int, InferenceSession] = {}
+
+    def forward(self, batch: list[BatchEntry]) -> list[list[int]]:
+        sampled = []
+        for entry in batch:
+            session = self._sessions.get(entry.slot)
+            if session is None:
+                session = self.backend.open_session(temperature=entry.temperature)
+                session.max_tokens = entry.max_tokens
+                self._sessions[entry.slot] = session
+            if entry.tokens:
+                session.append(entry.tokens)
+            if entry.sample:
+                sampled.append(session)
+        steps = iter(self.backend.step_sessions(sampled) if sampled else [])
+        return [next(steps) if entry.sample else [] for entry in batch]
+
+    def cached_tokens(self, slot: int) -> int:
+        session = self._sessions.get(slot)
+        return session.cached_tokens if session is not None else 0
+
+    @property
+    def supports_fork(self) -> bool:
+        return self.backend.supports_fork
+
+    def fork(self, src_slot: int, dst_slot: int) -> None:
+        source = self._sessions[src_slot]
+        forked = source.fork()
+        forked.max_tokens = source.max_tokens
+        self._sessions[dst_slot] = forked
+
+    def kv_cache_usage(self) -> Optional[float]:
+        return self.backend.kv_cache_usage()
+
+    def release(self, slot: int) -> None:
+        session = self._sessions.pop(slot, None)
+        if session is not None:
+            session.close()
+
+
+class EngineSession:
+    """Handle for one sequence scheduled on an ``InferenceEngine``."""
+
+    def __init__(
+        self,
+        engine: "InferenceEngine",
+        session_id: int,
+        tokens: list[int],
+        temperature: float,
+        max_tokens: Optional[int],
+    ):
+        self.id = session_id
+        self.temperature = temperature
+        self.max_tokens = max_tokens
+        self.num_generated = 0
+        self.cached_tokens = 0
+        # tokens that still have to be fed to the model
+        self.pending: list[int] = list(tokens)
+        # the prompt has been prefilled and the model is sampling
+        self.decoding = False
+        # stopped on a stop token or max_tokens; resumed by append()
+        self.parked = False
+        self.closed = False
+        self.new_request = True
+        # set on the session that prefills a prompt shared by several samples:
+        # the sessions to fork once the prompt minus its last token is in,
+        # and that last token, which every fork then feeds on its own
+        self.forks: list[EngineSession] = []
+        self.fork_token: Optional[int] = None
+        # waiting for another session to prefill the shared prompt
+        self.awaiting_fork = False
+        self.opened_at = time.monotonic()
+        # set while the session waits to be scheduled after open/append
+        self.waiting_since: Optional[float] = self.opened_at
+        # None until the first token after open/append
+        self.last_token_at: Optional[float] = None
+        self.queue: asyncio.Queue[Union[int, BaseException]] = asyncio.Queue()
+        self._engine = engine
+
+    @property
+    def runnable(self) -> bool:
+        return (
+            not self.closed
+            and not self.parked
+            and not self.awaiting_fork
+            and (bool(self.pending) or self.decoding)
+        )
+
+    async def next_token(self) -> int:
+        item = await self.queue.get()
+        if isinstance(item, BaseException):
+            raise item
+        return item
+
+    def append(self, tokens: Iterable[int]) -> None:
+        """Extend the sequence (e.g. with tool output) and resume decoding."""
+        self.pending.extend(tokens)
+        self.decoding = False
+        self.parked = False
+        self.new_request = True
+        self.waiting_since = time.monotonic()
+        # the gap spent on tool calls is not inter-token latency
+        self.last_token_at = None
+        self._engine._wake()
+
+    def close(self) -> None:
+        self._engine._close(self)
+
+    def cancel(self) -> None:
+        """
+        Stop generating and free the session's batch slot right away (e.g. when
+        the client went away). A pending ``next_token`` raises
+        ``SessionCancelled``.
+        """
+        if self.closed:
+            return
+        self._engine.stats.cancelled_sessions += 1
+        self.close()
+        self.queue.put_nowait(SessionCancelled())
+
+
+class InferenceEngine:
+    """
+    Runs all open sessions through a ``BatchedModel``.
+
+    Each step decodes every session whose prompt has been prefilled (up to
+    ``max_batch_size``) and fills the remaining batch rows with prefill chunks
+    of at most ``prefill_chunk_size`` tokens, bounded by ``max_prefill_tokens``
+    per step, so long prompts never stall decoding of other sessions.
+    Sessions stop decoding when they sample one of ``stop_tokens``.
+
+    Model calls never overlap: ``forward`` runs on a single worker thread, and
+    a session closed while a step is running is released once it returns.
+    Backends hold one set of weights and KV caches, so a bigger pool would
+    only add contention.
+    """
+
+    def __init__(
+        self,
+        model: BatchedModel,
+        stop_tokens: Iterable[int],
+        max_batch_size: Optional[int] = None,
+        prefill_chunk_size: int = DEFAULT_PREFILL_CHUNK_SIZE,
+        max_prefill_tokens: int = DEFAULT_MAX_PREFILL_TOKENS,
+    ):
+        self.model = model
+        self.stop_tokens = frozenset(stop_tokens)
+        self.max_batch_size = max_batch_size or model.max_batch_size
+        self.prefill_chunk_size = prefill_chunk_size
+        self.max_prefill_tokens = max_prefill_tokens
+        self._sessions: dict[int, EngineSession] = {}
+        self._ids = itertools.count()
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._task: Optional[asyncio.Task] = None
+        self._wake_event: Optional[asyncio.Event] = None
+        self._executor = ThreadPoolExecutor(
+            max_workers=1, thread_name_prefix="inference"
+        )
+        # slots in the batch currently on the worker thread; while it runs,
+        # releases are deferred until forward returns
+        self._in_flight: set[int] = set()
+        self._deferred_release: list[int] = []
+        self.stats = EngineStats()
+        self.metrics = EngineMetrics()
+        # (step count, future) pairs resolved once stats.steps reaches the count
+        self._step_waiters: list[tuple[int, asyncio.Future]] = []
+
+    @property
+    def num_sessions(self) -> int:
+        return len(self._sessions)
+
+    def kv_cache_usage(self) -> Optional[float]:
+        """Fraction of the model's KV cache in use, if the model reports it."""
+        usage = getattr(self.model, "kv_cache_usage", None)
+        return usage() if usage is not None else None
+
+    def open_session(
+        self,
+        tokens: list[int],
+        temperature: float = 0.0,
+        max_tokens: Optional[int] = None,
+    ) -> EngineSession:
+        """Schedule ``tokens`` for prefill. Must be called from the event loop."""
+        self._ensure_running()
+        session = EngineSession(self, next(self._ids), tokens, temperature, max_tokens)
+        self._sessions[session.id] = session
+        self.stats.prompt_tokens += len(tokens)
+        self._wake()
+        return session
+
+    def open_sessions(
+        self,
+        tokens: list[int],
+        n: int,
+        temperature: float = 0.0,
+        max_tokens: Optional[int] = None,
+    ) -> list[EngineSession]:
+        """
+        Open ``n`` sessions that sample independently from the same prompt.
+        The prompt is prefilled once and then forked, if the model supports it.
+        """
+        if n == 1 or len(tokens) < 2 or not getattr(self.model, "supports_fork", False):
+            return [
+                self.open_session(tokens, temperature, max_tokens) for _ in range(n)
+            ]
+        self._ensure_running()
+        leader = EngineSession(
+            self, next(self._ids), tokens[:-1], temperature, max_tokens
+        )
+        leader.fork_token = tokens[-1]
+        for _ in range(n - 1):
+            # keeps the whole prompt in case the leader goes away before forking
+            session = EngineSession(
+                self, next(self._ids), tokens, temperature, max_tokens
+            )
+            session.awaiting_fork = True
+            # counted in the leader's queue wait
+            session.waiting_since = None
+            leader.forks.append(session)
+        sessions = [leader, *leader.forks]
+        for session in sessions:
+            self._sessions[session.id] = session
+        self.stats.prompt_tokens += len(tokens)
+        self._wake()
+        return sessions
+
+    def _fork(self, leader: EngineSession) -> None:
+        for session in leader.forks:
+            if session.closed:
+                continue
+            self.model.fork(leader.id, session.id)
+            session.awaiting_fork = False
+            session.new_request = False
+            session.pending = [leader.fork_token]
+        leader.pending = [leader.fork_token]
+        leader.forks = []
+        leader.fork_token = None
+
+    async def run_on_worker(self, fn: Callable[..., T], *args) -> T:
+        """
+        Run ``fn`` on the thread that runs the model, between two steps (e.g.
+        to start a profiler that has to see the model's thread).
+        """
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._executor, fn, *args)
+
+    async def wait_for_steps(self, n: int) -> None:
+        """Wait until ``n`` more steps have completed."""
+        future = asyncio.get_running_loop().create_future()
+        self._step_waiters.append((self.stats.steps + n, future))
+        await future
+
+    def _ensure_running(self) -> None:
+        loop = asyncio.get_running_loop()
+        if self._loop is not loop:
+            # sessions from a previous event loop can never be consumed again
+            for session in list(self._sessions.values()):
+                self._close(session)
+            self._loop = loop
+            self._wake_event = asyncio.Event()
+            self._task = None
+        if self._task is None or self._task.done():
+            self._task = loop.create_task(self._run())
+
+    def _wake(self) -> None:
+        if self._wake_event is not None:
+            self._wake_event.set()
+
+    def _close(self, session: EngineSession) -> None:
+        if session.closed:
+            return
+        session.closed = True
+        for fork in session.forks:
+            # the shared prompt never got prefilled; each fork starts over
+            fork.awaiting_fork = False
+            fork.waiting_since = time.monotonic()
+        session.forks = []
+        self._sessions.pop(session.id, None)
+        if self._in_flight:
+            # models are not thread-safe: release must not run during forward
+            self._deferred_release.append(session.id)
+        else:
+            self.model.release(session.id)
+
+    def _schedule(self) -> list[tuple[EngineSession, BatchEntry]]:
+        batch: list[tuple[EngineSession, BatchEntry]] = []
+        runnable = [s for s in self._sessions.values() if s.runnable]
+        now = time.monotonic()
+
+        for session in runnable:
+            if len(batch) >= self.max_batch_size:
+                return batch
+            if session.pending:
+                continue
+            batch.append(
+                (
+                    session,
+                    BatchEntry(
+                        slot=session.id,
+                        tokens=[],
+                        sample=True,
+                        temperature=session.temperature,
+                        max_tokens=session.max_tokens,
+                    ),
+                )
+            )
+
+        prefill_budget = self.max_prefill_tokens
+        for session in runnable:
+            if len(batch) >= self.max_batch_size or prefill_budget <= 0:
+                break
+            if not session.pending:
+                continue
+            n = min(len(session.pending), self.prefill_chunk_size, prefill_budget)
+            chunk = session.pending[:n]
+            del session.pending[:n]
+            prefill_budget -= n
+            batch.append(
+                (
+                    session,
+                    BatchEntry(
+                        slot=session.id,
+                        tokens=chunk,
+                        sample=not session.pending and session.fork_token is None,
+                        temperature=session.temperature,
+                        new_request=session.new_request,
+                        max_tokens=session.max_tokens,
+                    ),
+                )
+            )
+            session.new_request = False
+            if session.waiting_since is not None:
+                self.metrics.queue_wait.observe(now - session.waiting_since)
+                session.waiting_since = None
+        return batch
+
+    def _forward(self, entries: list[BatchEntry]) -> tuple[list[list[int]], float]:
+        start = time.perf_counter()
+        results = self.model.forward(entries)
+        return results, time.perf_counter() - start
+
+    def _complete(
+        self,
+        batch: list[tuple[EngineSession, BatchEntry]],
+        results: Union[list[list[int]], BaseException],
+        elapsed: float,
+    ) -> None:
+        self._in_flight.clear()
+        for slot in self._deferred_release:
+            self.model.release(slot)
+        self._deferred_release.clear()
+
+        self.stats.steps += 1
+        self.stats.batched_entries += len(batch)
+        self.stats.forward_seconds += elapsed
+        self.stats.max_forward_seconds = max(self.stats.max_forward_seconds, elapsed)
+        if self._step_waiters:
+            waiting = []
+            for target, future in self._step_waiters:
+                if future.done():
+                    continue
+                if target <= self.stats.steps:
+                    future.set_result(None)
+                else:
+                    waiting.append((target, future))
+            self._step_waiters = waiting
+
+        if isinstance(results, BaseException):
+            for session, _ in batch:
+                session.queue.put_nowait(results)
+                self._close(session)
+            return
+
+        now = time.monotonic()
+        prefill_tokens = decode_tokens = 0
+        for (session, entry), tokens in zip(batch, results):
+            prefill_tokens += len(entry.tokens)
+            if not entry.tokens:
+                decode_tokens += len(tokens)
+            if session.forks and not session.pending and not session.closed:
+                self._fork(session)
+            if not entry.sample or session.closed:
+                continue
+            if not session.decoding:
+                session.decoding = True
+                if session.num_generated == 0 and hasattr(self.model, "cached_tokens"):
+                    session.cached_tokens = self.model.cached_tokens(session.id)
+                    self.stats.cached_prompt_tokens += session.cached_tokens
+            if tokens:
+                if session.num_generated == 0:
+                    self.metrics.time_to_first_token.observe(now - session.opened_at)
+                elif session.last_token_at is not None:
+                    gap = (now - session.last_token_at) / len(tokens)
+                    for _ in tokens:
+                        self.metrics.inter_token_latency.observe(gap)
+                session.last_token_at = now
+            for token in tokens:
+                session.num_generated += 1
+                self.stats.generated_tokens += 1
+                session.queue.put_nowait(token)
+                if token in self.stop_tokens or (
+                    session.max_tokens is not None
+                    and session.num_generated >= session.max_tokens
+                ):
+                    session.parked = True
+                    break
+
+        if elapsed > 0:
+            if prefill_tokens:
+                self.metrics.prefill_throughput.observe(prefill_tokens / elapsed)
+            if decode_tokens:
+                self.metrics.decode_throughput.observe(decode_tokens / elapsed)
+
+    def step(self) -> int:
+        """
+        Run one batch through the model on the calling thread. Returns the
+        number of entries run.
+        """
+        batch = self._schedule()
+        if not batch:
+            return 0
+        try:
+            results, elapsed = self._forward([entry for _, entry in batch])
+        except Exception as e:
+            results, elapsed = e, 0.0
+        self._complete(batch, results, elapsed)
+        return len(batch)
+
+    async def _step_async(self) -> int:
+        batch = self._schedule()
+        if not batch:
+            return 0
+        self._in_flight = {session.id for session, _ in batch}
+        loop = asyncio.get_running_loop()
+        try:
+            results, elapsed = await loop.run_in_executor(
+                self._executor, self._forward, [entry for _, entry in batch]
+            )
+        except Exception as e:
+            results, elapsed = e, 0.0
+        self._complete(batch, results, elapsed)
+        return len(batch)
+
+    async def _run(self) -> None:
+        while True:
+            if await self._step_async() == 0:
+                self._wake_event.clear()
+                await self._wake_event.wait()
+                continue
+            # let request handlers consume tokens and enqueue new sessions
+            await asyncio.sleep(0)
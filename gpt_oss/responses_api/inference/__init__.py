@@ -0,0 +1,34 @@
+BACKENDS = (
+    "triton",
+    "stub",
+    "simulated",
+    "metal",
+    "ollama",
+    "vllm",
+    "transformers",
+    "torch",
+)
+
+
+def load_backend(name: str, checkpoint: str):
+    """Sets up an inference backend by name. Backends are imported lazily since
+    most of them need optional dependencies."""
+    if name == "triton":
+        from .triton import setup_model
+    elif name == "stub":
+        from .stub import setup_model
+    elif name == "simulated":
+        from .simulated import setup_model
+    elif name == "metal":
+        from .metal import setup_model
+    elif name == "ollama":
+        from .ollama import setup_model
+    elif name == "vllm":
+        from .vllm import setup_model
+    elif name == "transformers":
+        from .transformers import setup_model
+    elif name == "torch":
+        from .torch import setup_model
+    else:
+        raise ValueError(f"Invalid inference backend: {name}")
+    return setup_model(checkpoint)
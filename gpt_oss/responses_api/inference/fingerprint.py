@@ -0,0 +1,105 @@
+"""
+Cheap prefix checks between token sequences.
+
+Backends that keep a KV cache have to know how much of a sequence the cache
+already holds. Comparing the lists token by token is O(context) Python work
+on every generated token. A ``TokenFingerprint`` keeps a rolling hash of each
+prefix of its sequence, so whether one sequence extends another is a single
+comparison of (length, hash), and keeping it up to date costs O(new tokens).
+The tokens themselves are compared, vectorized, only when sequences diverge.
+"""
+
+from typing import Sequence, Union
+
+import numpy as np
+
+# polynomial hash modulo a Mersenne prime; a collision between two different
+# prefixes of the same length has a probability of about 2**-61
+MODULUS = (1 << 61) - 1
+BASE = 1_000_003
+
+
+def common_prefix_length(a: Sequence[int], b: Sequence[int]) -> int:
+    """Length of the longest common prefix of two token sequences."""
+    n = min(len(a), len(b))
+    if n == 0:
+        return 0
+    a = np.asarray(a[:n], dtype=np.int64)
+    b = np.asarray(b[:n], dtype=np.int64)
+    mismatches = np.flatnonzero(a != b)
+    return int(mismatches[0]) if len(mismatches) else n
+
+
+class TokenFingerprint:
+    """A token sequence together with the rolling hash of each of its prefixes."""
+
+    def __init__(self, tokens: Sequence[int] = ()):
+        self._tokens = np.zeros(64, dtype=np.int64)
+        # _hashes[i] is the hash of the first i tokens
+        self._hashes = np.zeros(65, dtype=np.uint64)
+        self.length = 0
+        self.extend(tokens)
+
+    def __len__(self) -> int:
+        return self.length
+
+    @property
+    def hash(self) -> int:
+        return int(self._hashes[self.length])
+
+    def key(self) -> tuple[int, int]:
+        """The (length, hash) pair identifying the sequence."""
+        return self.length, self.hash
+
+    def tokens(self) -> np.ndarray:
+        return self._tokens[: self.length]
+
+    def tolist(self) -> list[int]:
+        return self.tokens().tolist()
+
+    def prefix_hash(self, length: int) -> int:
+        return int(self._hashes[length])
+
+    def extend(self, tokens: Sequence[int]) -> None:
+        end = self.length + len(tokens)
+        if end > len(self._tokens):
+            capacity = max(end, 2 * len(self._tokens))
+            self._tokens = np.resize(self._tokens, capacity)
+            self._hashes = np.resize(self._hashes, capacity + 1)
+        h = self.hash
+        for i, token in enumerate(tokens, start=self.length):
+            self._tokens[i] = token
+            h = (h * BASE + int(token) + 1) % MODULUS
+            self._hashes[i + 1] = h
+        self.length = end
+
+    def copy(self) -> "TokenFingerprint":
+        copied = TokenFingerprint()
+        copied._tokens = self._tokens.copy()
+        copied._hashes = self._hashes.copy()
+        copied.length = self.length
+        return copied
+
+    def truncate(self, length: int) -> None:
+        self.length = min(self.length, length)
+
+    def is_prefix_of(self, other: "TokenFingerprint") -> bool:
+        """Whether ``other`` starts with this sequence, in O(1)."""
+        return other.length >= self.length and other.prefix_hash(self.length) == (
+            self.hash
+        )
+
+    def common_prefix_length(
+        self, other: Union["TokenFingerprint", Sequence[int]]
+    ) -> int:
+        """
+        Length of the longest common prefix with ``other``. O(1) if one of two
+        fingerprints extends the other; otherwise the tokens are compared.
+        """
+        if isinstance(other, TokenFingerprint):
+            if self.is_prefix_of(other):
+                return self.length
+            if other.is_prefix_of(self):
+                return other.length
+            other = other.tokens()
+        return common_prefix_length(self.tokens(), other)
@@ -0,0 +1,107 @@
+"""
+Bookkeeping for a backend that runs every sequence through one KV cache.
+
+``KVCacheSync`` tracks which tokens the cache holds. Before each step it works
+out how much of the next sequence can be reused: the common prefix with what
+is cached, or, on a new request or after another sequence used the cache, the
+longest prefix found in the prefix cache or the hibernation store. The blocks
+themselves are copied by the backend's KV pool, so this module does not depend
+on torch.
+"""
+
+from typing import Any, Optional, Protocol, Sequence
+
+from ..kv_hibernation import KVHibernationStore, prefix_block_hashes
+from ..prefix_cache import RadixPrefixCache
+from .fingerprint import TokenFingerprint
+
+
+class KVPool(Protocol):
+    def save(self, caches: Any, start: int, block_ids: list[int]) -> None: ...
+
+    def load(self, caches: Any, start: int, block_ids: list[int]) -> None: ...
+
+    def restore(self, caches: Any, start: int, buffer: memoryview) -> None: ...
+
+
+class KVCacheSync:
+    """
+    ``caches`` are the live per-layer caches, which must have a
+    ``truncate(length)`` method; they are only otherwise passed to ``kv_pool``.
+    """
+
+    def __init__(
+        self,
+        caches: list,
+        kv_pool: KVPool,
+        prefix_cache: RadixPrefixCache,
+        hibernation: Optional[KVHibernationStore] = None,
+    ):
+        self.caches = caches
+        self.kv_pool = kv_pool
+        self.prefix_cache = prefix_cache
+        self.hibernation = hibernation
+        # the tokens whose keys and values are in the caches
+        self.cached = TokenFingerprint()
+
+    def sync(
+        self,
+        tokens: list[int],
+        new_request: bool = False,
+        fingerprint: Optional[TokenFingerprint] = None,
+    ) -> int:
+        """
+        Truncates the caches to the longest reusable prefix of ``tokens`` and
+        returns its length, which is always less than ``len(tokens)``.
+        ``fingerprint`` is the caller's fingerprint of ``tokens``; if it
+        extends the cached sequence, the O(n) prefix comparison is skipped.
+        """
+        common = self.cached.common_prefix_length(
+            fingerprint if fingerprint is not None else tokens
+        )
+        # the last token always goes through the model to produce logits
+        overlap = common = min(common, len(tokens) - 1)
+        if new_request or overlap < len(self.cached):
+            overlap = self._restore_prefix(tokens, overlap)
+            if new_request:
+                self.prefix_cache.last_hit_tokens = overlap
+        # restored blocks replaced what the cache held past the common prefix
+        self.cached.truncate(common)
+        self.cached.extend(tokens[common:overlap])
+        for cache in self.caches:
+            cache.truncate(overlap)
+        return overlap
+
+    def extend(self, tokens: Sequence[int]) -> None:
+        """Records tokens the backend ran through the model after ``sync``."""
+        self.cached.extend(tokens)
+
+    def _restore_prefix(self, tokens: list[int], overlap: int) -> int:
+        """
+        Stash the live cache in the prefix cache and bring back the longest
+        cached prefix of ``tokens``. Returns the number of reusable tokens.
+        """
+        block_size = self.prefix_cache.block_size
+        self.prefix_cache.insert(
+            self.cached.tolist(),
+            lambda start, block_ids: self.kv_pool.save(self.caches, start, block_ids),
+        )
+        hit, block_ids = self.prefix_cache.match(tokens[:-1])
+        if hit > overlap:
+            # the blocks within the common prefix are already in place
+            first_block = overlap // block_size
+            self.kv_pool.load(
+                self.caches, first_block * block_size, block_ids[first_block:]
+            )
+            overlap = hit
+        if self.hibernation is None:
+            return overlap
+
+        hashes = prefix_block_hashes(tokens[:-1], block_size)
+        for block_idx in range(overlap // block_size, len(hashes)):
+            buffer = self.hibernation.get(hashes[block_idx])
+            if buffer is None:
+                break
+            self.kv_pool.restore(self.caches, block_idx * block_size, buffer)
+            overlap = (block_idx + 1) * block_size
+        return overlap
@@ -4,20 +4,22 @@ from typing import Callable
 
 from gpt_oss.metal import Context, Model
 
+from .fingerprint import TokenFingerprint, common_prefix_length
+from .session import InferenceBackend, InferenceSession
 
-def setup_model(checkpoint: str) -> Callable[[list[int], float], int]:
-    """Load the Metal model and return an inference function."""
+
+def setup_model(checkpoint: str) -> "MetalBackend":
+    """Load the Metal model and return a session backend."""
+
+    return MetalBackend(checkpoint)
+
+
+def get_infer_next_token(checkpoint: str) -> Callable[[list[int], float], int]:
+    """Load the Metal model and return a stateless-style inference function."""
 
     model = Model(checkpoint)
     context = Context(model)
 
-    def lcp(cache: list[int], inp: list[int]) -> list[int]:
-        i = 0
-        max_len = min(len(cache), len(inp))
-        while i < max_len and cache[i] == inp[i]:
-            i += 1
-        return cache[:i]
-
     tokens_so_far = []
 
     def infer_next_token(
@@ -36,8 +38,7 @@ def setup_model(checkpoint: str) -> Callable[[list[int], float], int]:
             return int(context.sample(temperature=temperature))
 
         # Longest common prefix length
-        overlap = lcp(tokens_so_far, tokens)
-        ol = len(overlap)
+        ol = common_prefix_length(tokens_so_far, tokens)
         prev_len = len(tokens_so_far)
         cur_len = len(tokens)
 
@@ -76,3 +77,53 @@ def setup_model(checkpoint: str) -> Callable[[list[int], float], int]:
         return int(context.sample(temperature=temperature))
 
     return infer_next_token
+
+
+class MetalSession(InferenceSession):
+    def __init__(self, backend: "MetalBackend", temperature: float):
+        self.backend = backend
+        self.temperature = temperature
+        self.tokens: list[int] = []
+        self.fingerprint = TokenFingerprint()
+
+    def append(self, tokens: list[int]) -> None:
+        self.tokens.extend(tokens)
+        self.fingerprint.extend(tokens)
+
+    def step(self) -> list[int]:
+        context = self.backend.context
+        synced = self.backend.synced
+        if not synced.is_prefix_of(self.fingerprint):
+            # another session diverged from this one in the context
+            context.reset()
+            synced.truncate(0)
+        new_tokens = self.tokens[len(synced) :]
+        for t in new_tokens:
+            context.append(t)
+        synced.extend(new_tokens)
+        context.process()
+        next_tok = int(context.sample(temperature=self.temperature))
+        self.tokens.append(next_tok)
+        self.fingerprint.extend([next_tok])
+        return [next_tok]
+
+
+class MetalBackend(InferenceBackend):
+    """
+    Sessions take turns on a single Metal context, which is only reset when
+    it holds tokens the stepping session does not start with.
+    """
+
+    # forks could only copy the token list: the one context cannot be copied
+    # and there is no prefix cache, so every fork would prefill the prompt
+    # again; n > 1 runs independent sessions instead
+    supports_fork = False
+
+    def __init__(self, checkpoint: str):
+        self.model = Model(checkpoint)
+        self.context = Context(self.model)
+        # the tokens appended to the context
+        self.synced = TokenFingerprint()
+
+    def open_session(self, temperature: float = 0.0) -> MetalSession:
+        return MetalSession(self, temperature)
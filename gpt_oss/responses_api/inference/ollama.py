@@ -2,188 +2,213 @@
 NOTE: this is a stitched together implementation that uses Ollama for inference. It's primarily used
 for testing and development. It does not leverage any prompt caching or other optimizations and
 can therefore be slow between turns.
+
+Every session streams its own ``/api/generate`` request. The streams run on a
+background event loop that shares one pooled HTTP client, and each one feeds
+the tokens it receives into a queue owned by its session, so concurrent
+requests never see each other's tokens.
 """
 
+import asyncio
 import json
-import threading
-import time
-from typing import Callable, Optional
+import os
+from typing import Optional
+
+import aiohttp
+from openai_harmony import HarmonyEncoding, HarmonyEncodingName, load_harmony_encoding
+
+from .streaming import BackgroundLoop, StreamingBackend, StreamingSession
 
-import requests
-from openai_harmony import HarmonyEncodingName, load_harmony_encoding
+EOS_TOKEN = 200002  # appended when the stream is done or on hard timeout
 
-EOS_TOKEN = 200002  # only used on hard timeout
+DEFAULT_BASE_URL = os.environ.get("OLLAMA_HOST", "http://localhost:11434")
 
 # Tunables
-POLL_INTERVAL_S = 0.01  # 10ms between buffer checks
-CALL_MAX_WAIT_S = 0.250  # max time to block inside a single infer call
-NO_TOKEN_TIMEOUT_S = 15.0  # overall inactivity timeout before emitting EOS
-FIRST_BYTE_TIMEOUT_S = 30.0  # time to wait for first token before EOS
-
-# Shared state
-_token_buffer: list[int] = []
-_buffer_lock = threading.Lock()
-_stream_thread: Optional[threading.Thread] = None
-_stream_done = threading.Event()
-_stream_error: Optional[Exception] = None
-_last_progress_ts: float = 0.0  # updated whenever we enqueue or dequeue tokens
-_previous_request_tokens: list[int] = []
-
-
-def lcp(cache: list[int], inp: list[int]) -> list[int]:
-    i = 0
-    max_len = min(len(cache), len(inp))
-    while i < max_len and cache[i] == inp[i]:
-        i += 1
-    return cache[:i]
-
-
-def _now():
-    return time.monotonic()
-
-
-def _touch_progress():
-    global _last_progress_ts
-    _last_progress_ts = _now()
-
-
-def _reset_stream_state():
-    global _token_buffer, _stream_thread, _stream_error
-    with _buffer_lock:
-        _token_buffer = []
-    _stream_done.clear()
-    _stream_thread = None
-    _stream_error = None
-    _touch_progress()
-
-
-def setup_model(checkpoint: str) -> Callable[[list[int], float, bool], int]:
-    encoding = load_harmony_encoding(HarmonyEncodingName.HARMONY_GPT_OSS)
-    model_name = checkpoint
-
-    def _start_stream(token_ids: list[int], temperature: float):
-        prompt_text = encoding.decode(token_ids)
-
-        def run():
-            nonlocal prompt_text, temperature
-            global _stream_error
-            global _previous_request_tokens
-
-            accum_text = ""
-            last_len = 0  # number of tokens already emitted
-
-            try:
-                url = "http://localhost:11434/api/generate"
-
-                payload = {
-                    "model": model_name,
-                    "prompt": prompt_text,
-                    "stream": True,
-                    "options": {"temperature": temperature},
-                    "raw": True,
-                }
-
-                with requests.post(url, json=payload, stream=True, timeout=60) as resp:
-                    resp.raise_for_status()
-                    for line in resp.iter_lines(decode_unicode=True):
-                        if not line:
-                            continue
-                        obj = json.loads(line)
-
-                        if isinstance(obj.get("response"), str):
-                            accum_text += obj["response"]
-                            toks = encoding.encode(accum_text, allowed_special="all")
-                            if len(toks) > last_len:
-                                new_toks = toks[last_len:]
-                                with _buffer_lock:
-                                    _token_buffer.extend(new_toks)
-                                last_len = len(toks)
-                                _touch_progress()
-
-                        if obj.get("done", False):
-                            _token_buffer.append(EOS_TOKEN)
-                            last_len = len(toks)
-                            _touch_progress()
-                            break
-
-                _stream_done.set()
-
-            except Exception as e:
-                _stream_error = e
-                _stream_done.set()
-
-        t = threading.Thread(target=run, name="ollama-stream", daemon=True)
-        t.start()
-        return t
-
-    def infer_next_token(
-        tokens: list[int], temperature: float = 0.0, new_request: bool = False
-    ) -> int:
-        """
-        - Starts a new Ollama stream on new_request.
-        - Forwards tokens as they arrive.
-        - Only emits EOS_TOKEN if we exceed an inactivity timeout.
-        """
-        global _stream_thread
-
-        if new_request:
-            _reset_stream_state()
-            _stream_thread = _start_stream(token_ids=tokens, temperature=temperature)
-            # Wait for first byte within FIRST_BYTE_TIMEOUT_S (without emitting EOS early)
-            start = _now()
-            while _now() - start < FIRST_BYTE_TIMEOUT_S:
-                with _buffer_lock:
-                    if _token_buffer:
-                        tok = _token_buffer.pop(0)
-                        _touch_progress()
-                        return tok
-                if _stream_error is not None:
-                    raise RuntimeError(f"Ollama stream error: {_stream_error!r}")
-                # If Ollama finished instantly with no output, continue loop until timeout
-                time.sleep(POLL_INTERVAL_S)
-            # Hard first-byte timeout -> emit EOS so the server can stop this request
-            return EOS_TOKEN
-
-        if _stream_error is not None:
-            raise RuntimeError(f"Ollama stream error: {_stream_error!r}")
-
-        # Normal path: wait up to CALL_MAX_WAIT_S for a token to arrive
-        wait_start = _now()
-        while _now() - wait_start < CALL_MAX_WAIT_S:
-            with _buffer_lock:
-                if _token_buffer:
-                    tok = _token_buffer.pop(0)
-                    _touch_progress()
-                    return tok
-            # No token yet; if we've been idle too long overall, end with EOS
-            if _now() - _last_progress_ts > NO_TOKEN_TIMEOUT_S:
-                return EOS_TOKEN
-            time.sleep(POLL_INTERVAL_S)
-
-        # Still no token in this call slice. Do NOT send EOS unless we've timed out.
-        if _now() - _last_progress_ts > NO_TOKEN_TIMEOUT_S:
-            return EOS_TOKEN
-
-        # Tell caller to call us again; block minimally by returning *nothing new*.
-        # We must return an int; safest is to wait a tiny bit longer for a token.
-        # If still none, keep returning only after short waits. Avoid EOS here.
-        # One more short wait to reduce hot-looping:
-        time.sleep(POLL_INTERVAL_S)
-        with _buffer_lock:
-            if _token_buffer:
-                tok = _token_buffer.pop(0)
-                _touch_progress()
-                return tok
-
-        # As a last resort for this call slice, return EOS only on true inactivity timeout.
-        if _now() - _last_progress_ts > NO_TOKEN_TIMEOUT_S:
-            return EOS_TOKEN
-
-        # If we reach here, we still haven't got a token—ask the caller to call again soon.
-        # Return a harmless token that the server will replace/ignore if your interface supports it.
-        # If your interface does NOT allow a sentinel, keep the short-blocking behavior above.
-        return (
-            EOS_TOKEN if False else 0
-        )  # replace `0` with a PAD/NOOP token your server ignores
-
-    return infer_next_token
+CALL_MAX_WAIT_S = 0.250  # max time a step blocks waiting for its first token
+NO_TOKEN_TIMEOUT_S = 15.0  # inactivity timeout before emitting EOS
+FIRST_BYTE_TIMEOUT_S = 30.0  # time to wait for the first token before EOS
+MAX_CONNECTIONS = 32
+# held back text with no stable boundary that forces a commit, e.g. CJK text,
+# base64 or long identifiers, and how much of its end stays held back
+MAX_PENDING_CHARS = 256
+PENDING_MARGIN_CHARS = 32
+
+
+def _stable_prefix_length(text: str) -> int:
+    """
+    Length of the longest prefix of ``text`` that ends on a boundary of the
+    tokenizer's pre-tokenization that no appended text can move: before a
+    space that follows a non-space character, or before a letter or digit
+    that follows a line break. Tokens never span such a boundary, and special
+    tokens contain neither, so the prefix encodes to the same tokens on its
+    own as within any longer text.
+    """
+    for i in range(len(text) - 1, 0, -1):
+        prev, char = text[i - 1], text[i]
+        if (char == " " and not prev.isspace()) or (prev in "\r\n" and char.isalnum()):
+            return i
+    return 0
+
+
+class IncrementalEncoder:
+    """
+    Encodes streamed text into the tokens of encoding the whole text at once,
+    without re-encoding it on every chunk: only the text after the last stable
+    boundary is held back, and text before it is encoded exactly once.
+
+    Text that goes on for more than ``max_pending_chars`` without a boundary
+    is committed anyway, up to a token that ends on a character boundary
+    ``margin_chars`` before its end, so tokens keep flowing. Only the tokens
+    around such a cut may differ from those of the whole text.
+    """
+
+    def __init__(
+        self,
+        encoding: HarmonyEncoding,
+        max_pending_chars: int = MAX_PENDING_CHARS,
+        margin_chars: int = PENDING_MARGIN_CHARS,
+    ):
+        self.encoding = encoding
+        self.max_pending_chars = max_pending_chars
+        self.margin_chars = margin_chars
+        self._tail = ""
+
+    def feed(self, text: str) -> list[int]:
+        """Adds text and returns the tokens that can no longer change."""
+        self._tail += text
+        n = _stable_prefix_length(self._tail)
+        if n == 0:
+            if len(self._tail) > self.max_pending_chars:
+                return self._force_commit()
+            return []
+        stable, self._tail = self._tail[:n], self._tail[n:]
+        return self.encoding.encode(stable, allowed_special="all")
+
+    def _force_commit(self) -> list[int]:
+        tokens = self.encoding.encode(self._tail, allowed_special="all")
+        limit = len(self._tail) - self.margin_chars
+        for m in range(len(tokens) - 1, 0, -1):
+            # a token that ends within a character decodes to U+FFFD
+            committed = self.encoding.decode(tokens[:m])
+            if len(committed) <= limit and self._tail.startswith(committed):
+                self._tail = self._tail[len(committed) :]
+                return tokens[:m]
+        return []
+
+    def flush(self) -> list[int]:
+        """Returns the tokens of the held back text at the end of the stream."""
+        tail, self._tail = self._tail, ""
+        return self.encoding.encode(tail, allowed_special="all") if tail else []
+
+
+class OllamaSession(StreamingSession):
+    source = "Ollama"
+    wait_s = CALL_MAX_WAIT_S
+
+    def __init__(self, backend: "OllamaBackend", temperature: float):
+        super().__init__(backend.loop, temperature)
+        self.backend = backend
+
+    async def generate(self, tokens: list[int], queue: asyncio.Queue) -> None:
+        await self.backend.generate(tokens, self.temperature, queue)
+
+    def on_idle(self, idle_s: float, received: bool) -> list[int]:
+        timeout = (
+            self.backend.no_token_timeout_s
+            if received
+            else self.backend.first_byte_timeout_s
+        )
+        if idle_s <= timeout:
+            return []
+        print(f"Ollama stream timed out after {timeout:g}s, ending the sequence")
+        return [EOS_TOKEN]
+
+    def fork(self) -> "OllamaSession":
+        forked = OllamaSession(self.backend, self.temperature)
+        forked.tokens = list(self.tokens)
+        return forked
+
+
+class OllamaBackend(StreamingBackend):
+    # sessions stream concurrently; a step only drains tokens that arrived
+    max_batch_size = 8
+    supports_fork = True
+
+    def __init__(
+        self,
+        model_name: str,
+        base_url: str = DEFAULT_BASE_URL,
+        max_connections: int = MAX_CONNECTIONS,
+        first_byte_timeout_s: float = FIRST_BYTE_TIMEOUT_S,
+        no_token_timeout_s: float = NO_TOKEN_TIMEOUT_S,
+    ):
+        self.model_name = model_name
+        self.base_url = base_url.rstrip("/")
+        self.max_connections = max_connections
+        self.first_byte_timeout_s = first_byte_timeout_s
+        self.no_token_timeout_s = no_token_timeout_s
+        self.encoding = load_harmony_encoding(HarmonyEncodingName.HARMONY_GPT_OSS)
+        self._client: Optional[aiohttp.ClientSession] = None
+        self.loop = BackgroundLoop("ollama-client")
+
+    def open_session(self, temperature: float = 0.0) -> OllamaSession:
+        return OllamaSession(self, temperature)
+
+    def _get_client(self) -> aiohttp.ClientSession:
+        if self._client is None:
+            # keep-alive connections are reused across requests
+            self._client = aiohttp.ClientSession(
+                connector=aiohttp.TCPConnector(limit=self.max_connections),
+                timeout=aiohttp.ClientTimeout(total=None, sock_connect=10),
+            )
+        return self._client
+
+    async def generate(
+        self, tokens: list[int], temperature: float, queue: asyncio.Queue
+    ) -> None:
+        payload = {
+            "model": self.model_name,
+            "prompt": self.encoding.decode(tokens),
+            "stream": True,
+            "options": {"temperature": temperature},
+            "raw": True,
+        }
+        encoder = IncrementalEncoder(self.encoding)
+        try:
+            async with self._get_client().post(
+                f"{self.base_url}/api/generate", json=payload
+            ) as resp:
+                resp.raise_for_status()
+                async for line in resp.content:
+                    if not line.strip():
+                        continue
+                    obj = json.loads(line)
+                    if "error" in obj:
+                        raise RuntimeError(obj["error"])
+
+                    if isinstance(obj.get("response"), str):
+                        for token in encoder.feed(obj["response"]):
+                            queue.put_nowait(token)
+
+                    if obj.get("done", False):
+                        for token in encoder.flush():
+                            queue.put_nowait(token)
+                        queue.put_nowait(EOS_TOKEN)
+                        return
+            raise RuntimeError("stream ended before generation was done")
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            queue.put_nowait(e)
+
+    def close(self) -> None:
+        async def close_client():
+            if self._client is not None:
+                await self._client.close()
+
+        self.loop.close(close_client)
+
+
+def setup_model(checkpoint: str) -> OllamaBackend:
+    # the checkpoint names the Ollama model, e.g. gpt-oss:20b
+    return OllamaBackend(checkpoint)
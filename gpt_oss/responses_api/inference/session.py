@@ -0,0 +1,104 @@
+"""
+Session-handle interface implemented by the Responses API inference backends.
+
+A backend hands out one ``InferenceSession`` per sequence. The server appends
+prompt and tool tokens to the session and calls ``step`` to generate; tokens
+returned by ``step`` are already part of the session's sequence, so the server
+never has to pass the full token list back to the backend.
+"""
+
+from abc import ABC, abstractmethod
+from typing import Callable, Optional
+
+
+class InferenceSession(ABC):
+    # number of appended prompt tokens the backend did not have to prefill
+    cached_tokens: int = 0
+    # tokens the session may generate in total, if limited; set by the engine
+    # for backends that submit whole generation requests
+    max_tokens: Optional[int] = None
+
+    @abstractmethod
+    def append(self, tokens: list[int]) -> None:
+        """Extend the sequence with tokens that did not come from the model."""
+
+    @abstractmethod
+    def step(self) -> list[int]:
+        """
+        Generate and return the newly generated tokens. Local backends return
+        at least one; remote ones may return none if nothing arrived yet, and
+        the session is stepped again.
+        """
+
+    def close(self) -> None:
+        """Release any state kept for this session."""
+
+    def fork(self) -> "InferenceSession":
+        """
+        Return an independent session with the same sequence, sharing the
+        work done so far. Only called if the backend sets ``supports_fork``.
+        """
+        raise NotImplementedError
+
+
+class InferenceBackend(ABC):
+    # number of sessions that can be stepped in the same engine step without
+    # thrashing shared state (e.g. a single KV cache)
+    max_batch_size: int = 1
+    # whether sessions implement fork()
+    supports_fork: bool = False
+
+    @abstractmethod
+    def open_session(self, temperature: float = 0.0) -> InferenceSession:
+        """Start a new, empty sequence."""
+
+    def step_sessions(self, sessions: list[InferenceSession]) -> list[list[int]]:
+        """
+        Steps the sessions sampled in one engine step. Backends whose sessions
+        wait for tokens override this to wait for all of them at once.
+        """
+        return [session.step() for session in sessions]
+
+    def kv_cache_usage(self) -> Optional[float]:
+        """Fraction of the KV cache in use, or None if the backend cannot tell."""
+        return None
+
+
+class InferNextTokenSession(InferenceSession):
+    """Runs a session on a legacy ``infer_next_token(tokens, temperature, new_request)``."""
+
+    def __init__(self, infer_next_token: Callable[..., int], temperature: float):
+        self.infer_next_token = infer_next_token
+        self.temperature = temperature
+        self.tokens: list[int] = []
+        self.new_request = True
+
+    def append(self, tokens: list[int]) -> None:
+        self.tokens.extend(tokens)
+        self.new_request = True
+
+    def step(self) -> list[int]:
+        token = self.infer_next_token(
+            self.tokens, temperature=self.temperature, new_request=self.new_request
+        )
+        self.new_request = False
+        self.tokens.append(token)
+        return [token]
+
+    def fork(self) -> "InferNextTokenSession":
+        forked = InferNextTokenSession(self.infer_next_token, self.temperature)
+        forked.tokens = list(self.tokens)
+        return forked
+
+
+class InferNextTokenBackend(InferenceBackend):
+    """Adapts a legacy ``infer_next_token`` function to ``InferenceBackend``."""
+
+    supports_fork = True
+
+    def __init__(self, infer_next_token: Callable[..., int], max_batch_size: int = 1):
+        self.infer_next_token = infer_next_token
+        self.max_batch_size = max_batch_size
+
+    def open_session(self, temperature: float = 0.0) -> InferNextTokenSession:
+        return InferNextTokenSession(self.infer_next_token, temperature)
@@ -0,0 +1,241 @@
+"""
+A simulated model for load testing the server without a GPU.
+
+``SimulatedModel`` is a ``BatchedModel``: every engine step sleeps for as long
+as a latency model says the batch would take on real hardware, with a cost per
+prefilled token and a per-step decode cost that grows with the batch size.
+Sessions hold KV entries in a cache of limited capacity; when it runs out, the
+least recently stepped sessions are preempted and their sequence is prefilled
+again the next time they step, as in vLLM.
+
+The sampled tokens form well-formed harmony turns drawn from a seeded
+distribution: some reasoning, then either a final answer or a call to one of
+the functions declared in the prompt. A turn that follows a tool result is
+always a final answer.
+
+    python -m gpt_oss.responses_api.serve --inference-backend simulated \\
+        --checkpoint simulation.json
+
+where the optional JSON file holds ``SimulationConfig`` fields.
+"""
+
+import json
+import random
+import re
+import time
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from typing import Optional
+
+from openai_harmony import HarmonyEncodingName, load_harmony_encoding
+
+from ..engine import BatchEntry
+
+WORDS = (
+    "the model server request token batch cache answer user weather result "
+    "data time value first next step check need call tool search think "
+    "simple question should will about with from that this have more"
+).split()
+ROLES = ("system", "developer", "user", "assistant")
+
+
+@dataclass
+class SimulationConfig:
+    # cost of running one token through the model during prefill
+    prefill_ms_per_token: float = 0.25
+    # cost of one decode step is decode_ms_base + decode_ms_per_sequence * batch
+    decode_ms_base: float = 20.0
+    decode_ms_per_sequence: float = 0.5
+    # tokens whose KV entries fit in memory across all sessions
+    kv_capacity_tokens: int = 131_072
+    max_batch_size: int = 64
+    mean_reasoning_tokens: float = 64
+    mean_answer_tokens: float = 128
+    # chance that a turn calls one of the functions declared in the prompt
+    tool_call_probability: float = 0.3
+    seed: int = 0
+
+    def step_seconds(self, prefill_tokens: int, batch_size: int) -> float:
+        """Time a forward pass over ``batch_size`` sequences would take."""
+        decode_ms = self.decode_ms_base + self.decode_ms_per_sequence * batch_size
+        return (decode_ms + self.prefill_ms_per_token * prefill_tokens) / 1000
+
+
+@dataclass
+class SimulationStats:
+    steps: int = 0
+    prefill_tokens: int = 0
+    decode_tokens: int = 0
+    # tokens prefilled again after their session was preempted
+    recomputed_tokens: int = 0
+    preemptions: int = 0
+    simulated_seconds: float = 0.0
+
+
+@dataclass(eq=False)
+class _Slot:
+    rng: random.Random
+    tokens: list[int] = field(default_factory=list)
+    # leading tokens whose KV entries are in the cache
+    kv: int = 0
+    # the rest of the turn being generated
+    planned: list[int] = field(default_factory=list)
+    functions: Optional[dict[str, list[str]]] = None
+
+
+def declared_functions(prompt: str) -> dict[str, list[str]]:
+    """Required string parameters of each function declared in a harmony prompt."""
+    namespace = re.search(
+        r"namespace functions \{(.*?)\} // namespace functions", prompt, re.S
+    )
+    if namespace is None:
+        return {}
+    functions = {}
+    for name, params in re.findall(
+        r"^type (\w+) = \((.*?)\) => any;", namespace.group(1), re.S | re.M
+    ):
+        functions[name] = re.findall(r"^(\w+): string,$", params, re.M)
+    return functions
+
+
+class SimulatedModel:
+    supports_fork = True
+
+    def __init__(self, config: Optional[SimulationConfig] = None):
+        self.config = config or SimulationConfig()
+        self.max_batch_size = self.config.max_batch_size
+        self.encoding = load_harmony_encoding(HarmonyEncodingName.HARMONY_GPT_OSS)
+        self.stats = SimulationStats()
+        # least recently stepped first
+        self._slots: OrderedDict[int, _Slot] = OrderedDict()
+        self._kv_used = 0
+        self._start_token = self._encode("<|start|>")[0]
+        self._words = [self._encode(f" {w}") for w in WORDS]
+        self._period = self._encode(".")
+
+    def _encode(self, text: str) -> list[int]:
+        return self.encoding.encode(text, allowed_special="all")
+
+    def forward(self, batch: list[BatchEntry]) -> list[list[int]]:
+        prefill_tokens = 0
+        for entry in batch:
+            slot = self._slots.get(entry.slot)
+            if slot is None:
+                rng = random.Random(f"{self.config.seed}:{entry.slot}")
+                slot = self._slots[entry.slot] = _Slot(rng)
+            self._slots.move_to_end(entry.slot)
+            # tokens the cache lost to a preemption, besides the last sampled
+            # one, which is never in it yet
+            recomputed = max(0, len(slot.tokens) - slot.kv - 1)
+            slot.tokens.extend(entry.tokens)
+            if entry.tokens:
+                # the rest of the turn no longer follows the sequence
+                slot.planned = []
+            # the last sampled token, appended tokens, and after a preemption
+            # the whole sequence go through the model in this step
+            processed = len(slot.tokens) - slot.kv
+            if entry.tokens or processed > 1:
+                prefill_tokens += processed
+                self.stats.prefill_tokens += processed
+                self.stats.recomputed_tokens += recomputed
+            else:
+                self.stats.decode_tokens += 1
+            self._kv_used += processed
+            slot.kv = len(slot.tokens)
+        self._preempt({entry.slot for entry in batch})
+
+        seconds = self.config.step_seconds(prefill_tokens, len(batch))
+        self.stats.steps += 1
+        self.stats.simulated_seconds += seconds
+        time.sleep(seconds)
+
+        results = []
+        for entry in batch:
+            if not entry.sample:
+                results.append([])
+                continue
+            slot = self._slots[entry.slot]
+            if not slot.planned:
+                slot.planned = self._plan_turn(slot)
+            token = slot.planned.pop(0)
+            slot.tokens.append(token)
+            results.append([token])
+        return results
+
+    def _preempt(self, running: set[int]) -> None:
+        for slot_id, slot in self._slots.items():
+            if self._kv_used <= self.config.kv_capacity_tokens:
+                return
+            if slot_id in running or slot.kv == 0:
+                continue
+            self._kv_used -= slot.kv
+            slot.kv = 0
+            self.stats.preemptions += 1
+
+    def _text(self, rng: random.Random, mean_tokens: float) -> list[int]:
+        n = max(1, round(rng.expovariate(1 / mean_tokens)))
+        tokens = []
+        while len(tokens) < n:
+            tokens.extend(rng.choice(self._words))
+            if rng.random() < 0.1:
+                tokens.extend(self._period)
+        return tokens + self._period
+
+    def _after_tool_result(self, tokens: list[int]) -> bool:
+        # looks at the author of the message before the trailing
+        # <|start|>assistant
+        starts = 0
+        for i in range(len(tokens) - 1, -1, -1):
+            if tokens[i] == self._start_token:
+                starts += 1
+                if starts == 2:
+                    author = self.encoding.decode(tokens[i + 1 : i + 4])
+                    return not author.startswith(ROLES)
+        return False
+
+    def _plan_turn(self, slot: _Slot) -> list[int]:
+        config, rng = self.config, slot.rng
+        if slot.functions is None:
+            slot.functions = declared_functions(self.encoding.decode(slot.tokens))
+        tokens = self._encode("<|channel|>analysis<|message|>")
+        tokens += self._text(rng, config.mean_reasoning_tokens)
+        tokens += self._encode("<|end|><|start|>assistant")
+        if (
+            slot.functions
+            and not self._after_tool_result(slot.tokens)
+            and rng.random() < config.tool_call_probability
+        ):
+            name = rng.choice(sorted(slot.functions))
+            arguments = {param: rng.choice(WORDS) for param in slot.functions[name]}
+            return tokens + self._encode(
+                f"<|channel|>commentary to=functions.{name} <|constrain|>json"
+                f"<|message|>{json.dumps(arguments)}<|call|>"
+            )
+        tokens += self._encode("<|channel|>final<|message|>")
+        tokens += self._text(rng, config.mean_answer_tokens)
+        return tokens + self._encode("<|return|>")
+
+    def fork(self, src_slot: int, dst_slot: int) -> None:
+        source = self._slots[src_slot]
+        rng = random.Random(f"{self.config.seed}:{dst_slot}")
+        forked = _Slot(rng, list(source.tokens), source.kv, [], source.functions)
+        # forks are charged for a copy of the shared prefix
+        self._kv_used += forked.kv
+        self._slots[dst_slot] = forked
+
+    def kv_cache_usage(self) -> float:
+        return min(1.0, self._kv_used / self.config.kv_capacity_tokens)
+
+    def release(self, slot: int) -> None:
+        released = self._slots.pop(slot, None)
+        if released is not None:
+            self._kv_used -= released.kv
+
+
+def setup_model(checkpoint: str) -> SimulatedModel:
+    # the checkpoint optionally names a JSON file of SimulationConfig fields
+    config = SimulationConfig()
+    if checkpoint:
+        with open(checkpoint) as f:
+            config = SimulationConfig(**json.load(f))
+    return SimulatedModel(config)
@@ -0,0 +1,176 @@
+"""
+Building blocks for backends whose tokens come from a request running
+elsewhere, such as an HTTP server or an async engine.
+
+Each ``StreamingSession`` submits one generation request for its sequence on
+a ``BackgroundLoop`` shared by all sessions of a backend. The request feeds
+the tokens it produces into a queue owned by the session, and ``step`` hands
+out whatever has arrived; ``StreamingBackend`` steps the sessions of a batch
+together, with one wait for whichever token arrives first. Appending tokens (a prompt, a tool result) cancels
+the running request; the next step submits a new one for the whole sequence.
+"""
+
+import asyncio
+import concurrent.futures
+import threading
+import time
+from abc import abstractmethod
+from typing import Awaitable, Callable, Optional
+
+from .session import InferenceBackend, InferenceSession
+
+
+class BackgroundLoop:
+    """An event loop running on a daemon thread."""
+
+    def __init__(self, name: str):
+        self.loop = asyncio.new_event_loop()
+        self._thread = threading.Thread(
+            target=self.loop.run_forever, name=name, daemon=True
+        )
+        self._thread.start()
+
+    def submit(self, coro) -> concurrent.futures.Future:
+        """Schedules ``coro`` on the loop and returns its future."""
+        return asyncio.run_coroutine_threadsafe(coro, self.loop)
+
+    def call(self, coro):
+        """Runs ``coro`` on the loop and blocks until it returns."""
+        return self.submit(coro).result()
+
+    def close(self, cleanup: Optional[Callable[[], Awaitable]] = None) -> None:
+        """Cancels the running requests, awaits ``cleanup`` and stops the loop."""
+
+        async def shutdown():
+            tasks = [t for t in asyncio.all_tasks() if t is not asyncio.current_task()]
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+            if cleanup is not None:
+                await cleanup()
+
+        self.call(shutdown())
+        self.loop.call_soon_threadsafe(self.loop.stop)
+        self._thread.join()
+        self.loop.close()
+
+
+async def take(queues: list[asyncio.Queue], timeout: float) -> list[list]:
+    """
+    Waits up to ``timeout`` for an item in any of ``queues``, then drains what
+    is queued in each of them.
+    """
+    items = [[] for _ in queues]
+    if all(queue.empty() for queue in queues):
+        getters = [asyncio.ensure_future(queue.get()) for queue in queues]
+        await asyncio.wait(
+            getters, timeout=timeout, return_when=asyncio.FIRST_COMPLETED
+        )
+        # a cancelled get leaves its item in the queue
+        for getter in getters:
+            getter.cancel()
+        await asyncio.gather(*getters, return_exceptions=True)
+        for received, getter in zip(items, getters):
+            if not getter.cancelled():
+                received.append(getter.result())
+    for received, queue in zip(items, queues):
+        while not queue.empty():
+            received.append(queue.get_nowait())
+    return items
+
+
+class StreamingSession(InferenceSession):
+    # named in errors raised from the request
+    source = "stream"
+    # max time a step blocks waiting for a token
+    wait_s = 0.250
+
+    def __init__(self, loop: BackgroundLoop, temperature: float):
+        self.loop = loop
+        self.temperature = temperature
+        self.tokens: list[int] = []
+        self.num_generated = 0
+        self._queue: Optional[asyncio.Queue] = None
+        self._request: Optional[concurrent.futures.Future] = None
+        self._received = False
+        self._last_progress = 0.0
+
+    @abstractmethod
+    async def generate(self, tokens: list[int], queue: asyncio.Queue) -> None:
+        """
+        Streams the continuation of ``tokens`` into ``queue``. Errors are put
+        into the queue rather than raised. Runs on the background loop.
+        """
+
+    def on_idle(self, idle_s: float, received: bool) -> list[int]:
+        """
+        Called when a step found no tokens, ``idle_s`` after the request
+        started or last produced one. Returns the tokens to end the sequence
+        with, or none to keep waiting.
+        """
+        return []
+
+    def append(self, tokens: list[int]) -> None:
+        self.tokens.extend(tokens)
+        # the sequence changed under the running request, if any
+        self._cancel()
+
+    def _cancel(self) -> None:
+        if self._request is not None:
+            self._request.cancel()
+            self._request = None
+            self._queue = None
+
+    def _start(self) -> None:
+        self._queue = asyncio.Queue()
+        self._request = self.loop.submit(self.generate(list(self.tokens), self._queue))
+        self._received = False
+        self._last_progress = time.monotonic()
+
+    def step(self) -> list[int]:
+        return step_sessions([self])[0]
+
+    def _pending_queue(self) -> asyncio.Queue:
+        if self._request is None:
+            self._start()
+        return self._queue
+
+    def _receive(self, items: list) -> list[int]:
+        for item in items:
+            if isinstance(item, BaseException):
+                self._cancel()
+                raise RuntimeError(f"{self.source} stream error: {item!r}") from item
+        now = time.monotonic()
+        if items:
+            self._received = True
+            self._last_progress = now
+        else:
+            items = self.on_idle(now - self._last_progress, self._received)
+            if not items:
+                # nothing yet; the engine steps this session again
+                return []
+            self._cancel()
+        self.tokens.extend(items)
+        self.num_generated += len(items)
+        return items
+
+    def close(self) -> None:
+        self._cancel()
+
+
+def step_sessions(sessions: list[StreamingSession]) -> list[list[int]]:
+    """
+    Steps sessions that share a loop. Sessions that are still waiting for a
+    token return none, after at most one ``wait_s`` for the whole batch.
+    """
+    queues = [session._pending_queue() for session in sessions]
+    wait_s = min(session.wait_s for session in sessions)
+    items = sessions[0].loop.call(take(queues, wait_s))
+    return [session._receive(got) for session, got in zip(sessions, items)]
+
+
+class StreamingBackend(InferenceBackend):
+    """A backend whose sessions are ``StreamingSession``s on one loop."""
+
+    def step_sessions(self, sessions: list[StreamingSession]) -> list[list[int]]:
+        return step_sessions(sessions)
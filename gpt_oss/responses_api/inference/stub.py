@@ -1,5 +1,6 @@
 import time
-from typing import Callable
+
+from .session import InferenceBackend, InferenceSession
 
 fake_tokens = [
     200005,
@@ -124,19 +125,37 @@ fake_tokens = [
 #     198,
 # ]
 
-token_queue = fake_tokens.copy()
+STEP_DELAY_S = 0.1
+
+
+class StubSession(InferenceSession):
+    """Replays ``fake_tokens`` regardless of the prompt."""
+
+    def __init__(self):
+        self.position = 0
+
+    def append(self, tokens: list[int]) -> None:
+        pass
+
+    def step(self) -> list[int]:
+        next_tok = fake_tokens[self.position]
+        self.position = (self.position + 1) % len(fake_tokens)
+        time.sleep(STEP_DELAY_S)
+        return [next_tok]
+
+    def fork(self) -> "StubSession":
+        forked = StubSession()
+        forked.position = self.position
+        return forked
+
 
+class StubBackend(InferenceBackend):
+    max_batch_size = 64
+    supports_fork = True
 
-def stub_infer_next_token(
-    tokens: list[int], temperature: float = 0.0, new_request: bool = False
-) -> int:
-    global token_queue
-    next_tok = token_queue.pop(0)
-    if len(token_queue) == 0:
-        token_queue = fake_tokens.copy()
-    time.sleep(0.1)
-    return next_tok
+    def open_session(self, temperature: float = 0.0) -> StubSession:
+        return StubSession()
 
 
-def setup_model(_checkpoint: str) -> Callable[[list[int], float], int]:
-    return stub_infer_next_token
+def setup_model(_checkpoint: str) -> StubBackend:
+    return StubBackend()
@@ -0,0 +1,35 @@
+"""
+NOTE: this runs the reference PyTorch implementation without a KV cache, so
+every token re-runs the whole sequence. It is meant for debugging and
+profiling on machines without a GPU, not for serving.
+"""
+
+import torch
+
+from gpt_oss.torch.model import Transformer
+
+from .session import InferNextTokenBackend
+
+DEFAULT_TEMPERATURE = 0.0
+
+
+def get_infer_next_token(model: Transformer, device: torch.device):
+    @torch.inference_mode()
+    def infer_next_token(
+        tokens: list[int],
+        temperature: float = DEFAULT_TEMPERATURE,
+        new_request: bool = False,  # kept for interface compatibility; unused here
+    ) -> int:
+        logits = model(torch.as_tensor(tokens, dtype=torch.int32, device=device))[-1]
+        if temperature == 0.0:
+            return torch.argmax(logits, dim=-1).item()
+        probs = torch.softmax(logits * (1.0 / temperature), dim=-1)
+        return torch.multinomial(probs, num_samples=1).item()
+
+    return infer_next_token
+
+
+def setup_model(checkpoint: str) -> InferNextTokenBackend:
+    device = torch.device("cuda" if torch.cuda.is_available() else "cpu")
+    model = Transformer.from_checkpoint(checkpoint, device=device)
+    return InferNextTokenBackend(get_infer_next_token(model, device))
@@ -1,19 +1,26 @@
 """
-NOTE: this is not the most efficient way to use transformers. It's a simple implementation that infers
-one token at a time to mimic the behavior of the Triton implementation.
+Local inference with the transformers Auto API.
+
+Each session keeps the ``past_key_values`` of the tokens it has fed to the
+model, so a step only runs the tokens appended since the last one: the
+sampled token, a prompt or a tool result. If the sequence no longer starts
+with the cached tokens, the cache is cropped to their longest common prefix.
+Fingerprints of both sequences tell whether it does in O(1).
 """
 
+import copy
 import os
-from typing import Callable, List
 
-# Transformers imports
-from transformers import AutoModelForCausalLM, PreTrainedModel
 import torch
+from transformers import AutoModelForCausalLM, DynamicCache, PreTrainedModel
 
+from .fingerprint import TokenFingerprint
+from .session import InferenceBackend, InferenceSession
 
 DEFAULT_TEMPERATURE = 0.0
 TP = os.environ.get("TP", 2)
 
+
 def load_model(checkpoint: str):
     """
     Serve the model directly with the Auto API.
@@ -28,29 +35,76 @@ def load_model(checkpoint: str):
     return model
 
 
-def get_infer_next_token(model: PreTrainedModel):
-    """
-    Return a callable with the same shape as the original triton implementation:
-      infer_next_token(tokens: List[int], temperature: float, new_request: bool) -> int
+def sample(logits: torch.Tensor, temperature: float) -> int:
+    if temperature == 0:
+        return int(torch.argmax(logits))
+    probs = torch.softmax(logits.float() / temperature, dim=-1)
+    return int(torch.multinomial(probs, num_samples=1))
 
-    Implementation detail:
-      - We issue a single-token generation with using model.generate
-      - generate handles sampling (temperature=0 => greedy, otherwise, sampling).
-    """
 
-    def infer_next_token(
-        tokens: List[int],
-        temperature: float = DEFAULT_TEMPERATURE,
-        new_request: bool = False, # kept for interface compatibility; unused here
-    ) -> int:
-        tokens = torch.tensor([tokens], dtype=torch.int64, device=model.device)
-        output = model.generate(tokens, max_new_tokens=1, do_sample=temperature != 0, temperature=temperature)
-        return output[0, -1].tolist()
+class TransformersSession(InferenceSession):
+    def __init__(self, backend: "TransformersBackend", temperature: float):
+        self.backend = backend
+        self.temperature = temperature
+        self.tokens: list[int] = []
+        self.fingerprint = TokenFingerprint()
+        self.cache = DynamicCache()
+        # tokens whose keys and values are in the cache
+        self.cached = TokenFingerprint()
+
+    def append(self, tokens: list[int]) -> None:
+        self.tokens.extend(tokens)
+        self.fingerprint.extend(tokens)
+
+    @torch.inference_mode()
+    def step(self) -> list[int]:
+        n = self.cached.common_prefix_length(self.fingerprint)
+        # the last token is always fed to get the logits that follow it
+        n = min(n, len(self.tokens) - 1)
+        if n < len(self.cached):
+            self.cache.crop(n)
+            self.cached.truncate(n)
+        new_tokens = self.tokens[n:]
+        model = self.backend.model
+        input_ids = torch.tensor([new_tokens], dtype=torch.int64, device=model.device)
+        output = model(input_ids=input_ids, past_key_values=self.cache, use_cache=True)
+        self.cache = output.past_key_values
+        self.cached.extend(new_tokens)
+        next_tok = sample(output.logits[0, -1], self.temperature)
+        self.tokens.append(next_tok)
+        self.fingerprint.extend([next_tok])
+        return [next_tok]
+
+    def fork(self) -> "TransformersSession":
+        forked = TransformersSession(self.backend, self.temperature)
+        forked.tokens = list(self.tokens)
+        forked.fingerprint = self.fingerprint.copy()
+        forked.cache = copy.deepcopy(self.cache)
+        forked.cached = self.cached.copy()
+        return forked
+
+    def close(self) -> None:
+        self.cache = None
+        self.cached.truncate(0)
+
+
+class TransformersBackend(InferenceBackend):
+    """Sessions run on one model, each with its own KV cache."""
+
+    # every session steps on its own cache, so batching them only costs memory
+    max_batch_size = 4
+    supports_fork = True
+
+    def __init__(self, model: PreTrainedModel):
+        self.model = model
 
-    return infer_next_token
+    def open_session(
+        self, temperature: float = DEFAULT_TEMPERATURE
+    ) -> TransformersSession:
+        return TransformersSession(self, temperature)
 
 
-def setup_model(checkpoint: str) -> Callable[[List[int], float, bool], int]:
+def setup_model(checkpoint: str) -> TransformersBackend:
     model = load_model(checkpoint)
-    infer_next_token = get_infer_next_token(model)
-    return infer_next_token
+    model.eval()
+    return TransformersBackend(model)
@@ -8,9 +8,23 @@ import torch.distributed as dist
 
 from gpt_oss.triton.model import Cache, ModelConfig, Transformer
 
+from ..kv_hibernation import KVHibernationStore, prefix_block_hashes
+from ..prefix_cache import RadixPrefixCache
+from .fingerprint import TokenFingerprint
+from .kv_reuse import KVCacheSync
+from .session import InferenceBackend, InferenceSession
+
 DEFAULT_TEMPERATURE = 0.0
 CONTEXT = 16_384
 CONCURRENT_SESSIONS = 1
+# KV entries kept around for prefix reuse across sessions (shared system and
+# developer prompts, other users' conversations).
+PREFIX_CACHE_TOKENS = int(os.environ.get("PREFIX_CACHE_TOKENS", 32_768))
+PREFIX_CACHE_BLOCK_SIZE = 64
+# Blocks evicted from the prefix cache are spilled to this directory (if set) so
+# idle conversations can be restored from disk instead of being prefilled again.
+KV_HIBERNATION_DIR = os.environ.get("KV_HIBERNATION_DIR")
+KV_HIBERNATION_BYTES = int(os.environ.get("KV_HIBERNATION_BYTES", 16 * 2**30))
 
 rank = int(
     os.environ.get("RANK", 0)
@@ -31,6 +45,80 @@ def load_model(checkpoint: str):
     return model, device
 
 
+class KVBlockPool:
+    """Fixed-size pool of KV blocks that can be copied into and out of a Cache."""
+
+    def __init__(
+        self,
+        num_layers: int,
+        num_blocks: int,
+        block_size: int,
+        n_kv_heads: int,
+        d_head: int = 64,
+        device: torch.device | None = None,
+    ):
+        self.block_size = block_size
+        shape = (num_blocks, block_size, n_kv_heads, d_head)
+        self.k = [
+            torch.zeros(shape, dtype=torch.bfloat16, device=device)
+            for _ in range(num_layers)
+        ]
+        self.v = [
+            torch.zeros(shape, dtype=torch.bfloat16, device=device)
+            for _ in range(num_layers)
+        ]
+
+    def _positions(self, start: int, num_blocks: int, device) -> torch.Tensor:
+        return torch.arange(
+            start, start + num_blocks * self.block_size, device=device, dtype=torch.long
+        )
+
+    def save(self, caches: list[Cache], start: int, block_ids: list[int]):
+        """Copy the cache entries starting at token ``start`` into ``block_ids``."""
+        ids = torch.as_tensor(block_ids, dtype=torch.long, device=self.k[0].device)
+        idx = self._positions(start, len(block_ids), caches[0].k.device)
+        for layer, cache in enumerate(caches):
+            for pool, src in ((self.k[layer], cache.k), (self.v[layer], cache.v)):
+                blocks = (
+                    src[0]
+                    .index_select(0, idx)
+                    .view(len(block_ids), self.block_size, *src.shape[2:])
+                )
+                pool.index_copy_(0, ids, blocks)
+
+    def load(self, caches: list[Cache], start: int, block_ids: list[int]):
+        """Copy ``block_ids`` into the cache entries starting at token ``start``."""
+        ids = torch.as_tensor(block_ids, dtype=torch.long, device=self.k[0].device)
+        idx = self._positions(start, len(block_ids), caches[0].k.device)
+        for layer, cache in enumerate(caches):
+            for pool, dst in ((self.k[layer], cache.k), (self.v[layer], cache.v)):
+                blocks = pool.index_select(0, ids).view(-1, *dst.shape[2:])
+                dst[0].index_copy_(0, idx, blocks)
+
+    @property
+    def block_nbytes(self) -> int:
+        return 2 * len(self.k) * self.k[0][0].numel() * self.k[0].element_size()
+
+    def _as_blocks(self, buffer: memoryview) -> torch.Tensor:
+        return torch.frombuffer(buffer, dtype=torch.bfloat16).view(
+            2, len(self.k), *self.k[0].shape[1:]
+        )
+
+    def spill(self, block_id: int, buffer: memoryview):
+        """Serialize a pool block into ``buffer`` (host memory)."""
+        out = self._as_blocks(buffer)
+        out[0].copy_(torch.stack([k[block_id] for k in self.k]))
+        out[1].copy_(torch.stack([v[block_id] for v in self.v]))
+
+    def restore(self, caches: list[Cache], start: int, buffer: memoryview):
+        """Copy a block serialized by ``spill`` into the cache at token ``start``."""
+        blocks = self._as_blocks(buffer)
+        end = start + self.block_size
+        for layer, cache in enumerate(caches):
+            cache.k[0, start:end].copy_(blocks[0, layer], non_blocking=False)
+            cache.v[0, start:end].copy_(blocks[1, layer], non_blocking=False)
+
+
 def get_infer_next_token(model, device):
     caches = [
         Cache(CONCURRENT_SESSIONS, CONTEXT, model.config.num_key_value_heads)
@@ -40,20 +128,40 @@ def get_infer_next_token(model, device):
     input_token = torch.zeros(
         1, dtype=torch.int32, device=device
     )  # add concurrent sessions support
-    tokens_so_far = []
+
+    block_size = PREFIX_CACHE_BLOCK_SIZE
+    kv_pool = KVBlockPool(
+        len(model.block),
+        PREFIX_CACHE_TOKENS // block_size,
+        block_size,
+        model.config.num_key_value_heads,
+        device=device,
+    )
+    hibernation = None
+    if KV_HIBERNATION_DIR:
+        hibernation = KVHibernationStore(
+            os.path.join(KV_HIBERNATION_DIR, f"kv-rank{rank}.bin"),
+            kv_pool.block_nbytes,
+            KV_HIBERNATION_BYTES,
+        )
+
+    def hibernate(prefix: list[int], block_ids: list[int]):
+        hashes = prefix_block_hashes(prefix, block_size)[-len(block_ids) :]
+        for prefix_hash, block_id in zip(hashes, block_ids):
+            kv_pool.spill(block_id, hibernation.put(prefix_hash))
+
+    prefix_cache = RadixPrefixCache(
+        block_size,
+        PREFIX_CACHE_TOKENS // block_size,
+        on_evict=hibernate if hibernation is not None else None,
+    )
+    sync = KVCacheSync(caches, kv_pool, prefix_cache, hibernation)
 
     model.prefill(torch.zeros(1, 4, dtype=torch.int32, device=device), caches)
     graph = torch.cuda.CUDAGraph()
     with torch.cuda.graph(graph):
         logits = model(input_token[None, :], caches=caches)[0]
 
-    def lcp(cache: list[int], inp: list[int]) -> list[int]:
-        i = 0
-        max_len = min(len(cache), len(inp))
-        while i < max_len and cache[i] == inp[i]:
-            i += 1
-        return cache[:i]
-
     def sample_next_token(
         logits: torch.Tensor, temperature: float = DEFAULT_TEMPERATURE
     ) -> int:
@@ -68,13 +176,15 @@ def get_infer_next_token(model, device):
         tokens: list[int],
         temperature: float = DEFAULT_TEMPERATURE,
         new_request: bool = False,
+        fingerprint: TokenFingerprint | None = None,
     ) -> int:
-        nonlocal tokens_so_far
-        tokens_so_far = lcp(tokens_so_far, tokens)
-        for cache in caches:
-            cache.truncate(len(tokens_so_far))
+        """
+        ``fingerprint`` is the caller's fingerprint of ``tokens``. If it extends
+        the cached sequence, the O(n) prefix comparison is skipped.
+        """
+        overlap = sync.sync(tokens, new_request, fingerprint)
         all_tokens = tokens  # for pdb
-        tokens = tokens[len(tokens_so_far) :]
+        tokens = tokens[overlap:]
 
         if len(tokens) > 1:
             model.prefill(
@@ -87,16 +197,76 @@ def get_infer_next_token(model, device):
 
         input_token[-1] = tokens[-1]
         graph.replay()
+        sync.extend(tokens)
 
         # decide next token on rank‑0
         next_tok = sample_next_token(logits, temperature=temperature)
 
         return next_tok
 
+    infer_next_token.prefix_cache = prefix_cache
+    infer_next_token.hibernation = hibernation
     return infer_next_token
 
 
-def setup_model(checkpoint: str) -> Callable[[list[int], float], int]:
+class TritonSession(InferenceSession):
+    def __init__(self, backend: "TritonBackend", temperature: float):
+        self.backend = backend
+        self.temperature = temperature
+        self.tokens: list[int] = []
+        self.fingerprint = TokenFingerprint()
+        self.new_request = True
+
+    def append(self, tokens: list[int]) -> None:
+        self.tokens.extend(tokens)
+        self.fingerprint.extend(tokens)
+        self.new_request = True
+
+    def step(self) -> list[int]:
+        # while the KV cache holds a prefix of this session's tokens, which
+        # the fingerprints tell in O(1), only the delta is fed
+        next_tok = self.backend.infer_next_token(
+            self.tokens,
+            temperature=self.temperature,
+            new_request=self.new_request,
+            fingerprint=self.fingerprint,
+        )
+        if self.new_request and not self.cached_tokens:
+            self.cached_tokens = (
+                self.backend.infer_next_token.prefix_cache.last_hit_tokens
+            )
+        self.new_request = False
+        self.tokens.append(next_tok)
+        self.fingerprint.extend([next_tok])
+        return [next_tok]
+
+    def fork(self) -> "TritonSession":
+        # the KV cache is not copied: the fork resyncs through the prefix
+        # cache, which holds the shared prefix after the first of them steps
+        forked = TritonSession(self.backend, self.temperature)
+        forked.tokens = list(self.tokens)
+        forked.fingerprint = self.fingerprint.copy()
+        return forked
+
+
+class TritonBackend(InferenceBackend):
+    """Sessions share one KV cache; switching sessions resyncs via the prefix cache."""
+
+    max_batch_size = CONCURRENT_SESSIONS
+    supports_fork = True
+
+    def __init__(self, infer_next_token: Callable[..., int]):
+        self.infer_next_token = infer_next_token
+
+    def open_session(self, temperature: float = DEFAULT_TEMPERATURE) -> TritonSession:
+        return TritonSession(self, temperature)
+
+    def kv_cache_usage(self) -> float:
+        prefix_cache = self.infer_next_token.prefix_cache
+        return prefix_cache.used_blocks / prefix_cache.num_blocks
+
+
+def setup_model(checkpoint: str) -> TritonBackend:
     model, device = load_model(checkpoint)
     infer_next_token = get_infer_next_token(model, device)
-    return infer_next_token
+    return TritonBackend(infer_next_token)
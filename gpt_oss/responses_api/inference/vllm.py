@@ -1,84 +1,144 @@
 """
-NOTE: this is not the most efficient way to use vLLM. It's a simple implementation that infers 
-one token at a time to mimic the behavior of the Triton implementation. 
+Streams tokens out of vLLM's async engine.
+
+Every turn of a response is one vLLM request with the harmony stop tokens and
+the remaining ``max_output_tokens`` budget, so vLLM schedules it with
+continuous batching alongside all other requests. Tool results restart the
+request for the whole sequence, and vLLM's prefix cache picks up the prefix it
+has already computed.
 """
 
+import asyncio
 import os
-from typing import Callable, List, Optional
+import uuid
+from typing import Any, Callable
 
-# vLLM imports
-from vllm import LLM, SamplingParams
-from vllm.inputs import TokensPrompt
+from .streaming import BackgroundLoop, StreamingBackend, StreamingSession
 
 DEFAULT_TEMPERATURE = 0.0
 TP = os.environ.get("TP", 2)
 
-def load_model(checkpoint: str):
+
+class VLLMSession(StreamingSession):
+    source = "vLLM"
+    # vLLM produces tokens at engine-step pace, so never wait long
+    wait_s = 0.05
+
+    def __init__(self, backend: "VLLMBackend", temperature: float):
+        super().__init__(backend.loop, temperature)
+        self.backend = backend
+
+    async def generate(self, tokens: list[int], queue: asyncio.Queue) -> None:
+        max_tokens = None
+        if self.max_tokens is not None:
+            max_tokens = max(1, self.max_tokens - self.num_generated)
+        params = self.backend.sampling_params(
+            temperature=float(self.temperature),
+            max_tokens=max_tokens,
+            n=1,
+            stop_token_ids=list(self.backend.stop_tokens),
+        )
+        request_id = f"gpt-oss-{uuid.uuid4().hex}"
+        emitted = 0
+        try:
+            # cancelling this task closes the generator, which aborts the
+            # request in vLLM
+            async for output in self.backend.engine.generate(
+                {"prompt_token_ids": tokens}, params, request_id
+            ):
+                if emitted == 0 and getattr(output, "num_cached_tokens", None):
+                    self.cached_tokens = output.num_cached_tokens
+                completion = output.outputs[0]
+                for token in completion.token_ids[emitted:]:
+                    queue.put_nowait(int(token))
+                emitted = len(completion.token_ids)
+                if not output.finished:
+                    continue
+                last = completion.token_ids[-1] if completion.token_ids else None
+                if last in self.backend.stop_tokens:
+                    return
+                # depending on the version, the stop token is left out of
+                # the output and only reported as the stop reason
+                if completion.stop_reason in self.backend.stop_tokens:
+                    queue.put_nowait(int(completion.stop_reason))
+                    return
+                if max_tokens is not None and emitted >= max_tokens:
+                    return
+                raise RuntimeError(
+                    f"request finished without a stop token "
+                    f"({completion.finish_reason}), the context may be full"
+                )
+            raise RuntimeError("stream ended before the request finished")
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            queue.put_nowait(e)
+
+    def fork(self) -> "VLLMSession":
+        # the forked request shares the prefix through vLLM's prefix cache
+        forked = VLLMSession(self.backend, self.temperature)
+        forked.tokens = list(self.tokens)
+        return forked
+
+
+class VLLMBackend(StreamingBackend):
     """
-    Create the vLLM engine. We enable prefix caching so repeated prefixes
-    across calls can reuse KV cache for faster prefill.
+    ``engine`` needs the ``generate(prompt, sampling_params, request_id)``
+    async generator of vLLM's ``AsyncLLMEngine``; ``engine_factory`` is called
+    on the backend's event loop, where vLLM runs its output handling.
     """
 
-    llm = LLM(
+    # vLLM batches the requests itself; a step only drains arrived tokens,
+    # waiting once for the whole batch
+    max_batch_size = 256
+    supports_fork = True
+
+    def __init__(
+        self,
+        engine_factory: Callable[[], Any],
+        stop_tokens: list[int],
+        sampling_params: Callable[..., Any],
+    ):
+        self.stop_tokens = frozenset(stop_tokens)
+        self.sampling_params = sampling_params
+        self.loop = BackgroundLoop("vllm-engine")
+
+        async def create_engine():
+            return engine_factory()
+
+        self.engine = self.loop.call(create_engine())
+
+    def open_session(self, temperature: float = DEFAULT_TEMPERATURE) -> VLLMSession:
+        return VLLMSession(self, temperature)
+
+    def close(self) -> None:
+        async def shutdown_engine():
+            # AsyncLLMEngine stops its background loop, the V1 AsyncLLM its
+            # engine core
+            for name in ("shutdown_background_loop", "shutdown"):
+                shutdown = getattr(self.engine, name, None)
+                if shutdown is not None:
+                    shutdown()
+                    return
+
+        self.loop.close(shutdown_engine)
+
+
+def setup_model(checkpoint: str) -> VLLMBackend:
+    from openai_harmony import HarmonyEncodingName, load_harmony_encoding
+    from vllm import SamplingParams
+    from vllm.engine.arg_utils import AsyncEngineArgs
+    from vllm.engine.async_llm_engine import AsyncLLMEngine
+
+    encoding = load_harmony_encoding(HarmonyEncodingName.HARMONY_GPT_OSS)
+    engine_args = AsyncEngineArgs(
         model=checkpoint,
-        tensor_parallel_size=TP,          # set >1 if you want TP across GPUs
-        enable_prefix_caching=True,      # reuse KV for shared prefixes
-        disable_log_stats=True,        # uncomment to quiet logs
+        tensor_parallel_size=int(TP),
+        enable_prefix_caching=True,  # reuse KV for shared prefixes
+        disable_log_stats=True,
+    )
+    return VLLMBackend(
+        lambda: AsyncLLMEngine.from_engine_args(engine_args),
+        encoding.stop_tokens_for_assistant_actions(),
+        SamplingParams,
     )
-
-    return llm
-
-
-def get_infer_next_token(llm: LLM):
-    """
-    Return a callable with the same shape as your original:
-      infer_next_token(tokens: List[int], temperature: float, new_request: bool) -> int
-
-    Implementation detail:
-      - We issue a single-token generation with TokensPrompt(prompt_token_ids=tokens).
-      - vLLM handles sampling (temperature=0 => greedy).
-      - With enable_prefix_caching=True, the shared prefix prefill can be reused
-        across calls that share the same prefix.
-    """
-
-    # Maintain compatibility with your previous closure signature.
-    def infer_next_token(
-        tokens: List[int],
-        temperature: float = DEFAULT_TEMPERATURE,
-        new_request: bool = False,  # kept for interface compatibility; unused here
-    ) -> int:
-        if not tokens:
-            raise ValueError("tokens must contain at least one input token id")
-
-        sampling = SamplingParams(
-            temperature=float(temperature),
-            max_tokens=1,            # we only want the next token
-            n=1,                     # single continuation
-            # You can expose/enable more controls here (top_p, top_k, etc.)
-        )
-
-        # Provide token IDs directly (no re-tokenization).
-        outputs = llm.generate(
-            TokensPrompt(prompt_token_ids=tokens),
-            sampling_params=sampling,
-        )
-
-        if not outputs or not outputs[0].outputs:
-            raise RuntimeError("vLLM returned empty outputs")
-
-        gen = outputs[0].outputs[0]
-        if not gen.token_ids:
-            # If the model immediately finished (e.g., EOS), decide how you'd like
-            # to signal that. Here we raise; you could also return an EOS id.
-            raise RuntimeError("No next token was generated (possibly EOS).")
-
-        next_tok = int(gen.token_ids[0])
-        return next_tok
-
-    return infer_next_token
-
-
-def setup_model(checkpoint: str) -> Callable[[List[int], float, bool], int]:
-    llm = load_model(checkpoint)
-    infer_next_token = get_infer_next_token(llm)
-    return infer_next_token
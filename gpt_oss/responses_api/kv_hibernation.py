@@ -0,0 +1,113 @@
+"""
+Disk tier for KV cache blocks evicted from the in-memory prefix cache.
+
+Blocks are stored in a single mmap-backed slab file with one fixed-size slot
+per block. Slots are addressed by a chained hash of the block-aligned token
+prefix that ends with the block, so a conversation that went idle can be
+restored block by block on its next turn without re-prefilling it.
+"""
+
+import hashlib
+import mmap
+import os
+from array import array
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Optional, Sequence
+
+
+def prefix_block_hashes(tokens: Sequence[int], block_size: int) -> list[bytes]:
+    """Return one chained hash per full block of ``tokens``."""
+    hashes = []
+    digest = b""
+    for start in range(0, len(tokens) // block_size * block_size, block_size):
+        h = hashlib.blake2b(digest, digest_size=16)
+        h.update(array("I", tokens[start : start + block_size]).tobytes())
+        digest = h.digest()
+        hashes.append(digest)
+    return hashes
+
+
+@dataclass
+class HibernationStats:
+    spilled_blocks: int = 0
+    restored_blocks: int = 0
+    evicted_blocks: int = 0
+    misses: int = 0
+
+
+class KVHibernationStore:
+    """
+    Fixed-budget, LRU-evicted store of KV blocks in a memory-mapped file.
+
+    ``block_nbytes`` is the serialized size of a single block and
+    ``max_bytes`` bounds the size of the slab file on disk.
+    """
+
+    def __init__(self, path: str, block_nbytes: int, max_bytes: int):
+        self.path = path
+        self.block_nbytes = block_nbytes
+        self.num_slots = max_bytes // block_nbytes
+        if self.num_slots <= 0:
+            raise ValueError(
+                f"max_bytes={max_bytes} is too small for blocks of {block_nbytes} bytes"
+            )
+        self.stats = HibernationStats()
+        self._index: OrderedDict[bytes, int] = OrderedDict()
+        self._free_slots = list(range(self.num_slots - 1, -1, -1))
+
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self._file = open(path, "w+b")
+        self._file.truncate(self.num_slots * block_nbytes)
+        self._mmap = mmap.mmap(self._file.fileno(), self.num_slots * block_nbytes)
+        self._view = memoryview(self._mmap)
+
+    def __len__(self) -> int:
+        return len(self._index)
+
+    def __contains__(self, prefix_hash: bytes) -> bool:
+        return prefix_hash in self._index
+
+    @property
+    def used_bytes(self) -> int:
+        return len(self._index) * self.block_nbytes
+
+    def _slot_view(self, slot: int) -> memoryview:
+        offset = slot * self.block_nbytes
+        return self._view[offset : offset + self.block_nbytes]
+
+    def put(self, prefix_hash: bytes) -> memoryview:
+        """
+        Reserve the slot for ``prefix_hash`` and return a writable view of it.
+        The caller fills the view with the serialized block.
+        """
+        slot = self._index.get(prefix_hash)
+        if slot is None:
+            if not self._free_slots:
+                _evicted_hash, evicted_slot = self._index.popitem(last=False)
+                self._free_slots.append(evicted_slot)
+                self.stats.evicted_blocks += 1
+            slot = self._free_slots.pop()
+            self._index[prefix_hash] = slot
+        self._index.move_to_end(prefix_hash)
+        self.stats.spilled_blocks += 1
+        return self._slot_view(slot)
+
+    def get(self, prefix_hash: bytes) -> Optional[memoryview]:
+        slot = self._index.get(prefix_hash)
+        if slot is None:
+            self.stats.misses += 1
+            return None
+        self._index.move_to_end(prefix_hash)
+        self.stats.restored_blocks += 1
+        return self._slot_view(slot)
+
+    def discard(self, prefix_hash: bytes) -> None:
+        slot = self._index.pop(prefix_hash, None)
+        if slot is not None:
+            self._free_slots.append(slot)
+
+    def close(self) -> None:
+        self._view.release()
+        self._mmap.close()
+        self._file.close()
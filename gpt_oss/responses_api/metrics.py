@@ -0,0 +1,152 @@
+"""
+Minimal Prometheus text-format metrics for the Responses API server.
+
+Histograms keep one counter per pre-defined bucket and are only updated from
+the event loop thread, so observing a value is a bisect and two additions with
+no locking. Gauges are evaluated lazily when ``/metrics`` is scraped.
+"""
+
+import bisect
+import math
+from typing import Callable, Iterable, Optional, Sequence
+
+# seconds, for latencies from sub-millisecond decode steps to long tool calls
+LATENCY_BUCKETS = (
+    0.001,
+    0.0025,
+    0.005,
+    0.01,
+    0.025,
+    0.05,
+    0.1,
+    0.25,
+    0.5,
+    1.0,
+    2.5,
+    5.0,
+    10.0,
+    30.0,
+    60.0,
+)
+# tokens per second
+THROUGHPUT_BUCKETS = (1, 5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000, 10000, 25000)
+
+
+def _format_value(value: float) -> str:
+    if value == math.inf:
+        return "+Inf"
+    return repr(float(value)) if not float(value).is_integer() else str(int(value))
+
+
+def _format_labels(labels: dict[str, str]) -> str:
+    if not labels:
+        return ""
+    inner = ",".join(f'{k}="{v}"' for k, v in labels.items())
+    return "{" + inner + "}"
+
+
+class Histogram:
+    def __init__(
+        self,
+        name: str,
+        documentation: str,
+        buckets: Sequence[float] = LATENCY_BUCKETS,
+        labels: Optional[dict[str, str]] = None,
+    ):
+        self.name = name
+        self.documentation = documentation
+        self.buckets = tuple(buckets)
+        self.labels = labels or {}
+        # counts[i] holds observations in (buckets[i-1], buckets[i]]; the last
+        # entry holds everything above the largest bucket
+        self.counts = [0] * (len(self.buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float) -> None:
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def samples(self) -> Iterable[str]:
+        cumulative = 0
+        for bound, count in zip((*self.buckets, math.inf), self.counts):
+            cumulative += count
+            labels = _format_labels({**self.labels, "le": _format_value(bound)})
+            yield f"{self.name}_bucket{labels} {cumulative}"
+        labels = _format_labels(self.labels)
+        yield f"{self.name}_sum{labels} {_format_value(self.sum)}"
+        yield f"{self.name}_count{labels} {self.count}"
+
+
+class LabeledHistogram:
+    """A histogram family with one child per value of a single label."""
+
+    def __init__(
+        self,
+        name: str,
+        documentation: str,
+        label: str,
+        buckets: Sequence[float] = LATENCY_BUCKETS,
+    ):
+        self.name = name
+        self.documentation = documentation
+        self.label = label
+        self.buckets = buckets
+        self.children: dict[str, Histogram] = {}
+
+    def labels(self, value: str) -> Histogram:
+        child = self.children.get(value)
+        if child is None:
+            child = Histogram(
+                self.name, self.documentation, self.buckets, {self.label: value}
+            )
+            self.children[value] = child
+        return child
+
+    def samples(self) -> Iterable[str]:
+        for child in self.children.values():
+            yield from child.samples()
+
+
+class Gauge:
+    """Reads its value from ``fn`` at scrape time; ``None`` omits the sample."""
+
+    def __init__(
+        self, name: str, documentation: str, fn: Callable[[], Optional[float]]
+    ):
+        self.name = name
+        self.documentation = documentation
+        self.fn = fn
+
+    def samples(self) -> Iterable[str]:
+        value = self.fn()
+        if value is not None:
+            yield f"{self.name} {_format_value(value)}"
+
+
+class Counter(Gauge):
+    """A monotonically increasing value read at scrape time."""
+
+
+class MetricsRegistry:
+    def __init__(self):
+        self.metrics: list = []
+
+    def register(self, metric):
+        self.metrics.append(metric)
+        return metric
+
+    def render(self) -> str:
+        lines = []
+        for metric in self.metrics:
+            kind = {
+                Histogram: "histogram",
+                LabeledHistogram: "histogram",
+                Counter: "counter",
+                Gauge: "gauge",
+            }[type(metric)]
+            lines.append(f"# HELP {metric.name} {metric.documentation}")
+            lines.append(f"# TYPE {metric.name} {kind}")
+            lines.extend(metric.samples())
+        return "\n".join(lines) + "\n"
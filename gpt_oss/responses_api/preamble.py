@@ -0,0 +1,161 @@
+"""
+Memoized rendering of the system and developer messages that open every
+conversation.
+
+The preamble only depends on the conversation date, the reasoning effort, the
+enabled built-in tools, the instructions and the function tools of a request.
+Agent frameworks resend the same (often large) tool schemas on every call, so
+the rendered tokens are cached under a hash of those inputs.
+"""
+
+import hashlib
+import json
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Optional, Sequence
+
+from openai_harmony import (
+    Conversation,
+    DeveloperContent,
+    HarmonyEncoding,
+    Message,
+    ReasoningEffort,
+    Role,
+    SystemContent,
+    ToolDescription,
+    ToolNamespaceConfig,
+)
+
+from .types import FunctionToolDefinition
+
+DEFAULT_MAX_ENTRIES = 256
+
+
+@dataclass
+class PreambleCacheStats:
+    hits: int = 0
+    misses: int = 0
+    evictions: int = 0
+
+    @property
+    def hit_ratio(self) -> float:
+        lookups = self.hits + self.misses
+        return self.hits / lookups if lookups else 0.0
+
+
+def build_preamble_messages(
+    conversation_start_date: str,
+    reasoning_effort: Optional[ReasoningEffort],
+    tool_configs: Sequence[ToolNamespaceConfig],
+    instructions: Optional[str],
+    tools: Sequence,
+) -> list[Message]:
+    """Builds the system message and, if needed, the developer message."""
+    system_message_content = SystemContent.new().with_conversation_start_date(
+        conversation_start_date
+    )
+    if reasoning_effort is not None:
+        system_message_content = system_message_content.with_reasoning_effort(
+            reasoning_effort
+        )
+    for tool_config in tool_configs:
+        system_message_content = system_message_content.with_tools(tool_config)
+
+    messages = [Message.from_role_and_content(Role.SYSTEM, system_message_content)]
+
+    if instructions or tools:
+        developer_message_content = DeveloperContent.new().with_instructions(
+            instructions
+        )
+
+        function_tools = [
+            ToolDescription.new(tool.name, tool.description, tool.parameters)
+            for tool in tools
+            if tool.type == "function"
+        ]
+        if function_tools:
+            developer_message_content = developer_message_content.with_function_tools(
+                function_tools
+            )
+
+        messages.append(
+            Message.from_role_and_content(Role.DEVELOPER, developer_message_content)
+        )
+    return messages
+
+
+class PreambleRenderer:
+    """LRU cache of rendered preambles, keyed by a hash of their inputs."""
+
+    def __init__(
+        self, encoding: HarmonyEncoding, max_entries: int = DEFAULT_MAX_ENTRIES
+    ):
+        self.encoding = encoding
+        self.max_entries = max_entries
+        self.stats = PreambleCacheStats()
+        self._cache: OrderedDict[bytes, tuple[int, ...]] = OrderedDict()
+
+    def __len__(self) -> int:
+        return len(self._cache)
+
+    @staticmethod
+    def key(
+        conversation_start_date: str,
+        reasoning_effort: Optional[ReasoningEffort],
+        tool_configs: Sequence[ToolNamespaceConfig],
+        instructions: Optional[str],
+        tools: Sequence,
+    ) -> bytes:
+        parts = [
+            conversation_start_date,
+            reasoning_effort.value if reasoning_effort is not None else None,
+            [config.model_dump(mode="json") for config in tool_configs],
+            instructions,
+            [
+                tool.model_dump(mode="json")
+                for tool in tools
+                if isinstance(tool, FunctionToolDefinition)
+            ],
+            # a developer message is rendered for built-in tools too
+            bool(tools),
+        ]
+        return hashlib.blake2b(
+            json.dumps(parts, ensure_ascii=False).encode(), digest_size=16
+        ).digest()
+
+    def render(
+        self,
+        conversation_start_date: str,
+        reasoning_effort: Optional[ReasoningEffort],
+        tool_configs: Sequence[ToolNamespaceConfig],
+        instructions: Optional[str],
+        tools: Sequence,
+    ) -> tuple[int, ...]:
+        """Returns the tokens of the rendered preamble messages."""
+        args = (
+            conversation_start_date,
+            reasoning_effort,
+            tool_configs,
+            instructions,
+            tools,
+        )
+        key = self.key(*args)
+        tokens = self._cache.get(key)
+        if tokens is not None:
+            self._cache.move_to_end(key)
+            self.stats.hits += 1
+            return tokens
+
+        self.stats.misses += 1
+        # rendered as a conversation: the system message depends on whether
+        # the developer message declares function tools
+        tokens = tuple(
+            self.encoding.render_conversation(
+                Conversation.from_messages(build_preamble_messages(*args))
+            )
+        )
+        self._cache[key] = tokens
+        if len(self._cache) > self.max_entries:
+            self._cache.popitem(last=False)
+            self.stats.evictions += 1
+        return tokens
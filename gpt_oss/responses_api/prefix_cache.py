@@ -0,0 +1,214 @@
+"""
+Radix tree over token sequences used to share KV cache blocks across sessions.
+
+The tree only stores block-aligned prefixes: every edge holds a multiple of
+``block_size`` tokens together with one KV block reference per ``block_size``
+tokens. What a block reference points to is up to the backend (for the triton
+backend it is a row index into a preallocated KV pool).
+"""
+
+import itertools
+from dataclasses import dataclass, field
+from typing import Callable, Optional, Sequence
+
+
+@dataclass
+class PrefixCacheStats:
+    lookups: int = 0
+    query_tokens: int = 0
+    hit_tokens: int = 0
+    inserted_blocks: int = 0
+    evicted_blocks: int = 0
+
+    @property
+    def hit_ratio(self) -> float:
+        if self.query_tokens == 0:
+            return 0.0
+        return self.hit_tokens / self.query_tokens
+
+
+@dataclass(eq=False)
+class _Node:
+    key: tuple[int, ...] = ()
+    blocks: list[int] = field(default_factory=list)
+    children: dict[tuple[int, ...], "_Node"] = field(default_factory=dict)
+    parent: Optional["_Node"] = None
+    last_access: int = 0
+
+
+class RadixPrefixCache:
+    """
+    Maps block-aligned token prefixes to KV block references with LRU eviction.
+
+    ``num_blocks`` is the memory budget: block ids are handed out from
+    ``range(num_blocks)`` and least recently used leaves are evicted when the
+    pool runs dry. ``on_evict`` is called with the full token prefix of every
+    evicted leaf and the block ids of its edge (covering the last
+    ``len(block_ids) * block_size`` tokens of that prefix) before the blocks
+    are reused.
+    """
+
+    def __init__(
+        self,
+        block_size: int,
+        num_blocks: int,
+        on_evict: Optional[Callable[[list[int], list[int]], None]] = None,
+    ):
+        if block_size <= 0:
+            raise ValueError("block_size must be positive")
+        self.block_size = block_size
+        self.num_blocks = num_blocks
+        self.on_evict = on_evict
+        self.stats = PrefixCacheStats()
+        self.last_hit_tokens = 0
+        self._root = _Node()
+        self._free_blocks = list(range(num_blocks - 1, -1, -1))
+        self._clock = itertools.count(1)
+
+    @property
+    def used_blocks(self) -> int:
+        return self.num_blocks - len(self._free_blocks)
+
+    @property
+    def cached_tokens(self) -> int:
+        return self.used_blocks * self.block_size
+
+    def _block_key(self, tokens: Sequence[int], start: int) -> tuple[int, ...]:
+        return tuple(tokens[start : start + self.block_size])
+
+    def _walk(self, tokens: Sequence[int]):
+        """Yield ``(node, matched_blocks_in_edge, position)`` along the match path."""
+        node = self._root
+        pos = 0
+        n_full = len(tokens) // self.block_size * self.block_size
+        while pos < n_full:
+            child = node.children.get(self._block_key(tokens, pos))
+            if child is None:
+                return
+            matched = 0
+            for i in range(0, len(child.key), self.block_size):
+                if pos + i + self.block_size > n_full or (
+                    tuple(tokens[pos + i : pos + i + self.block_size])
+                    != child.key[i : i + self.block_size]
+                ):
+                    break
+                matched += 1
+            yield child, matched, pos
+            if matched * self.block_size < len(child.key):
+                return
+            pos += len(child.key)
+            node = child
+
+    def match(self, tokens: Sequence[int]) -> tuple[int, list[int]]:
+        """
+        Return ``(num_tokens, block_ids)`` for the longest cached prefix of
+        ``tokens``. ``num_tokens`` is always a multiple of ``block_size``.
+        """
+        now = next(self._clock)
+        blocks: list[int] = []
+        for node, matched, _pos in self._walk(tokens):
+            node.last_access = now
+            blocks.extend(node.blocks[:matched])
+        num_tokens = len(blocks) * self.block_size
+        self.stats.lookups += 1
+        self.stats.query_tokens += len(tokens)
+        self.stats.hit_tokens += num_tokens
+        return num_tokens, blocks
+
+    def _split(self, node: _Node, num_blocks: int) -> _Node:
+        """Split ``node`` so that its first ``num_blocks`` blocks form a new parent."""
+        split_len = num_blocks * self.block_size
+        head = _Node(
+            key=node.key[:split_len],
+            blocks=node.blocks[:num_blocks],
+            parent=node.parent,
+            last_access=node.last_access,
+        )
+        node.parent.children[head.key[: self.block_size]] = head
+        node.key = node.key[split_len:]
+        node.blocks = node.blocks[num_blocks:]
+        node.parent = head
+        head.children[node.key[: self.block_size]] = node
+        return head
+
+    def insert(
+        self,
+        tokens: Sequence[int],
+        fill_blocks: Callable[[int, list[int]], None],
+    ) -> int:
+        """
+        Cache every full block of ``tokens`` that is not cached yet.
+
+        ``fill_blocks(start, block_ids)`` is called once with newly allocated
+        block ids that must be filled with the KV entries for the tokens starting
+        at ``start``. Returns the number of newly cached tokens.
+        """
+        now = next(self._clock)
+        node = self._root
+        pos = 0
+        for child, matched, child_pos in list(self._walk(tokens)):
+            child.last_access = now
+            if matched * self.block_size < len(child.key):
+                child = self._split(child, matched)
+            node = child
+            pos = child_pos + len(child.key)
+
+        n_full = len(tokens) // self.block_size * self.block_size
+        num_new = (n_full - pos) // self.block_size
+        if num_new == 0:
+            return 0
+        block_ids = self._allocate(num_new, protect=node)
+        if not block_ids:
+            return 0
+        end = pos + len(block_ids) * self.block_size
+        fill_blocks(pos, block_ids)
+        leaf = _Node(
+            key=tuple(tokens[pos:end]),
+            blocks=block_ids,
+            parent=node,
+            last_access=now,
+        )
+        node.children[leaf.key[: self.block_size]] = leaf
+        self.stats.inserted_blocks += len(block_ids)
+        return end - pos
+
+    def _prefix_of(self, node: _Node) -> list[int]:
+        keys = []
+        while node is not None and node is not self._root:
+            keys.append(node.key)
+            node = node.parent
+        return [t for key in reversed(keys) for t in key]
+
+    def _leaves(self, node: _Node):
+        for child in node.children.values():
+            if child.children:
+                yield from self._leaves(child)
+            else:
+                yield child
+
+    def _allocate(self, num_blocks: int, protect: Optional[_Node] = None) -> list[int]:
+        """Allocate up to ``num_blocks`` block ids, evicting LRU leaves if needed."""
+        protected = set()
+        while protect is not None:
+            protected.add(protect)
+            protect = protect.parent
+        while len(self._free_blocks) < num_blocks:
+            candidates = [
+                leaf for leaf in self._leaves(self._root) if leaf not in protected
+            ]
+            if not candidates:
+                break
+            self._evict(min(candidates, key=lambda leaf: leaf.last_access))
+        num_blocks = min(num_blocks, len(self._free_blocks))
+        return [self._free_blocks.pop() for _ in range(num_blocks)]
+
+    def _evict(self, leaf: _Node) -> None:
+        if self.on_evict is not None:
+            self.on_evict(self._prefix_of(leaf), list(leaf.blocks))
+        del leaf.parent.children[leaf.key[: self.block_size]]
+        self._free_blocks.extend(reversed(leaf.blocks))
+        self.stats.evicted_blocks += len(leaf.blocks)
+
+    def clear(self) -> None:
+        self._root = _Node()
+        self._free_blocks = list(range(self.num_blocks - 1, -1, -1))
@@ -0,0 +1,157 @@
+"""
+On-demand ``torch.profiler`` captures of the inference engine.
+
+The triton and torch models annotate their layers with ``record_function``
+("attn", "qkv", "mlp", "routing", ...). A capture starts the profiler on the
+engine's model thread, records the next N engine steps (or a time window),
+and writes a Chrome trace plus a per-region summary of those annotations.
+"""
+
+import asyncio
+import itertools
+import json
+import os
+import time
+from dataclasses import asdict, dataclass, field
+from typing import Any, Callable, Iterable, Optional
+
+from .engine import InferenceEngine
+
+DEFAULT_MAX_SECONDS = 60.0
+
+
+class ProfileInProgress(Exception):
+    """Raised when a capture is requested while another one is running."""
+
+
+@dataclass
+class ProfileResult:
+    trace_path: str
+    summary_path: str
+    steps: int
+    seconds: float
+    # aggregated record_function regions, most expensive first
+    regions: list[dict[str, Any]] = field(default_factory=list)
+
+
+def _is_region(event) -> bool:
+    is_user_annotation = getattr(event, "is_user_annotation", None)
+    if is_user_annotation is not None:
+        return is_user_annotation
+    # older torch versions do not flag annotations; skip ops and runtime calls
+    return "::" not in event.key and not event.key.startswith(("cuda", "Profiler"))
+
+
+def summarize_regions(events: Iterable) -> list[dict[str, Any]]:
+    """Aggregates ``key_averages()`` rows of the ``record_function`` regions."""
+    regions = []
+    for event in events:
+        if not _is_region(event):
+            continue
+        device_time = getattr(
+            event, "device_time_total", getattr(event, "cuda_time_total", 0.0)
+        )
+        regions.append(
+            {
+                "name": event.key,
+                "count": event.count,
+                "cpu_time_total_us": event.cpu_time_total,
+                "self_cpu_time_total_us": event.self_cpu_time_total,
+                "device_time_total_us": device_time,
+            }
+        )
+    regions.sort(
+        key=lambda region: (
+            region["device_time_total_us"],
+            region["cpu_time_total_us"],
+        ),
+        reverse=True,
+    )
+    return regions
+
+
+def _torch_profiler():
+    import torch
+    from torch.profiler import ProfilerActivity, profile
+
+    activities = [ProfilerActivity.CPU]
+    if torch.cuda.is_available():
+        activities.append(ProfilerActivity.CUDA)
+    return profile(activities=activities)
+
+
+class EngineProfiler:
+    """Runs one profiler capture at a time and writes it to ``output_dir``."""
+
+    def __init__(
+        self,
+        engine: InferenceEngine,
+        output_dir: str,
+        max_seconds: float = DEFAULT_MAX_SECONDS,
+        profiler_factory: Callable[[], Any] = _torch_profiler,
+    ):
+        self.engine = engine
+        self.output_dir = output_dir
+        self.max_seconds = max_seconds
+        self.profiler_factory = profiler_factory
+        self.running = False
+        self._ids = itertools.count()
+
+    async def capture(
+        self, steps: Optional[int] = None, seconds: Optional[float] = None
+    ) -> ProfileResult:
+        """
+        Profile the next ``steps`` engine steps, or ``seconds`` of wall time.
+        With both, stops at whichever comes first; either way a capture never
+        runs longer than ``max_seconds``.
+        """
+        if steps is None and seconds is None:
+            raise ValueError("a capture needs a number of steps or seconds")
+        if self.running:
+            raise ProfileInProgress()
+        self.running = True
+        try:
+            timeout = min(seconds or self.max_seconds, self.max_seconds)
+            profiler = self.profiler_factory()
+            start_steps = self.engine.stats.steps
+            start = time.monotonic()
+            # the profiler has to be started on the thread that runs the model
+            await self.engine.run_on_worker(profiler.start)
+            try:
+                if steps is not None:
+                    try:
+                        await asyncio.wait_for(
+                            self.engine.wait_for_steps(steps), timeout
+                        )
+                    except asyncio.TimeoutError:
+                        pass
+                else:
+                    await asyncio.sleep(timeout)
+            finally:
+                await self.engine.run_on_worker(profiler.stop)
+            captured_steps = self.engine.stats.steps - start_steps
+            elapsed = time.monotonic() - start
+            # exporting large traces takes a while; keep it off the event loop
+            return await asyncio.to_thread(
+                self._export, profiler, captured_steps, elapsed
+            )
+        finally:
+            self.running = False
+
+    def _export(self, profiler, steps: int, seconds: float) -> ProfileResult:
+        os.makedirs(self.output_dir, exist_ok=True)
+        stem = os.path.join(
+            self.output_dir,
+            time.strftime("profile-%Y%m%d-%H%M%S") + f"-{next(self._ids)}",
+        )
+        result = ProfileResult(
+            trace_path=f"{stem}.trace.json",
+            summary_path=f"{stem}.summary.json",
+            steps=steps,
+            seconds=seconds,
+        )
+        profiler.export_chrome_trace(result.trace_path)
+        result.regions = summarize_regions(profiler.key_averages())
+        with open(result.summary_path, "w") as f:
+            json.dump(asdict(result), f, indent=2)
+        return result
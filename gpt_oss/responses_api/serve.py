@@ -8,7 +8,28 @@ from openai_harmony import (
     load_harmony_encoding,
 )
 
+from gpt_oss.tools.python_docker.kernel import (
+    DEFAULT_IDLE_TIMEOUT_S,
+    DEFAULT_MAX_SESSIONS,
+    create_kernel_sessions,
+)
+from gpt_oss.tools.python_docker.sandbox import (
+    DEFAULT_MAX_USES,
+    DEFAULT_POOL_SIZE,
+    SANDBOX_BACKENDS,
+    create_sandbox_pool,
+)
+
+from .admission import DEFAULT_MAX_QUEUE_WAIT_S, DEFAULT_MAX_QUEUED, AdmissionController
 from .api_server import create_api_server
+from .inference import load_backend
+from .store import MemoryResponsesStore, SQLiteResponsesStore
+from .tool_executor import (
+    DEFAULT_MAX_CONCURRENCY,
+    DEFAULT_TIMEOUT_S,
+    ToolExecutor,
+    ToolLimits,
+)
 
 if __name__ == "__main__":
     parser = argparse.ArgumentParser(description="Responses API server")
@@ -35,24 +56,164 @@ if __name__ == "__main__":
         # default to metal on macOS, triton on other platforms
         default="metal" if __import__("platform").system() == "Darwin" else "triton",
     )
+    parser.add_argument(
+        "--responses-store",
+        metavar="PATH",
+        type=str,
+        help="SQLite file that keeps stored responses across restarts",
+        default=None,
+    )
+    parser.add_argument(
+        "--responses-ttl",
+        metavar="SECONDS",
+        type=float,
+        help="Forget stored responses after this many seconds",
+        default=None,
+    )
+    parser.add_argument(
+        "--profile-dir",
+        metavar="DIR",
+        type=str,
+        help="Enable POST /admin/profile and write profiler traces to DIR",
+        default=None,
+    )
+    parser.add_argument(
+        "--max-kv-tokens",
+        metavar="TOKENS",
+        type=int,
+        help="Queue requests once their prompt and max_output_tokens would "
+        "exceed this many KV cache tokens",
+        default=None,
+    )
+    parser.add_argument(
+        "--max-active-requests",
+        metavar="N",
+        type=int,
+        help="Queue requests once N requests are running",
+        default=None,
+    )
+    parser.add_argument(
+        "--max-queued-requests",
+        metavar="N",
+        type=int,
+        help="Reject requests with 429 once N requests are queued",
+        default=DEFAULT_MAX_QUEUED,
+    )
+    parser.add_argument(
+        "--max-queue-wait",
+        metavar="SECONDS",
+        type=float,
+        help="Reject queued requests with 429 after this many seconds",
+        default=DEFAULT_MAX_QUEUE_WAIT_S,
+    )
+    parser.add_argument(
+        "--tool-timeout",
+        metavar="SECONDS",
+        type=float,
+        help="Answer built-in tool calls that take longer with an error",
+        default=DEFAULT_TIMEOUT_S,
+    )
+    parser.add_argument(
+        "--max-concurrent-tool-calls",
+        metavar="N",
+        type=int,
+        help="Calls of each built-in tool that may run at once",
+        default=DEFAULT_MAX_CONCURRENCY,
+    )
+    parser.add_argument(
+        "--python-sandbox",
+        metavar="BACKEND",
+        type=str,
+        choices=sorted(SANDBOX_BACKENDS),
+        help="Where the python tool runs code: docker containers or local "
+        "subprocesses",
+        default="docker",
+    )
+    parser.add_argument(
+        "--python-sandbox-pool-size",
+        metavar="N",
+        type=int,
+        help="Python sandboxes kept started ahead of tool calls",
+        default=DEFAULT_POOL_SIZE,
+    )
+    parser.add_argument(
+        "--python-sandbox-max-uses",
+        metavar="N",
+        type=int,
+        help="Replace a python sandbox after it has run N scripts",
+        default=DEFAULT_MAX_USES,
+    )
+    parser.add_argument(
+        "--python-sessions",
+        action="store_true",
+        help="Keep the state of the python tool between calls of a "
+        "conversation, like a Jupyter notebook",
+        default=False,
+    )
+    parser.add_argument(
+        "--max-python-sessions",
+        metavar="N",
+        type=int,
+        help="Stateful python sessions kept alive at once",
+        default=DEFAULT_MAX_SESSIONS,
+    )
+    parser.add_argument(
+        "--python-session-idle-timeout",
+        metavar="SECONDS",
+        type=float,
+        help="Close a stateful python session after this long without calls",
+        default=DEFAULT_IDLE_TIMEOUT_S,
+    )
     args = parser.parse_args()
 
-    if args.inference_backend == "triton":
-        from .inference.triton import setup_model
-    elif args.inference_backend == "stub":
-        from .inference.stub import setup_model
-    elif args.inference_backend == "metal":
-        from .inference.metal import setup_model
-    elif args.inference_backend == "ollama":
-        from .inference.ollama import setup_model
-    elif args.inference_backend == "vllm":
-        from .inference.vllm import setup_model
-    elif args.inference_backend == "transformers":
-        from .inference.transformers import setup_model
+    encoding = load_harmony_encoding(HarmonyEncodingName.HARMONY_GPT_OSS)
+
+    if args.responses_store:
+        responses_store = SQLiteResponsesStore(
+            args.responses_store, ttl_seconds=args.responses_ttl
+        )
     else:
-        raise ValueError(f"Invalid inference backend: {args.inference_backend}")
+        responses_store = MemoryResponsesStore(ttl_seconds=args.responses_ttl)
 
-    encoding = load_harmony_encoding(HarmonyEncodingName.HARMONY_GPT_OSS)
+    admission = AdmissionController(
+        max_tokens=args.max_kv_tokens,
+        max_active=args.max_active_requests,
+        max_queued=args.max_queued_requests,
+        max_queue_wait_s=args.max_queue_wait,
+    )
 
-    infer_next_token = setup_model(args.checkpoint)
-    uvicorn.run(create_api_server(infer_next_token, encoding), port=args.port)
+    tool_executor = ToolExecutor(
+        default_limits=ToolLimits(
+            max_concurrency=args.max_concurrent_tool_calls,
+            timeout_s=args.tool_timeout,
+        )
+    )
+
+    sandbox_pool = create_sandbox_pool(
+        args.python_sandbox,
+        args.python_sandbox_pool_size,
+        args.python_sandbox_max_uses,
+    )
+
+    python_sessions = None
+    if args.python_sessions:
+        python_sessions = create_kernel_sessions(
+            args.python_sandbox,
+            args.max_python_sessions,
+            args.python_session_idle_timeout,
+        )
+
+    backend = load_backend(args.inference_backend, args.checkpoint)
+    uvicorn.run(
+        create_api_server(
+            backend,
+            encoding,
+            responses_store=responses_store,
+            profile_dir=args.profile_dir,
+            admission=admission,
+            tool_executor=tool_executor,
+            sandbox_pool=sandbox_pool,
+            python_sessions=python_sessions,
+        ),
+        port=args.port,
+    )
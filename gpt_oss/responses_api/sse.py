@@ -0,0 +1,113 @@
+"""
+Server-sent event framing for the Responses API stream.
+
+Text and reasoning deltas are by far the most frequent events. Instead of
+building and serializing a pydantic event per token, ``DeltaEmitter`` fills a
+pre-rendered JSON template and can coalesce consecutive deltas of the same
+content part into one event, flushing after a number of tokens or a time
+window. The frames are byte-identical to ``format_sse`` of the equivalent
+event model.
+"""
+
+import json
+import time
+from typing import Callable, Optional
+
+from .events import ResponseEvent
+
+DELTA_EVENT_TYPES = ("response.output_text.delta", "response.reasoning_text.delta")
+
+# fields that follow `delta` in the serialized event models
+_DELTA_SUFFIXES = {
+    "response.output_text.delta": ',"logprobs":[]}\n\n',
+    "response.reasoning_text.delta": "}\n\n",
+}
+
+
+def format_sse(event: ResponseEvent) -> str:
+    return f"event: {event.type}\ndata: {event.model_dump_json(indent=None)}\n\n"
+
+
+def _encode_string(value: str) -> str:
+    # matches pydantic's JSON output (UTF-8, no ASCII escaping)
+    return json.dumps(value, ensure_ascii=False)
+
+
+class DeltaEmitter:
+    """
+    Buffers delta events of one stream. ``add`` returns the frames that are
+    ready to be sent (possibly ""), ``flush`` returns whatever is buffered.
+
+    ``next_sequence_number`` is called once per emitted event so deltas share
+    the sequence numbering of the other events in the stream.
+    """
+
+    def __init__(
+        self,
+        next_sequence_number: Callable[[], int],
+        max_tokens: Optional[int] = 1,
+        max_delay_s: Optional[float] = None,
+        item_id: str = "item_1234",
+    ):
+        self.next_sequence_number = next_sequence_number
+        # flush once either limit is reached; None disables that limit
+        self.max_tokens = max_tokens
+        self.max_delay_s = max_delay_s
+        self.item_id = item_id
+        # (event type, output_index, content_index) of the buffered delta
+        self._key: Optional[tuple[str, int, int]] = None
+        self._parts: list[str] = []
+        self._first_at = 0.0
+        self._templates: dict[tuple[str, int, int], tuple[str, str]] = {}
+
+    def _template(self, key: tuple[str, int, int]) -> tuple[str, str]:
+        template = self._templates.get(key)
+        if template is None:
+            event_type, output_index, content_index = key
+            template = (
+                f'event: {event_type}\ndata: {{"sequence_number":',
+                f',"type":"{event_type}","item_id":{_encode_string(self.item_id)}'
+                f',"output_index":{output_index},"content_index":{content_index}'
+                ',"delta":',
+            )
+            self._templates[key] = template
+        return template
+
+    def add(
+        self, event_type: str, output_index: int, content_index: int, delta: str
+    ) -> str:
+        key = (event_type, output_index, content_index)
+        frames = self.flush() if key != self._key else ""
+        if not self._parts:
+            self._key = key
+            self._first_at = time.monotonic()
+        self._parts.append(delta)
+        if (self.max_tokens is not None and len(self._parts) >= self.max_tokens) or (
+            self.max_delay_s is not None
+            and time.monotonic() - self._first_at >= self.max_delay_s
+        ):
+            frames += self.flush()
+        return frames
+
+    def deadline(self) -> Optional[float]:
+        """
+        ``time.monotonic()`` value by which the buffered delta is due, or None
+        if nothing is buffered or there is no delay limit. The stream calls
+        ``flush`` then if no further delta has arrived.
+        """
+        if not self._parts or self.max_delay_s is None:
+            return None
+        return self._first_at + self.max_delay_s
+
+    def flush(self) -> str:
+        if not self._parts:
+            return ""
+        key = self._key
+        head, body = self._template(key)
+        delta = "".join(self._parts)
+        self._parts.clear()
+        self._key = None
+        return (
+            f"{head}{self.next_sequence_number()}{body}"
+            f"{_encode_string(delta)}{_DELTA_SUFFIXES[key[0]]}"
+        )
@@ -0,0 +1,421 @@
+"""
+Storage for responses created with ``store=True`` so that later requests can
+continue them through ``previous_response_id``.
+
+``MemoryResponsesStore`` keeps recent responses in an LRU bounded by entry
+count and serialized size, with an optional TTL. ``SQLiteResponsesStore`` puts
+a local SQLite database behind the memory tier; writes are queued and committed
+in batches by a background thread so request handlers never wait on disk.
+
+Besides the request and response, a stored response can carry the rendered
+token sequence of the conversation so far, which lets a follow-up request
+append only its new input instead of rendering the whole conversation again.
+"""
+
+import queue
+import sqlite3
+import threading
+import time
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+from array import array
+from dataclasses import dataclass
+from typing import Any, Optional, Sequence
+
+from pydantic import BaseModel
+
+from .types import ResponseObject, ResponsesRequest
+
+DEFAULT_MAX_ENTRIES = 10_000
+DEFAULT_MAX_BYTES = 256 * 2**20
+DEFAULT_WRITE_BATCH_SIZE = 256
+# a row that fails to be written this many times is given up on
+DEFAULT_MAX_WRITE_ATTEMPTS = 3
+# delay before the first retry of a failed batch, doubled on every attempt
+WRITE_RETRY_DELAY_S = 0.1
+# bytes an entry takes besides its texts and tokens: ids, settings, JSON syntax
+ENTRY_OVERHEAD_BYTES = 1024
+
+
+@dataclass
+class StoreStats:
+    hits: int = 0
+    misses: int = 0
+    # dropped from the memory tier to stay within its budget
+    evictions: int = 0
+    expirations: int = 0
+    writes: int = 0
+    # hits that missed the memory tier and were served from disk
+    disk_hits: int = 0
+    # rows that never reached disk after max_write_attempts failed writes
+    dropped_writes: int = 0
+
+    @property
+    def hit_ratio(self) -> float:
+        lookups = self.hits + self.misses
+        return self.hits / lookups if lookups else 0.0
+
+
+@dataclass
+class StoredResponse:
+    request: ResponsesRequest
+    response: ResponseObject
+    # rendered conversation including the response, ready to be extended by a
+    # follow-up request (None if the response cannot be continued token-wise)
+    tokens: Optional[array] = None
+    # offset in `tokens` of the first assistant message of the current user turn
+    turn_start: int = 0
+
+
+def _text_length(value: Any) -> int:
+    if isinstance(value, str):
+        return len(value)
+    if isinstance(value, list):
+        return sum(_text_length(item) for item in value)
+    if not isinstance(value, BaseModel):
+        return 0
+    # the fields of input and output items that hold text
+    return sum(
+        _text_length(getattr(value, name, None))
+        for name in ("text", "content", "summary", "arguments", "output", "input")
+    )
+
+
+def _estimated_size(stored: StoredResponse) -> int:
+    """
+    Size of an entry estimated from the lengths of its texts and tokens, so
+    that storing it does not serialize it on the request path.
+    """
+    tokens_nbytes = (
+        len(stored.tokens) * stored.tokens.itemsize if stored.tokens is not None else 0
+    )
+    return (
+        ENTRY_OVERHEAD_BYTES
+        + _text_length(stored.request.instructions)
+        + _text_length(stored.request.input)
+        + _text_length(stored.response.output)
+        + tokens_nbytes
+    )
+
+
+class ResponsesStore(ABC):
+    stats: StoreStats
+
+    @abstractmethod
+    def get(self, response_id: str) -> Optional[StoredResponse]:
+        """Return the stored request and response, or None if unknown or expired."""
+
+    @abstractmethod
+    def put(
+        self,
+        response_id: str,
+        request: ResponsesRequest,
+        response: ResponseObject,
+        tokens: Optional[Sequence[int]] = None,
+        turn_start: int = 0,
+    ) -> None:
+        pass
+
+    def close(self) -> None:
+        """Flush pending writes and release resources."""
+
+
+class MemoryResponsesStore(ResponsesStore):
+    def __init__(
+        self,
+        max_entries: int = DEFAULT_MAX_ENTRIES,
+        max_bytes: int = DEFAULT_MAX_BYTES,
+        ttl_seconds: Optional[float] = None,
+    ):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.ttl_seconds = ttl_seconds
+        self.stats = StoreStats()
+        # response_id -> (stored, expires_at, nbytes), oldest first
+        self._entries: OrderedDict[str, tuple[StoredResponse, float, int]] = (
+            OrderedDict()
+        )
+        self._lock = threading.Lock()
+        self.used_bytes = 0
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def __contains__(self, response_id: str) -> bool:
+        return response_id in self._entries
+
+    def get(
+        self, response_id: str, count_miss: bool = True
+    ) -> Optional[StoredResponse]:
+        """
+        ``count_miss=False`` leaves a miss to be counted by the caller, for
+        a tier behind this one that may still find the response.
+        """
+        with self._lock:
+            entry = self._entries.get(response_id)
+            if entry is None:
+                if count_miss:
+                    self.stats.misses += 1
+                return None
+            stored, expires_at, _ = entry
+            if expires_at < time.monotonic():
+                self._remove(response_id)
+                self.stats.expirations += 1
+                if count_miss:
+                    self.stats.misses += 1
+                return None
+            self._entries.move_to_end(response_id)
+            self.stats.hits += 1
+            return stored
+
+    def put(
+        self,
+        response_id: str,
+        request: ResponsesRequest,
+        response: ResponseObject,
+        tokens: Optional[Sequence[int]] = None,
+        turn_start: int = 0,
+    ) -> None:
+        if tokens is not None and not isinstance(tokens, array):
+            tokens = array("I", tokens)
+        self.put_stored(
+            response_id, StoredResponse(request, response, tokens, turn_start)
+        )
+
+    def put_stored(self, response_id: str, stored: StoredResponse) -> None:
+        nbytes = _estimated_size(stored)
+        expires_at = (
+            time.monotonic() + self.ttl_seconds
+            if self.ttl_seconds is not None
+            else float("inf")
+        )
+        with self._lock:
+            if response_id in self._entries:
+                self._remove(response_id)
+            self._entries[response_id] = (stored, expires_at, nbytes)
+            self.used_bytes += nbytes
+            self.stats.writes += 1
+            while self._entries and (
+                len(self._entries) > self.max_entries
+                or self.used_bytes > self.max_bytes
+            ):
+                oldest = next(iter(self._entries))
+                self._remove(oldest)
+                self.stats.evictions += 1
+
+    def _remove(self, response_id: str) -> None:
+        *_, nbytes = self._entries.pop(response_id)
+        self.used_bytes -= nbytes
+
+
+class SQLiteResponsesStore(ResponsesStore):
+    """
+    Memory tier in front of a SQLite table. ``put`` only updates the memory
+    tier and enqueues the row; a writer thread commits queued rows in batches.
+    Lookups that miss the memory tier read the row by primary key and promote
+    it back into memory.
+    """
+
+    def __init__(
+        self,
+        path: str,
+        memory: Optional[MemoryResponsesStore] = None,
+        ttl_seconds: Optional[float] = None,
+        write_batch_size: int = DEFAULT_WRITE_BATCH_SIZE,
+        max_write_attempts: int = DEFAULT_MAX_WRITE_ATTEMPTS,
+    ):
+        self.path = path
+        self.ttl_seconds = ttl_seconds
+        if memory is None:
+            memory = MemoryResponsesStore(ttl_seconds=ttl_seconds)
+        self.memory = memory
+        self.stats = self.memory.stats
+        self.write_batch_size = write_batch_size
+        self.max_write_attempts = max_write_attempts
+        # (response_id, created_at, failed attempts) of rows to write; None
+        # stops the writer
+        self._queue: queue.Queue[Optional[tuple[str, float, int]]] = queue.Queue()
+        # rows that are queued but not committed yet, so reads see them
+        self._unwritten: dict[str, StoredResponse] = {}
+        self._unwritten_lock = threading.Lock()
+        # the last error of the writer thread, raised by flush()
+        self._error: Optional[Exception] = None
+
+        self._reader = self._connect()
+        self._reader_lock = threading.Lock()
+        self._writer = threading.Thread(
+            target=self._write_loop,
+            args=(self._connect(),),
+            name="responses-store-writer",
+            daemon=True,
+        )
+        self._writer.start()
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = sqlite3.connect(self.path, check_same_thread=False)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS responses ("
+            " id TEXT PRIMARY KEY,"
+            " request TEXT NOT NULL,"
+            " response TEXT NOT NULL,"
+            " tokens BLOB,"
+            " turn_start INTEGER NOT NULL,"
+            " created_at REAL NOT NULL)"
+        )
+        conn.commit()
+        return conn
+
+    def get(self, response_id: str) -> Optional[StoredResponse]:
+        stored = self.memory.get(response_id, count_miss=False)
+        if stored is not None:
+            return stored
+        with self._unwritten_lock:
+            stored = self._unwritten.get(response_id)
+        if stored is None:
+            stored = self._read(response_id)
+        if stored is None:
+            self.stats.misses += 1
+            return None
+        self.stats.hits += 1
+        self.stats.disk_hits += 1
+        self.memory.put_stored(response_id, stored)
+        return stored
+
+    def _read(self, response_id: str) -> Optional[StoredResponse]:
+        with self._reader_lock:
+            row = self._reader.execute(
+                "SELECT request, response, tokens, turn_start, created_at"
+                " FROM responses WHERE id = ?",
+                (response_id,),
+            ).fetchone()
+        if row is None:
+            return None
+        request_json, response_json, tokens_blob, turn_start, created_at = row
+        if self.ttl_seconds is not None and created_at + self.ttl_seconds < time.time():
+            self.stats.expirations += 1
+            return None
+        tokens = None
+        if tokens_blob is not None:
+            tokens = array("I")
+            tokens.frombytes(tokens_blob)
+        return StoredResponse(
+            ResponsesRequest.model_validate_json(request_json),
+            ResponseObject.model_validate_json(response_json),
+            tokens,
+            turn_start,
+        )
+
+    def put(
+        self,
+        response_id: str,
+        request: ResponsesRequest,
+        response: ResponseObject,
+        tokens: Optional[Sequence[int]] = None,
+        turn_start: int = 0,
+    ) -> None:
+        if tokens is not None and not isinstance(tokens, array):
+            tokens = array("I", tokens)
+        stored = StoredResponse(request, response, tokens, turn_start)
+        self.memory.put_stored(response_id, stored)
+        with self._unwritten_lock:
+            self._unwritten[response_id] = stored
+        # serialized on the writer thread, off the request path
+        self._queue.put((response_id, time.time(), 0))
+
+    def _write_loop(self, conn: sqlite3.Connection) -> None:
+        last_expiry = time.monotonic()
+        stopping = False
+        # rows queued again after a failure are written before stopping
+        while not (stopping and self._queue.empty()):
+            item = self._queue.get()
+            items = [item]
+            while len(items) < self.write_batch_size:
+                try:
+                    items.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+            stopping = stopping or None in items
+            writes = [item for item in items if item is not None]
+            try:
+                self._write(conn, [item[:2] for item in writes])
+                if (
+                    self.ttl_seconds is not None
+                    and time.monotonic() - last_expiry > self.ttl_seconds / 10
+                ):
+                    last_expiry = time.monotonic()
+                    with conn:
+                        conn.execute(
+                            "DELETE FROM responses WHERE created_at < ?",
+                            (time.time() - self.ttl_seconds,),
+                        )
+            except Exception as e:
+                print(f"Error writing stored responses: {e!r}")
+                self._error = e
+                # queued again before task_done(), so flush() waits for them
+                self._retry(writes)
+            finally:
+                for _ in items:
+                    self._queue.task_done()
+        conn.close()
+
+    def _retry(self, items: list[tuple[str, float, int]]) -> None:
+        if not items:
+            return
+        time.sleep(WRITE_RETRY_DELAY_S * 2 ** min(item[2] for item in items))
+        for response_id, created_at, failures in items:
+            if failures + 1 < self.max_write_attempts:
+                self._queue.put((response_id, created_at, failures + 1))
+                continue
+            # the memory tier may still hold it, but it will not survive a
+            # restart
+            with self._unwritten_lock:
+                dropped = self._unwritten.pop(response_id, None)
+            if dropped is not None:
+                self.stats.dropped_writes += 1
+
+    def _write(self, conn: sqlite3.Connection, items: list[tuple[str, float]]) -> None:
+        rows = []
+        for response_id, created_at in items:
+            with self._unwritten_lock:
+                stored = self._unwritten.get(response_id)
+            if stored is None:
+                continue
+            rows.append(
+                (
+                    response_id,
+                    stored.request.model_dump_json(),
+                    stored.response.model_dump_json(),
+                    stored.tokens.tobytes() if stored.tokens is not None else None,
+                    stored.turn_start,
+                    created_at,
+                )
+            )
+        if not rows:
+            return
+        with conn:
+            conn.executemany(
+                "INSERT OR REPLACE INTO responses VALUES (?, ?, ?, ?, ?, ?)", rows
+            )
+        with self._unwritten_lock:
+            for response_id, *_ in rows:
+                self._unwritten.pop(response_id, None)
+
+    def flush(self) -> None:
+        """
+        Block until all queued writes are processed, including retries of
+        failed ones. Raises the last error the writer ran into since the
+        previous flush.
+        """
+        self._queue.join()
+        error, self._error = self._error, None
+        if error is not None:
+            raise error
+
+    def close(self) -> None:
+        if self._writer.is_alive():
+            self._queue.put(None)
+            self._writer.join()
+        with self._reader_lock:
+            self._reader.close()
@@ -0,0 +1,103 @@
+"""
+Runs built-in tool calls (browser, python) for the Responses API server.
+
+A session that calls a tool stops on ``<|call|>`` and is parked by the engine,
+so it holds no batch slot while the tool runs. The executor makes sure the
+tool itself cannot hold up the event loop: blocking work goes to a dedicated
+thread pool (see ``call_on_background_thread``), each tool has a cap on
+concurrent calls, and calls that exceed their timeout are answered with an
+error message so the model can carry on.
+"""
+
+import asyncio
+import time
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+from typing import Optional
+
+from openai_harmony import Message
+
+from gpt_oss.tools.tool import Tool, tool_thread_pool
+
+from .metrics import LabeledHistogram
+
+DEFAULT_MAX_CONCURRENCY = 8
+DEFAULT_TIMEOUT_S = 120.0
+DEFAULT_MAX_WORKERS = 32
+
+
+@dataclass
+class ToolLimits:
+    # calls of the tool running at once; further calls wait their turn
+    max_concurrency: int = DEFAULT_MAX_CONCURRENCY
+    # None waits for the tool indefinitely
+    timeout_s: Optional[float] = DEFAULT_TIMEOUT_S
+
+
+@dataclass
+class ToolExecutorStats:
+    calls: dict[str, int] = field(default_factory=dict)
+    timeouts: dict[str, int] = field(default_factory=dict)
+
+
+class ToolExecutor:
+    def __init__(
+        self,
+        limits: Optional[dict[str, ToolLimits]] = None,
+        default_limits: Optional[ToolLimits] = None,
+        max_workers: int = DEFAULT_MAX_WORKERS,
+    ):
+        self.limits = limits or {}
+        self.default_limits = default_limits or ToolLimits()
+        self.stats = ToolExecutorStats()
+        self.latency = LabeledHistogram(
+            "gpt_oss_tool_call_seconds",
+            "Wall time of built-in tool calls, including time waiting for a turn.",
+            "tool",
+        )
+        self._thread_pool = ThreadPoolExecutor(
+            max_workers=max_workers, thread_name_prefix="tool"
+        )
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._semaphores: dict[str, asyncio.Semaphore] = {}
+
+    def _semaphore(self, name: str) -> asyncio.Semaphore:
+        loop = asyncio.get_running_loop()
+        if self._loop is not loop:
+            self._loop = loop
+            self._semaphores = {}
+        semaphore = self._semaphores.get(name)
+        if semaphore is None:
+            limits = self.limits.get(name, self.default_limits)
+            semaphore = asyncio.Semaphore(limits.max_concurrency)
+            self._semaphores[name] = semaphore
+        return semaphore
+
+    async def run(self, name: str, tool: Tool, message: Message) -> list[Message]:
+        """Process ``message`` with ``tool`` and return the tool's messages."""
+        limits = self.limits.get(name, self.default_limits)
+        self.stats.calls[name] = self.stats.calls.get(name, 0) + 1
+        start = time.monotonic()
+        try:
+            async with self._semaphore(name):
+                return await asyncio.wait_for(
+                    self._collect(tool, message), limits.timeout_s
+                )
+        except asyncio.TimeoutError:
+            # a blocking call keeps its worker thread until it returns
+            self.stats.timeouts[name] = self.stats.timeouts.get(name, 0) + 1
+            return [
+                tool.error_message(
+                    f"Tool call timed out after {limits.timeout_s:g} seconds.",
+                    channel=message.channel,
+                )
+            ]
+        finally:
+            self.latency.labels(name).observe(time.monotonic() - start)
+
+    async def _collect(self, tool: Tool, message: Message) -> list[Message]:
+        tool_thread_pool.set(self._thread_pool)
+        return [m async for m in tool.process(message)]
+
+    def close(self) -> None:
+        self._thread_pool.shutdown(wait=False, cancel_futures=True)
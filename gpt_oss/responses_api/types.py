@@ -103,10 +103,15 @@ class IncompleteDetails(BaseModel):
     reason: str
 
 
+class InputTokensDetails(BaseModel):
+    cached_tokens: int = 0
+
+
 class Usage(BaseModel):
     input_tokens: int
     output_tokens: int
     total_tokens: int
+    input_tokens_details: Optional[InputTokensDetails] = None
 
 
 class FunctionToolDefinition(BaseModel):
@@ -126,7 +131,14 @@ class CodeInterpreterToolConfig(BaseModel):
 
 
 class ReasoningConfig(BaseModel):
-    effort: Literal["low", "medium", "high"] = REASONING_EFFORT
+    effort: Literal["low", "medium", "high"] = "low"
+
+
+class StreamOptions(BaseModel):
+    # merge up to this many consecutive text/reasoning deltas into one event
+    coalesce_tokens: Optional[int] = None
+    # merge the deltas produced within this many milliseconds into one event
+    coalesce_ms: Optional[float] = None
 
 
 class ResponsesRequest(BaseModel):
@@ -146,6 +158,7 @@ class ResponsesRequest(BaseModel):
     ]
     model: Optional[str] = MODEL_IDENTIFIER
     stream: Optional[bool] = False
+    stream_options: Optional[StreamOptions] = None
     tools: Optional[
         list[
             Union[FunctionToolDefinition, BrowserToolConfig, CodeInterpreterToolConfig]
@@ -159,6 +172,14 @@ class ResponsesRequest(BaseModel):
     previous_response_id: Optional[str] = None
     temperature: Optional[float] = DEFAULT_TEMPERATURE
     include: Optional[list[str]] = None
+    # number of independent samples; the prompt is prefilled once for all
+    n: Optional[int] = 1
+
+
+class ProfileRequest(BaseModel):
+    # profile this many engine steps and/or for this many seconds
+    steps: Optional[int] = None
+    seconds: Optional[float] = None
 
 
 class ResponseObject(BaseModel):
@@ -190,3 +211,5 @@ class ResponseObject(BaseModel):
     text: Optional[Dict[str, Any]] = None
     tool_choice: Optional[str] = "auto"
     top_p: Optional[int] = 1
+    # all n responses (the first one is this response) when n > 1
+    samples: Optional[list["ResponseObject"]] = None
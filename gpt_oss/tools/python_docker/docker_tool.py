@@ -1,10 +1,8 @@
-# Run this before running the tool:
+# Run this before running the tool with the docker sandbox:
 # $ docker image pull python:3.11
-import io
-import tarfile
+import uuid
 from typing import Any, AsyncIterator
 
-import docker
 from openai_harmony import (
     Author,
     Content,
@@ -14,56 +12,37 @@ from openai_harmony import (
     ToolNamespaceConfig,
 )
 
-from ..tool import Tool
-
-_docker_client = None
+from ..tool import Tool, call_on_background_thread
+from .kernel import KernelSessions
+from .sandbox import (
+    SANDBOX_BACKENDS,
+    SandboxPool,
+    default_sandbox_backend,
+    default_sandbox_pool,
+)
 
 
 def call_python_script(script: str) -> str:
     """
-    Call a python script by writing it to a file in the container and executing it.
+    Run a python script in a sandbox of the default pool and return its output.
     """
-    global _docker_client
-    if _docker_client is None:
-        _docker_client = docker.from_env()
-        # pull image `python:3.11` if not present
-        try:
-            _docker_client.images.get("python:3.11")
-        except docker.errors.ImageNotFound:
-            _docker_client.images.pull("python:3.11")
-
-    # 1. Create a temporary tar archive containing the script
-    script_name = "script.py"
-    tarstream = io.BytesIO()
-    with tarfile.open(fileobj=tarstream, mode="w") as tar:
-        script_bytes = script.encode("utf-8")
-        tarinfo = tarfile.TarInfo(name=script_name)
-        tarinfo.size = len(script_bytes)
-        tar.addfile(tarinfo, io.BytesIO(script_bytes))
-    tarstream.seek(0)
-
-    # 2. Start the container
-    container = _docker_client.containers.create(
-        "python:3.11", command="sleep infinity", detach=True
-    )
-    try:
-        container.start()
-        # 3. Put the script into the container
-        container.put_archive(path="/tmp", data=tarstream.read())
-        # 4. Execute the script
-        exec_result = container.exec_run(f"python /tmp/{script_name}")
-        output = exec_result.output.decode("utf-8")
-    finally:
-        container.remove(force=True)
-    return output
+    return default_sandbox_pool().run(script)
 
 
 class PythonTool(Tool):
     def __init__(
         self,
         name: str = "python",
+        sandbox_pool: SandboxPool | None = None,
+        sessions: KernelSessions | None = None,
+        session_id: str | None = None,
     ):
         assert name == "python"
+        self.sandbox_pool = sandbox_pool
+        # with sessions, code runs in a kernel that keeps its state between
+        # calls with the same session id
+        self.sessions = sessions
+        self.session_id = session_id or uuid.uuid4().hex
 
     @classmethod
     def get_tool_name(cls) -> str:
@@ -75,9 +54,19 @@ class PythonTool(Tool):
 
     @property
     def instruction(self) -> str:
-        return """
+        if self.sessions is not None:
+            return f"""
+Use this tool to execute Python code in your chain of thought. The code will not be shown to the user. This tool should be used for internal reasoning, but not for code that is intended to be visible to the user (e.g. when creating plots, tables, or files).
+When you send a message containing Python code to python, it will be executed in a stateful Jupyter notebook environment. python will respond with the output of the execution or time out after {self.sessions.timeout_s:g} seconds. Files written to the working directory persist for the session.
+            """.strip()
+        if self.sandbox_pool is not None:
+            factory = self.sandbox_pool.factory
+        else:
+            factory = SANDBOX_BACKENDS.get(default_sandbox_backend())
+        where = getattr(factory, "description", "sandbox")
+        return f"""
 Use this tool to execute Python code in your chain of thought. The code will not be shown to the user. This tool should be used for internal reasoning, but not for code that is intended to be visible to the user (e.g. when creating plots, tables, or files).
-When you send a message containing python code to python, it will be executed in a stateless docker container, and the stdout of that process will be returned to you. You have to use print statements to access the output.
+When you send a message containing python code to python, it will be executed in a stateless {where}, and the stdout of that process will be returned to you. You have to use print statements to access the output.
         """.strip()
 
     @property
@@ -118,5 +107,12 @@ When you send a message containing python code to python, it will be executed in
     async def _process(self, message: Message) -> AsyncIterator[Message]:
         script = message.content[0].text
         channel = message.channel
-        output = call_python_script(script)
+        # both block until the code has finished
+        if self.sessions is not None:
+            output = await call_on_background_thread(
+                self.sessions.execute, self.session_id, script
+            )
+        else:
+            pool = self.sandbox_pool or default_sandbox_pool()
+            output = await call_on_background_thread(pool.run, script)
         yield self._make_response(output, channel=channel)
@@ -0,0 +1,512 @@
+"""
+Stateful python sessions for the python tool.
+
+The model was trained with a Jupyter-style python tool whose state carries
+over between calls. A ``Kernel`` is a long-lived interpreter that runs one
+cell at a time in a persistent namespace and, like a notebook, echoes the
+value of a trailing expression. ``KernelSessions`` maps session ids (a
+conversation in the Responses API, a chat, an MCP client) to kernels, evicts
+sessions that have been idle for too long and caps how many are alive.
+
+Cells and their output are exchanged as length-prefixed frames over the
+kernel's stdin and stdout. Output a cell writes to the file descriptors
+directly (e.g. from a subprocess) is discarded so it cannot corrupt the
+framing.
+"""
+
+import os
+import select
+import shutil
+import signal
+import socket
+import struct
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Callable, Optional
+
+from .sandbox import (
+    DEFAULT_IMAGE,
+    DEFAULT_TIMEOUT_S,
+    SandboxTimeout,
+    get_docker_client,
+    with_resource_limits,
+)
+
+DEFAULT_MAX_SESSIONS = 16
+DEFAULT_IDLE_TIMEOUT_S = 15 * 60
+DEFAULT_MAX_ALIASES = 65536
+
+_FRAME_HEADER = struct.Struct("!I")
+
+# runs inside the kernel process; kept free of dependencies on this package
+_DRIVER = r"""
+import ast, contextlib, io, os, struct, sys, traceback
+
+_stdin = os.fdopen(os.dup(0), "rb", buffering=0)
+_stdout = os.fdopen(os.dup(1), "wb", buffering=0)
+_null = os.open(os.devnull, os.O_RDWR)
+for _fd in (0, 1, 2):
+    os.dup2(_null, _fd)
+_header = struct.Struct("!I")
+
+
+def _read(n):
+    data = b""
+    while len(data) < n:
+        chunk = _stdin.read(n - len(data))
+        if not chunk:
+            sys.exit(0)
+        data += chunk
+    return data
+
+
+def _run(code, namespace):
+    tree = ast.parse(code, "<cell>", "exec")
+    last = None
+    if tree.body and isinstance(tree.body[-1], ast.Expr):
+        last = ast.Expression(tree.body.pop().value)
+    exec(compile(tree, "<cell>", "exec"), namespace)
+    if last is not None:
+        value = eval(compile(last, "<cell>", "eval"), namespace)
+        if value is not None:
+            print(repr(value))
+
+
+_namespace = {"__name__": "__main__", "__builtins__": __builtins__}
+while True:
+    (_size,) = _header.unpack(_read(_header.size))
+    _code = _read(_size).decode("utf-8", errors="replace")
+    _buffer = io.StringIO()
+    with contextlib.redirect_stdout(_buffer), contextlib.redirect_stderr(_buffer):
+        try:
+            _run(_code, _namespace)
+        except BaseException as e:
+            # hide the frames of this driver, which runs as "<string>", and of
+            # the parser for syntax errors
+            _error = traceback.TracebackException.from_exception(e)
+            _error.stack = traceback.StackSummary.from_list(
+                []
+                if isinstance(e, SyntaxError)
+                else [f for f in _error.stack if f.filename != "<string>"]
+            )
+            print("".join(_error.format()), end="")
+    _data = _buffer.getvalue().encode("utf-8", errors="replace")
+    _stdout.write(_header.pack(len(_data)) + _data)
+"""
+
+
+class KernelDied(Exception):
+    pass
+
+
+class Kernel(ABC):
+    """A long-lived interpreter that keeps its namespace between cells."""
+
+    @abstractmethod
+    def start(self) -> None:
+        pass
+
+    @abstractmethod
+    def _send(self, data: bytes) -> None:
+        pass
+
+    @abstractmethod
+    def _recv(self, n: int, deadline: float) -> bytes:
+        """Returns up to ``n`` bytes of output, waiting until ``deadline``."""
+
+    @abstractmethod
+    def close(self) -> None:
+        pass
+
+    def _recv_exactly(self, n: int, deadline: float) -> bytes:
+        data = b""
+        while len(data) < n:
+            data += self._recv(n - len(data), deadline)
+        return data
+
+    def execute(self, code: str, timeout_s: float) -> str:
+        deadline = time.monotonic() + timeout_s
+        data = code.encode("utf-8")
+        self._send(_FRAME_HEADER.pack(len(data)) + data)
+        (size,) = _FRAME_HEADER.unpack(self._recv_exactly(_FRAME_HEADER.size, deadline))
+        return self._recv_exactly(size, deadline).decode("utf-8", errors="replace")
+
+
+class LocalKernel(Kernel):
+    """
+    A subprocess kernel in a temporary working directory. The CPU limit is a
+    budget for the whole session, not per cell. Like ``LocalSandbox``, this is
+    not isolated from the host.
+    """
+
+    def __init__(
+        self,
+        python: str = sys.executable,
+        cpu_seconds: Optional[int] = 10 * 60,
+        memory_bytes: Optional[int] = 4 * 2**30,
+    ):
+        self.python = python
+        self.cpu_seconds = cpu_seconds
+        self.memory_bytes = memory_bytes
+        self.workdir: Optional[str] = None
+        self.process: Optional[subprocess.Popen] = None
+
+    def start(self) -> None:
+        self.workdir = tempfile.mkdtemp(prefix="gpt-oss-kernel-")
+        self.process = subprocess.Popen(
+            with_resource_limits(
+                [self.python, "-I", "-c", _DRIVER], self.cpu_seconds, self.memory_bytes
+            ),
+            stdin=subprocess.PIPE,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.DEVNULL,
+            bufsize=0,
+            cwd=self.workdir,
+            env={"PATH": os.defpath, "HOME": self.workdir, "TMPDIR": self.workdir},
+            start_new_session=True,
+        )
+
+    def _send(self, data: bytes) -> None:
+        try:
+            self.process.stdin.write(data)
+            self.process.stdin.flush()
+        except BrokenPipeError:
+            raise KernelDied()
+
+    def _recv(self, n: int, deadline: float) -> bytes:
+        fd = self.process.stdout.fileno()
+        ready, _, _ = select.select([fd], [], [], max(0, deadline - time.monotonic()))
+        if not ready:
+            raise SandboxTimeout("")
+        data = os.read(fd, n)
+        if not data:
+            raise KernelDied()
+        return data
+
+    def close(self) -> None:
+        if self.process is not None:
+            try:
+                os.killpg(self.process.pid, signal.SIGKILL)
+            except ProcessLookupError:
+                pass
+            self.process.wait()
+            self.process.stdin.close()
+            self.process.stdout.close()
+            self.process = None
+        if self.workdir is not None:
+            shutil.rmtree(self.workdir, ignore_errors=True)
+            self.workdir = None
+
+
+class DockerKernel(Kernel):
+    """A kernel in its own container, with docker's CPU and memory limits."""
+
+    def __init__(
+        self,
+        image: str = DEFAULT_IMAGE,
+        cpus: Optional[float] = 1.0,
+        memory: Optional[str] = "4g",
+    ):
+        self.image = image
+        self.cpus = cpus
+        self.memory = memory
+        self.container = None
+        self._sock = None
+        self._stdout = b""
+
+    def start(self) -> None:
+        client = get_docker_client(self.image)
+        self.container = client.containers.create(
+            self.image,
+            command="sleep infinity",
+            working_dir="/sandbox",
+            nano_cpus=int(self.cpus * 1e9) if self.cpus is not None else None,
+            mem_limit=self.memory,
+            detach=True,
+        )
+        self.container.start()
+        exec_id = client.api.exec_create(
+            self.container.id,
+            ["python", "-I", "-c", _DRIVER],
+            stdin=True,
+            workdir="/sandbox",
+        )["Id"]
+        self._sock = client.api.exec_start(exec_id, socket=True)
+
+    def _raw(self) -> socket.socket:
+        return getattr(self._sock, "_sock", self._sock)
+
+    def _send(self, data: bytes) -> None:
+        try:
+            self._raw().sendall(data)
+        except OSError:
+            raise KernelDied()
+
+    def _read_raw(self, n: int, deadline: float) -> bytes:
+        data = b""
+        while len(data) < n:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                raise SandboxTimeout("")
+            self._raw().settimeout(remaining)
+            try:
+                chunk = self._raw().recv(n - len(data))
+            except socket.timeout:
+                raise SandboxTimeout("")
+            if not chunk:
+                raise KernelDied()
+            data += chunk
+        return data
+
+    def _recv(self, n: int, deadline: float) -> bytes:
+        # the exec stream multiplexes stdout and stderr in frames with an
+        # 8-byte header: stream id, 3 bytes of padding, payload size
+        while not self._stdout:
+            stream, size = struct.unpack(">BxxxL", self._read_raw(8, deadline))
+            payload = self._read_raw(size, deadline)
+            if stream == 1:
+                self._stdout += payload
+        data, self._stdout = self._stdout[:n], self._stdout[n:]
+        return data
+
+    def close(self) -> None:
+        if self._sock is not None:
+            self._sock.close()
+            self._sock = None
+        if self.container is not None:
+            self.container.remove(force=True)
+            self.container = None
+
+
+KERNEL_BACKENDS: dict[str, Callable[[], Kernel]] = {
+    "docker": DockerKernel,
+    "local": LocalKernel,
+}
+
+
+@dataclass
+class KernelSessionStats:
+    created: int = 0
+    # calls that found the session, and with it the state of earlier calls
+    reused: int = 0
+    evicted_idle: int = 0
+    evicted_lru: int = 0
+    timeouts: int = 0
+    crashed: int = 0
+
+    @property
+    def hit_ratio(self) -> float:
+        calls = self.created + self.reused
+        return self.reused / calls if calls else 0.0
+
+
+class _Session:
+    def __init__(self):
+        self.kernel: Optional[Kernel] = None
+        self.lock = threading.Lock()
+        self.last_used = time.monotonic()
+        # calls waiting for or running on the kernel; never evicted while > 0
+        self.busy = 0
+
+
+class KernelSessions:
+    """
+    Kernels keyed by session id. ``execute`` blocks, so call it from a worker
+    thread; cells of one session run one after another.
+    """
+
+    def __init__(
+        self,
+        factory: Callable[[], Kernel] = DockerKernel,
+        max_sessions: int = DEFAULT_MAX_SESSIONS,
+        idle_timeout_s: float = DEFAULT_IDLE_TIMEOUT_S,
+        timeout_s: float = DEFAULT_TIMEOUT_S,
+        max_aliases: int = DEFAULT_MAX_ALIASES,
+    ):
+        self.factory = factory
+        self.max_sessions = max_sessions
+        self.idle_timeout_s = idle_timeout_s
+        self.timeout_s = timeout_s
+        self.max_aliases = max_aliases
+        self.stats = KernelSessionStats()
+        # least recently used first
+        self._sessions: OrderedDict[str, _Session] = OrderedDict()
+        self._aliases: OrderedDict[str, str] = OrderedDict()
+        self._lock = threading.Lock()
+        self._closed = False
+        self._stop = threading.Event()
+        self._reaper: Optional[threading.Thread] = None
+
+    def __len__(self) -> int:
+        return len(self._sessions)
+
+    def _resolve(self, session_id: str) -> str:
+        return self._aliases.get(session_id, session_id)
+
+    def alias(self, alias: str, session_id: str) -> None:
+        """
+        Makes ``alias`` refer to the session of ``session_id``, e.g. a response
+        that continues the conversation of an earlier one.
+        """
+        with self._lock:
+            self._aliases[alias] = self._resolve(session_id)
+            self._aliases.move_to_end(alias)
+            while len(self._aliases) > self.max_aliases:
+                self._aliases.popitem(last=False)
+
+    def start(self) -> None:
+        """Starts a thread that evicts idle sessions in the background."""
+        if self._reaper is None:
+            self._reaper = threading.Thread(
+                target=self._reap, name="kernel-reaper", daemon=True
+            )
+            self._reaper.start()
+
+    def _reap(self) -> None:
+        while not self._stop.wait(min(60.0, self.idle_timeout_s / 2)):
+            self.evict_idle()
+
+    def _pop(self, session_id: str) -> _Session:
+        session = self._sessions.pop(session_id)
+        for alias in [a for a, s in self._aliases.items() if s == session_id]:
+            del self._aliases[alias]
+        return session
+
+    def evict_idle(self) -> int:
+        now = time.monotonic()
+        with self._lock:
+            evicted = [
+                self._pop(session_id)
+                for session_id, session in list(self._sessions.items())
+                if not session.busy and now - session.last_used > self.idle_timeout_s
+            ]
+            self.stats.evicted_idle += len(evicted)
+        for session in evicted:
+            self._close_kernel(session)
+        return len(evicted)
+
+    def close_session(self, session_id: str) -> None:
+        with self._lock:
+            session_id = self._resolve(session_id)
+            if session_id not in self._sessions:
+                return
+            session = self._pop(session_id)
+        with session.lock:
+            self._close_kernel(session)
+
+    @staticmethod
+    def _close_kernel(session: _Session) -> None:
+        if session.kernel is not None:
+            session.kernel.close()
+            session.kernel = None
+
+    def _acquire(self, session_id: str) -> _Session:
+        evicted = None
+        with self._lock:
+            if self._closed:
+                raise RuntimeError("kernel sessions are closed")
+            session_id = self._resolve(session_id)
+            session = self._sessions.get(session_id)
+            if session is not None:
+                self._sessions.move_to_end(session_id)
+                self.stats.reused += 1
+            else:
+                if len(self._sessions) >= self.max_sessions:
+                    victim = next(
+                        (i for i, s in self._sessions.items() if not s.busy), None
+                    )
+                    if victim is not None:
+                        evicted = self._pop(victim)
+                        self.stats.evicted_lru += 1
+                session = self._sessions[session_id] = _Session()
+                self.stats.created += 1
+            session.busy += 1
+        if evicted is not None:
+            self._close_kernel(evicted)
+        return session
+
+    def execute(self, session_id: str, code: str) -> str:
+        session = self._acquire(session_id)
+        try:
+            with session.lock:
+                if session.kernel is None:
+                    kernel = self.factory()
+                    try:
+                        kernel.start()
+                    except BaseException:
+                        kernel.close()
+                        raise
+                    session.kernel = kernel
+                try:
+                    return session.kernel.execute(code, self.timeout_s)
+                except SandboxTimeout:
+                    with self._lock:
+                        self.stats.timeouts += 1
+                    self._close_kernel(session)
+                    return (
+                        f"TimeoutError: execution exceeded {self.timeout_s:g} "
+                        "seconds. The python session was restarted and its "
+                        "state was lost."
+                    )
+                except KernelDied:
+                    with self._lock:
+                        self.stats.crashed += 1
+                    self._close_kernel(session)
+                    return (
+                        "RuntimeError: the python process exited, possibly "
+                        "because it ran out of memory. The python session was "
+                        "restarted and its state was lost."
+                    )
+        finally:
+            with self._lock:
+                session.busy -= 1
+                session.last_used = time.monotonic()
+
+    def close(self) -> None:
+        self._stop.set()
+        with self._lock:
+            self._closed = True
+            sessions = list(self._sessions.values())
+            self._sessions.clear()
+            self._aliases.clear()
+        for session in sessions:
+            with session.lock:
+                self._close_kernel(session)
+
+
+def create_kernel_sessions(
+    backend: str = "docker",
+    max_sessions: int = DEFAULT_MAX_SESSIONS,
+    idle_timeout_s: float = DEFAULT_IDLE_TIMEOUT_S,
+    timeout_s: float = DEFAULT_TIMEOUT_S,
+) -> KernelSessions:
+    if backend not in KERNEL_BACKENDS:
+        raise ValueError(
+            f"Unknown sandbox backend {backend!r}, "
+            f"expected one of {sorted(KERNEL_BACKENDS)}"
+        )
+    return KernelSessions(
+        KERNEL_BACKENDS[backend], max_sessions, idle_timeout_s, timeout_s
+    )
+
+
+_default_sessions: Optional[KernelSessions] = None
+_default_sessions_lock = threading.Lock()
+
+
+def default_kernel_sessions() -> KernelSessions:
+    """Process-wide sessions configured by ``PYTHON_SANDBOX``."""
+    global _default_sessions
+    with _default_sessions_lock:
+        if _default_sessions is None:
+            _default_sessions = create_kernel_sessions(
+                os.environ.get("PYTHON_SANDBOX", "docker")
+            )
+            _default_sessions.start()
+        return _default_sessions
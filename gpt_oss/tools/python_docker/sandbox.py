@@ -0,0 +1,485 @@
+"""
+Pre-started sandboxes for the python tool.
+
+Starting a container (or even an interpreter) for every tool call costs far
+more than running the typical script. ``SandboxPool`` keeps a few sandboxes
+started ahead of time, hands one out per call and resets it in the background
+before it is reused. Scripts are written to the interpreter's stdin instead of
+being copied into the sandbox as a file.
+
+Two backends are available: ``docker`` runs each sandbox in a ``python:3.11``
+container, ``local`` runs a subprocess with resource limits in an empty
+temporary directory. The local backend is not an isolation boundary; use it
+where docker is unavailable and the code is trusted.
+"""
+
+import os
+import shutil
+import signal
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from abc import ABC, abstractmethod
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from typing import Callable, Optional
+
+import docker
+from docker.utils.socket import consume_socket_output, frames_iter
+
+DEFAULT_IMAGE = "python:3.11"
+DEFAULT_POOL_SIZE = 2
+DEFAULT_MAX_USES = 100
+DEFAULT_TIMEOUT_S = 60.0
+# exit status of a process killed with SIGKILL, as reported by the shell
+_KILLED = 128 + signal.SIGKILL
+# directories of a docker sandbox that reset() cleans
+_SCRATCH_DIRS = ("/sandbox", "/tmp")
+
+
+class SandboxTimeout(Exception):
+    def __init__(self, output: str):
+        super().__init__("sandbox execution timed out")
+        self.output = output
+
+
+class Sandbox(ABC):
+    """A started environment that runs one script at a time."""
+
+    uses: int = 0
+    # where the python tool tells the model its code runs
+    description: str = "sandbox"
+
+    @abstractmethod
+    def start(self) -> None:
+        """Prepares the sandbox so that ``run`` starts executing immediately."""
+
+    @abstractmethod
+    def run(self, script: str, timeout_s: float) -> str:
+        """Runs the script and returns its combined stdout and stderr."""
+
+    @abstractmethod
+    def reset(self) -> bool:
+        """
+        Removes what the last script left behind. Returns False if the script
+        changed the sandbox in a way reset cannot undo, and it must be replaced.
+        """
+
+    @abstractmethod
+    def close(self) -> None:
+        pass
+
+
+_docker_client = None
+
+
+def get_docker_client(image: str):
+    global _docker_client
+    if _docker_client is None:
+        _docker_client = docker.from_env()
+    # pull the image if not present
+    try:
+        _docker_client.images.get(image)
+    except docker.errors.ImageNotFound:
+        _docker_client.images.pull(image)
+    return _docker_client
+
+
+class DockerSandbox(Sandbox):
+    description = "docker container"
+
+    def __init__(self, image: str = DEFAULT_IMAGE):
+        self.image = image
+        self.container = None
+
+    def start(self) -> None:
+        self.client = get_docker_client(self.image)
+        self.container = self.client.containers.create(
+            self.image, command="sleep infinity", working_dir="/sandbox", detach=True
+        )
+        self.container.start()
+        # paths the container changed from the image before running anything
+        self._baseline = self._changed_paths()
+
+    def _changed_paths(self) -> set[str]:
+        return {change["Path"] for change in self.container.diff() or []}
+
+    def run(self, script: str, timeout_s: float) -> str:
+        # `timeout` ends the exec (and with it the output stream) when the
+        # script runs too long; the socket itself has no read timeout
+        exec_id = self.client.api.exec_create(
+            self.container.id,
+            ["timeout", "-s", "KILL", f"{timeout_s:g}", "python", "-"],
+            stdin=True,
+            workdir="/sandbox",
+        )["Id"]
+        sock = self.client.api.exec_start(exec_id, socket=True)
+        try:
+            raw = getattr(sock, "_sock", sock)
+            raw.sendall(script.encode("utf-8"))
+            raw.shutdown(socket.SHUT_WR)
+            output = consume_socket_output(frames_iter(sock, tty=False))
+        finally:
+            sock.close()
+        output = output.decode("utf-8", errors="replace")
+        if self.client.api.exec_inspect(exec_id)["ExitCode"] == _KILLED:
+            raise SandboxTimeout(output)
+        return output
+
+    def reset(self) -> bool:
+        # `kill -1` signals every process but the shell itself and PID 1, so
+        # background processes of the script are gone before its files
+        self.container.exec_run(
+            ["sh", "-c", "kill -9 -1; rm -rf /sandbox/* /sandbox/.[!.]* /tmp/*"],
+            workdir="/",
+        )
+        # every run is a new exec with the container's environment, but files
+        # written elsewhere (installed packages, edited configuration) stay
+        for path in self._changed_paths() - self._baseline:
+            if not any(
+                path == scratch or path.startswith(scratch + "/")
+                for scratch in _SCRATCH_DIRS
+            ):
+                return False
+        return True
+
+    def close(self) -> None:
+        if self.container is not None:
+            self.container.remove(force=True)
+            self.container = None
+
+
+# sets the limits given as its first two arguments, then execs the command
+# that follows them
+_LIMIT_AND_EXEC = """
+import os, resource, sys
+for name, value in zip(("RLIMIT_CPU", "RLIMIT_AS"), sys.argv[1:3]):
+    if value:
+        resource.setrlimit(getattr(resource, name), (int(value), int(value)))
+os.execvp(sys.argv[3], sys.argv[3:])
+"""
+
+
+def with_resource_limits(
+    command: list[str], cpu_seconds: Optional[int], memory_bytes: Optional[int]
+) -> list[str]:
+    """
+    Wraps a python ``command`` so that it runs with the limits applied. The
+    limits are set by an interpreter that then execs the command, since a
+    ``preexec_fn`` is not safe in a process with threads.
+    """
+    limits = [
+        "" if limit is None else str(limit) for limit in (cpu_seconds, memory_bytes)
+    ]
+    return [command[0], "-I", "-c", _LIMIT_AND_EXEC, *limits, *command]
+
+
+class LocalSandbox(Sandbox):
+    """
+    An isolated-mode interpreter that is started ahead of time and blocks on
+    its stdin until a script arrives. Every run gets a fresh interpreter.
+    """
+
+    def __init__(
+        self,
+        python: str = sys.executable,
+        cpu_seconds: Optional[int] = 60,
+        memory_bytes: Optional[int] = 4 * 2**30,
+    ):
+        self.python = python
+        self.cpu_seconds = cpu_seconds
+        self.memory_bytes = memory_bytes
+        self.workdir: Optional[str] = None
+        self.process: Optional[subprocess.Popen] = None
+
+    def _spawn(self) -> None:
+        self.process = subprocess.Popen(
+            with_resource_limits(
+                [self.python, "-I", "-"], self.cpu_seconds, self.memory_bytes
+            ),
+            stdin=subprocess.PIPE,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.STDOUT,
+            cwd=self.workdir,
+            env={"PATH": os.defpath, "HOME": self.workdir, "TMPDIR": self.workdir},
+            # a process group of its own, so that a timeout kills its children
+            start_new_session=True,
+        )
+
+    def _kill(self) -> None:
+        try:
+            os.killpg(self.process.pid, signal.SIGKILL)
+        except ProcessLookupError:
+            pass
+
+    def start(self) -> None:
+        self.workdir = tempfile.mkdtemp(prefix="gpt-oss-sandbox-")
+        self._spawn()
+
+    def run(self, script: str, timeout_s: float) -> str:
+        try:
+            output, _ = self.process.communicate(
+                script.encode("utf-8"), timeout=timeout_s
+            )
+        except subprocess.TimeoutExpired:
+            self._kill()
+            output, _ = self.process.communicate()
+            raise SandboxTimeout(output.decode("utf-8", errors="replace"))
+        finally:
+            # background processes the script started
+            self._kill()
+        return output.decode("utf-8", errors="replace")
+
+    def reset(self) -> bool:
+        for name in os.listdir(self.workdir):
+            path = os.path.join(self.workdir, name)
+            if os.path.isdir(path) and not os.path.islink(path):
+                shutil.rmtree(path)
+            else:
+                os.remove(path)
+        self._spawn()
+        return True
+
+    def close(self) -> None:
+        if self.process is not None:
+            self._kill()
+            self.process.wait()
+            for stream in (self.process.stdin, self.process.stdout):
+                if stream is not None:
+                    stream.close()
+            self.process = None
+        if self.workdir is not None:
+            shutil.rmtree(self.workdir, ignore_errors=True)
+            self.workdir = None
+
+
+SANDBOX_BACKENDS: dict[str, Callable[[], Sandbox]] = {
+    "docker": DockerSandbox,
+    "local": LocalSandbox,
+}
+
+
+@dataclass
+class SandboxPoolStats:
+    # runs that found a started sandbox vs. ones that had to start one
+    warm_runs: int = 0
+    cold_runs: int = 0
+    warm_seconds: float = 0.0
+    cold_seconds: float = 0.0
+    timeouts: int = 0
+    # sandboxes retired after `max_uses` runs
+    recycled: int = 0
+    # sandboxes thrown away after a timeout or an error
+    discarded: int = 0
+    # sandboxes replaced because a script changed what reset cannot restore
+    dirty: int = 0
+
+    @property
+    def hit_ratio(self) -> float:
+        runs = self.warm_runs + self.cold_runs
+        return self.warm_runs / runs if runs else 0.0
+
+    @property
+    def mean_warm_latency_s(self) -> float:
+        return self.warm_seconds / self.warm_runs if self.warm_runs else 0.0
+
+    @property
+    def mean_cold_latency_s(self) -> float:
+        return self.cold_seconds / self.cold_runs if self.cold_runs else 0.0
+
+
+class SandboxPool:
+    """
+    Keeps ``size`` sandboxes started. ``run`` blocks, so call it from a worker
+    thread. Resetting a used sandbox and starting replacements happen on the
+    pool's own threads, off the path of the caller.
+    """
+
+    def __init__(
+        self,
+        factory: Callable[[], Sandbox] = DockerSandbox,
+        size: int = DEFAULT_POOL_SIZE,
+        max_uses: Optional[int] = DEFAULT_MAX_USES,
+        timeout_s: float = DEFAULT_TIMEOUT_S,
+    ):
+        self.factory = factory
+        self.size = size
+        # None reuses a sandbox until it fails
+        self.max_uses = max_uses
+        self.timeout_s = timeout_s
+        self.stats = SandboxPoolStats()
+        self._idle: deque[Sandbox] = deque()
+        # idle, running and starting sandboxes
+        self._live = 0
+        self._closed = False
+        self._lock = threading.Lock()
+        self._background = ThreadPoolExecutor(
+            max_workers=max(1, size), thread_name_prefix="sandbox"
+        )
+
+    @property
+    def idle(self) -> int:
+        return len(self._idle)
+
+    def start(self) -> None:
+        """Starts filling the pool without waiting for it."""
+        self._background.submit(self._fill)
+
+    def _create(self) -> Sandbox:
+        sandbox = self.factory()
+        try:
+            sandbox.start()
+        except BaseException:
+            sandbox.close()
+            raise
+        return sandbox
+
+    def _fill(self) -> None:
+        while True:
+            with self._lock:
+                if self._closed or self._live >= self.size:
+                    return
+                self._live += 1
+            try:
+                sandbox = self._create()
+            except Exception as e:
+                print(f"Error starting sandbox: {e}")
+                with self._lock:
+                    self._live -= 1
+                return
+            self._put(sandbox)
+
+    def _put(self, sandbox: Sandbox) -> None:
+        with self._lock:
+            if not self._closed:
+                self._idle.append(sandbox)
+                return
+            self._live -= 1
+        sandbox.close()
+
+    def _retire(self, sandbox: Sandbox) -> None:
+        with self._lock:
+            self._live -= 1
+        sandbox.close()
+        self._fill()
+
+    def _recycle(self, sandbox: Sandbox, healthy: bool) -> None:
+        sandbox.uses += 1
+        with self._lock:
+            keep = not self._closed and self._live <= self.size
+            if not healthy:
+                self.stats.discarded += 1
+            elif self.max_uses is not None and sandbox.uses >= self.max_uses:
+                self.stats.recycled += 1
+                keep = False
+        if not (healthy and keep):
+            self._retire(sandbox)
+            return
+        try:
+            clean = sandbox.reset()
+        except Exception as e:
+            print(f"Error resetting sandbox: {e}")
+            with self._lock:
+                self.stats.discarded += 1
+            self._retire(sandbox)
+            return
+        if not clean:
+            with self._lock:
+                self.stats.dirty += 1
+            self._retire(sandbox)
+            return
+        self._put(sandbox)
+
+    def run(self, script: str) -> str:
+        start = time.monotonic()
+        with self._lock:
+            if self._closed:
+                raise RuntimeError("sandbox pool is closed")
+            sandbox = self._idle.popleft() if self._idle else None
+            warm = sandbox is not None
+            if not warm:
+                self._live += 1
+        if not warm:
+            try:
+                sandbox = self._create()
+            except BaseException:
+                with self._lock:
+                    self._live -= 1
+                raise
+
+        healthy = False
+        try:
+            output = sandbox.run(script, self.timeout_s)
+            healthy = True
+        except SandboxTimeout as e:
+            with self._lock:
+                self.stats.timeouts += 1
+            output = (
+                f"{e.output}\nTimeoutError: execution exceeded "
+                f"{self.timeout_s:g} seconds"
+            )
+        finally:
+            elapsed = time.monotonic() - start
+            with self._lock:
+                if warm:
+                    self.stats.warm_runs += 1
+                    self.stats.warm_seconds += elapsed
+                else:
+                    self.stats.cold_runs += 1
+                    self.stats.cold_seconds += elapsed
+            try:
+                self._background.submit(self._recycle, sandbox, healthy)
+            except RuntimeError:
+                # the pool was closed while the script ran
+                sandbox.close()
+        return output
+
+    def close(self) -> None:
+        with self._lock:
+            self._closed = True
+            idle = list(self._idle)
+            self._idle.clear()
+            self._live -= len(idle)
+        for sandbox in idle:
+            sandbox.close()
+        self._background.shutdown(wait=False, cancel_futures=True)
+
+
+def create_sandbox_pool(
+    backend: str = "docker",
+    size: int = DEFAULT_POOL_SIZE,
+    max_uses: Optional[int] = DEFAULT_MAX_USES,
+    timeout_s: float = DEFAULT_TIMEOUT_S,
+) -> SandboxPool:
+    if backend not in SANDBOX_BACKENDS:
+        raise ValueError(
+            f"Unknown sandbox backend {backend!r}, "
+            f"expected one of {sorted(SANDBOX_BACKENDS)}"
+        )
+    return SandboxPool(SANDBOX_BACKENDS[backend], size, max_uses, timeout_s)
+
+
+def default_sandbox_backend() -> str:
+    """The backend of the default pool, set with ``PYTHON_SANDBOX``."""
+    return os.environ.get("PYTHON_SANDBOX", "docker")
+
+
+_default_pool: Optional[SandboxPool] = None
+_default_pool_lock = threading.Lock()
+
+
+def default_sandbox_pool() -> SandboxPool:
+    """The pool used by python tools that were not given one."""
+    global _default_pool
+    with _default_pool_lock:
+        if _default_pool is None:
+            _default_pool = create_sandbox_pool(
+                default_sandbox_backend(),
+                int(os.environ.get("PYTHON_SANDBOX_POOL_SIZE", DEFAULT_POOL_SIZE)),
+            )
+            _default_pool.start()
+        return _default_pool
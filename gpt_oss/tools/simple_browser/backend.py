@@ -20,6 +20,7 @@ from tenacity import (
     wait_exponential,
 )
 
+from ..tool import call_on_background_thread
 from .page_contents import (
     Extract,
     FetchResult,
@@ -157,7 +158,9 @@ class ExaBackend(Backend):
         results = data.get("results", [])
         if not results:
             raise BackendError(f"No contents returned for {url}")
-        return process_html(
+        # converting a large page takes long enough to stall the event loop
+        return await call_on_background_thread(
+            process_html,
             html=results[0].get("text", ""),
             url=url,
             title=results[0].get("title", ""),
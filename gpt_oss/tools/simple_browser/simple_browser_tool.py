@@ -182,6 +182,105 @@ def strip_links(text: str) -> str:
     return text
 
 
+def _extract_domain(url: str) -> str:
+    try:
+        return unquote(url).split("/")[2]
+    except Exception:
+        return url
+
+
+def replace_citations(
+    text: str, cursor_to_url: dict[str, str], offset: int = 0
+) -> tuple[str, list[dict[str, Any]]]:
+    """
+    Replaces complete citations in `text` by ([domain](url)).
+    Annotation indices are shifted by `offset`, the length of any normalized text
+    preceding `text`. Citations whose cursor is unknown are kept as-is.
+    """
+    new_content = ""
+    last_idx = 0
+    annotations = []
+
+    for match in CITATION_OUTPUT_PATTERN.finditer(text):
+        url = cursor_to_url.get(match.group("cursor"), None)
+
+        # Add text before the citation
+        new_content += text[last_idx:match.start()]
+
+        if url:
+            domain = _extract_domain(url)
+            replacement = f" ([{domain}]({url})) "
+            start_index = offset + len(new_content)
+            annotations.append({
+                "start_index": start_index,
+                "end_index": start_index + len(replacement),
+                "title": domain,
+                "url": url,
+                "type": "url_citation",
+            })
+            new_content += replacement
+        else:
+            # Keep the original citation format if cursor is missing
+            new_content += match.group(0)
+
+        last_idx = match.end()
+
+    new_content += text[last_idx:]
+    return new_content, annotations
+
+
+class CitationNormalizer:
+    """
+    Incremental version of `SimpleBrowserTool.normalize_citations` for streamed text.
+
+    Each call to `feed` only looks at the new text plus a possibly unfinished
+    citation held back from previous calls, so normalizing a long answer costs
+    O(n) overall instead of re-scanning everything for every token.
+    Annotation indices refer to the normalized text emitted so far.
+    """
+
+    # give up on an unfinished citation that grows beyond this and emit it verbatim
+    MAX_PENDING_CHARS = 512
+
+    def __init__(self, cursor_to_url: Callable[[], dict[str, str]]):
+        self._cursor_to_url = cursor_to_url
+        self.pending = ""
+        self.emitted_length = 0
+        self.annotations: list[dict[str, Any]] = []
+
+    @property
+    def has_partial_citation(self) -> bool:
+        return bool(self.pending)
+
+    def feed(self, delta: str) -> tuple[str, list[dict[str, Any]]]:
+        """Returns the normalized text that is safe to emit and its new annotations."""
+        text = self.pending + delta
+        self.pending = ""
+        # a partial citation can only start at the last 【
+        partial_start = text.rfind("【")
+        if partial_start != -1:
+            partial = PARTIAL_FINAL_LINK_PATTERN.match(text, partial_start)
+            if partial is not None and len(text) - partial_start <= self.MAX_PENDING_CHARS:
+                self.pending = text[partial_start:]
+                text = text[:partial_start]
+        if not text:
+            return "", []
+
+        if "【" in text:
+            normalized, annotations = replace_citations(text, self._cursor_to_url(), self.emitted_length)
+        else:
+            normalized, annotations = text, []
+        self.emitted_length += len(normalized)
+        self.annotations.extend(annotations)
+        return normalized, annotations
+
+    def flush(self) -> str:
+        """Returns held-back text of an unfinished citation verbatim."""
+        text, self.pending = self.pending, ""
+        self.emitted_length += len(text)
+        return text
+
+
 def maybe_get_function_args(
     message: Message, tool_name: str = "browser"
 ) -> dict[str, Any] | None:
@@ -617,6 +716,13 @@ sources=""" + self.backend.source
             raise ValueError("should not be here")
 
 
+    def _cursor_to_url(self) -> dict[str, str]:
+        return {str(idx): url for idx, url in enumerate(self.tool_state.page_stack)}
+
+    def citation_normalizer(self) -> "CitationNormalizer":
+        """Returns a streaming counterpart of `normalize_citations` for one message."""
+        return CitationNormalizer(self._cursor_to_url)
+
     def normalize_citations(self, old_content: str, hide_partial_citations: bool = False) -> tuple[str, list[dict[str, Any]], bool]:
         """
         Returns a tuple of (new_message, annotations, has_partial_citations)
@@ -629,68 +735,6 @@ sources=""" + self.backend.source
         if hide_partial_citations and has_partial_citations:
             old_content = PARTIAL_FINAL_LINK_PATTERN.sub("", old_content)
 
-        matches = []
-        for match in CITATION_OUTPUT_PATTERN.finditer(old_content):
-            cursor = match.group("cursor")
-            content = match.group("content")
-            start_idx = match.start()
-            end_idx = match.end()
-            matches.append({
-                "cursor": cursor,
-                "content": content,
-                "start": start_idx,
-                "end": end_idx
-            })
-
-        # Build a mapping from cursor to url
-        cursor_to_url = {}
-        for idx, url in enumerate(self.tool_state.page_stack):
-            cursor_to_url[str(idx)] = url
-
-        def extract_domain(url):
-            try:
-                return unquote(url).split("/")[2]
-            except Exception:
-                return url
-
-        new_content = ""
-        last_idx = 0
-        annotations = []
-        running_offset = 0  # Offset due to length changes in replacements
-
-        for m in matches:
-            cursor = m["cursor"]
-            url = cursor_to_url.get(cursor, None)
-            orig_start = m["start"]
-            orig_end = m["end"]
-
-            # Add text before the citation
-            new_content += old_content[last_idx:orig_start]
-
-            if url:
-                domain = extract_domain(url)
-                replacement = f" ([{domain}]({url})) "
-                # The start and end indices in the new content
-                start_index = len(new_content)
-                end_index = start_index + len(replacement)
-                annotations.append({
-                    "start_index": start_index,
-                    "end_index": end_index,
-                    "title": domain,
-                    "url": url,
-                    "type": "url_citation",
-                })
-                new_content += replacement
-            else:
-                # Keep the original citation format if cursor is missing
-                replacement = old_content[orig_start:orig_end]
-                start_index = len(new_content)
-                end_index = start_index + len(replacement)
-                # No annotation for missing url, but could add if desired
-                new_content += replacement
-
-            last_idx = orig_end
-
-        new_content += old_content[last_idx:]
+        new_content, annotations = replace_citations(old_content, self._cursor_to_url())
         return new_content, annotations, has_partial_citations
 
@@ -1,6 +1,10 @@
+import asyncio
+import contextvars
+import functools
 from abc import ABC, abstractmethod
-from uuid import UUID, uuid4
-from typing import AsyncIterator
+from concurrent.futures import Executor
+from uuid import UUID
+from typing import AsyncIterator, Callable, TypeVar
 
 from openai_harmony import (
     Author,
@@ -9,6 +13,24 @@ from openai_harmony import (
     TextContent,
 )
 
+T = TypeVar("T")
+
+# thread pool for blocking tool work; None uses the event loop's default
+tool_thread_pool: contextvars.ContextVar[Executor | None] = contextvars.ContextVar(
+    "tool_thread_pool", default=None
+)
+
+
+async def call_on_background_thread(fn: Callable[..., T], *args, **kwargs) -> T:
+    """
+    Run a blocking function on the tool thread pool so it does not stall the
+    event loop (and with it, generation for every other session).
+    """
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(
+        tool_thread_pool.get(), functools.partial(fn, *args, **kwargs)
+    )
+
 
 def _maybe_update_inplace_and_validate_channel(
     *, input_message: Message, tool_message: Message
@@ -89,12 +111,14 @@ class Tool(ABC):
         self, error_message: str, id: UUID | None = None, channel: str | None = None
     ) -> Message:
         """
-        Return an error message that's from this tool.
+        Return an error message that's from this tool. ``id`` is unused and
+        only kept for compatibility.
         """
-        return Message(
-            id=id if id else uuid4(),
-            author=Author(role=Role.TOOL, name=self.name),
-            content=TextContent(text=error_message), # TODO: Use SystemError instead
-            channel=channel,
+        message = Message.from_author_and_content(
+            Author.new(Role.TOOL, self.name),
+            TextContent(text=error_message),  # TODO: Use SystemError instead
         ).with_recipient("assistant")
+        if channel:
+            message = message.with_channel(channel)
+        return message
 
@@ -5,6 +5,7 @@ from dataclasses import dataclass
 
 import torch
 import torch.distributed as dist
+from torch.profiler import record_function
 
 from gpt_oss.torch.weights import Checkpoint
 
@@ -130,6 +131,7 @@ class RotaryEmbedding(torch.nn.Module):
         sin = freqs.sin() * concentration
         return cos, sin
 
+    @record_function("rope")
     def forward(
         self,
         query: torch.Tensor,
@@ -214,34 +216,40 @@ class AttentionBlock(torch.nn.Module):
             device=device,
         )
 
+    @record_function("attn")
     def forward(self, x: torch.Tensor) -> torch.Tensor:
-        t = self.norm(x)
-        qkv = self.qkv(t)
-        q = qkv[:, : self.num_attention_heads * self.head_dim].contiguous()
-        k = qkv[
-            :,
-            self.num_attention_heads
-            * self.head_dim : (self.num_attention_heads + self.num_key_value_heads)
-            * self.head_dim,
-        ].contiguous()
-        v = qkv[
-            :,
-            (self.num_attention_heads + self.num_key_value_heads)
-            * self.head_dim : (self.num_attention_heads + 2 * self.num_key_value_heads)
-            * self.head_dim,
-        ].contiguous()
-
-        q = q.view(
-            -1,
-            self.num_key_value_heads,
-            self.num_attention_heads // self.num_key_value_heads,
-            self.head_dim,
-        )
-        k = k.view(-1, self.num_key_value_heads, self.head_dim)
-        v = v.view(-1, self.num_key_value_heads, self.head_dim)
+        with record_function("qkv"):
+            t = self.norm(x)
+            qkv = self.qkv(t)
+            q = qkv[:, : self.num_attention_heads * self.head_dim].contiguous()
+            k = qkv[
+                :,
+                self.num_attention_heads
+                * self.head_dim : (self.num_attention_heads + self.num_key_value_heads)
+                * self.head_dim,
+            ].contiguous()
+            v = qkv[
+                :,
+                (self.num_attention_heads + self.num_key_value_heads)
+                * self.head_dim : (
+                    self.num_attention_heads + 2 * self.num_key_value_heads
+                )
+                * self.head_dim,
+            ].contiguous()
+
+            q = q.view(
+                -1,
+                self.num_key_value_heads,
+                self.num_attention_heads // self.num_key_value_heads,
+                self.head_dim,
+            )
+            k = k.view(-1, self.num_key_value_heads, self.head_dim)
+            v = v.view(-1, self.num_key_value_heads, self.head_dim)
         q, k = self.rope(q, k)
-        t = sdpa(q, k, v, self.sinks, self.sm_scale, self.sliding_window)
-        t = self.out(t)
+        with record_function("attn_kernel"):
+            t = sdpa(q, k, v, self.sinks, self.sm_scale, self.sliding_window)
+        with record_function("c_proj"):
+            t = self.out(t)
         t = x + t
         return t
 
@@ -309,29 +317,34 @@ class MLPBlock(torch.nn.Module):
             )
         )
 
+    @record_function("mlp")
     def forward(self, x: torch.Tensor) -> torch.Tensor:
         t = self.norm(x)
-        g = self.gate(t)
-        experts = torch.topk(g, k=self.experts_per_token, dim=-1, sorted=True)
-        expert_weights = torch.nn.functional.softmax(experts.values, dim=1)
-        expert_indices = experts.indices
+        with record_function("wg"):
+            g = self.gate(t)
+        with record_function("routing"):
+            experts = torch.topk(g, k=self.experts_per_token, dim=-1, sorted=True)
+            expert_weights = torch.nn.functional.softmax(experts.values, dim=1)
+            expert_indices = experts.indices
 
         # MLP #1
-        mlp1_weight = self.mlp1_weight[expert_indices, ...]
-        mlp1_bias = self.mlp1_bias[expert_indices, ...]
-        t = torch.einsum("beck,bk->bec", mlp1_weight, t) + mlp1_bias
-        t = swiglu(t, limit=self.swiglu_limit)
+        with record_function("w1+swiglu"):
+            mlp1_weight = self.mlp1_weight[expert_indices, ...]
+            mlp1_bias = self.mlp1_bias[expert_indices, ...]
+            t = torch.einsum("beck,bk->bec", mlp1_weight, t) + mlp1_bias
+            t = swiglu(t, limit=self.swiglu_limit)
 
         # MLP #2
-        mlp2_weight = self.mlp2_weight[expert_indices, ...]
-        mlp2_bias = self.mlp2_bias[expert_indices, ...]
-        t = torch.einsum("beck,bek->bec", mlp2_weight, t)
-        if self.world_size > 1:
-            dist.all_reduce(t, op=dist.ReduceOp.SUM)
-        t += mlp2_bias
+        with record_function("w2"):
+            mlp2_weight = self.mlp2_weight[expert_indices, ...]
+            mlp2_bias = self.mlp2_bias[expert_indices, ...]
+            t = torch.einsum("beck,bek->bec", mlp2_weight, t)
+            if self.world_size > 1:
+                dist.all_reduce(t, op=dist.ReduceOp.SUM)
+            t += mlp2_bias
 
-        # Weighted sum of experts
-        t = torch.einsum("bec,be->bc", t, expert_weights)
+            # Weighted sum of experts
+            t = torch.einsum("bec,be->bc", t, expert_weights)
 
         return x + t
 
@@ -380,11 +393,15 @@ class Transformer(torch.nn.Module):
         )
 
     def forward(self, x: torch.Tensor) -> torch.Tensor:
-        x = self.embedding(x)
+        with record_function("embedding"):
+            x = self.embedding(x)
         for block in self.block:
-            x = block(x)
-        x = self.norm(x)
-        x = self.unembedding(x)
+            with record_function("block"):
+                x = block(x)
+        with record_function("norm_f"):
+            x = self.norm(x)
+        with record_function("unembedding"):
+            x = self.unembedding(x)
         return x
 
     @staticmethod
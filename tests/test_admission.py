@@ -0,0 +1,81 @@
+import asyncio
+
+import httpx
+import pytest
+
+from gpt_oss.responses_api.admission import AdmissionController, AdmissionRejected
+from gpt_oss.responses_api.api_server import create_api_server
+from gpt_oss.responses_api.inference import stub
+
+
+def test_requests_queue_in_order_and_overflow_is_rejected():
+    async def main():
+        controller = AdmissionController(max_tokens=100, max_queued=2)
+        first = await controller.acquire(60)
+        second = asyncio.create_task(controller.acquire(60))
+        third = asyncio.create_task(controller.acquire(10))
+        await asyncio.sleep(0)
+        assert controller.queue_depth == 2
+
+        with pytest.raises(AdmissionRejected) as rejected:
+            await controller.acquire(10)
+        assert rejected.value.retry_after >= 1
+        # the small request fits but does not overtake the one ahead of it
+        assert not third.done()
+
+        first.release()
+        first.release()
+        second_ticket, third_ticket = await asyncio.gather(second, third)
+        assert controller.reserved_tokens == 70
+        assert controller.active == 2
+        second_ticket.release()
+        third_ticket.release()
+        assert controller.reserved_tokens == 0
+        assert controller.stats.admitted == 3
+        assert controller.stats.queued == 2
+        assert controller.stats.rejected == 1
+
+    asyncio.run(main())
+
+
+def test_queued_request_times_out():
+    async def main():
+        controller = AdmissionController(max_active=1, max_queue_wait_s=0.01)
+        ticket = await controller.acquire(1)
+        with pytest.raises(AdmissionRejected):
+            await controller.acquire(1)
+        assert controller.queue_depth == 0
+        assert controller.stats.timed_out == 1
+        ticket.release()
+        assert controller.active == 0
+
+    asyncio.run(main())
+
+
+def test_oversized_request_is_clamped_to_the_budget():
+    controller = AdmissionController(max_tokens=100)
+    assert controller.estimate_tokens(80, 50) == 100
+    assert AdmissionController().estimate_tokens(80, None) == 80
+
+
+def test_server_rejects_with_retry_after(harmony_encoding, monkeypatch):
+    monkeypatch.setattr(stub, "STEP_DELAY_S", 0.005)
+    admission = AdmissionController(max_active=1, max_queued=0)
+    app = create_api_server(stub.setup_model(""), harmony_encoding, admission=admission)
+
+    async def main():
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(
+            transport=transport, base_url="http://test"
+        ) as client:
+            return await asyncio.gather(
+                client.post("/v1/responses", json={"input": "First"}),
+                client.post("/v1/responses", json={"input": "Second"}),
+            )
+
+    first, second = asyncio.run(main())
+    assert first.status_code == 200
+    assert second.status_code == 429
+    assert int(second.headers["Retry-After"]) >= 1
+    assert admission.active == 0
+    assert admission.reserved_tokens == 0
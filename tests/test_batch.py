@@ -0,0 +1,64 @@
+import asyncio
+import json
+
+from gpt_oss.responses_api.api_server import create_api_server
+from gpt_oss.responses_api.batch import (
+    BatchRequest,
+    completed_ids,
+    prefix_sort_key,
+    read_requests,
+    run_batch,
+)
+from gpt_oss.responses_api.inference import stub
+
+
+def test_prefix_sort_groups_shared_instructions():
+    bodies = [
+        {"instructions": "B", "input": "1"},
+        {"instructions": "A", "input": "2"},
+        {"instructions": "B", "input": "0"},
+        {"instructions": "A", "input": "1"},
+    ]
+    ordered = sorted(bodies, key=prefix_sort_key)
+    assert [(b["instructions"], b["input"]) for b in ordered] == [
+        ("A", "1"),
+        ("A", "2"),
+        ("B", "0"),
+        ("B", "1"),
+    ]
+
+
+def test_batch_writes_results_and_resumes(harmony_encoding, monkeypatch, tmp_path):
+    monkeypatch.setattr(stub, "STEP_DELAY_S", 0)
+    input_path = tmp_path / "requests.jsonl"
+    output_path = tmp_path / "results.jsonl"
+    lines = [
+        {"custom_id": "a", "body": {"input": "Question a", "stream": True}},
+        {"input": "Question b"},
+        {"custom_id": "bad", "body": {"input": "Question c", "tool_choice": "x"}},
+    ]
+    input_path.write_text("".join(json.dumps(line) + "\n" for line in lines))
+    requests = read_requests(str(input_path))
+    assert [r.custom_id for r in requests] == ["a", "line-2", "bad"]
+
+    app = create_api_server(stub.setup_model(""), harmony_encoding)
+    summary = asyncio.run(run_batch(app, requests, str(output_path), concurrency=2))
+    assert (summary.succeeded, summary.failed, summary.skipped) == (2, 1, 0)
+
+    results = {
+        r["custom_id"]: r for r in map(json.loads, output_path.read_text().splitlines())
+    }
+    assert results["a"]["error"] is None
+    assert results["a"]["response"]["status_code"] == 200
+    output = results["a"]["response"]["body"]["output"]
+    assert output[-1]["content"][0]["text"].startswith("2 + 2 = 4.")
+    assert results["bad"]["response"]["status_code"] == 422
+    assert results["bad"]["error"]["code"] == "422"
+
+    # an interrupted run leaves a partial line behind
+    with open(output_path, "a") as f:
+        f.write('{"custom_id": "lin')
+    requests.append(BatchRequest("c", {"input": "Question d"}))
+    summary = asyncio.run(run_batch(app, requests, str(output_path)))
+    assert (summary.succeeded, summary.failed, summary.skipped) == (1, 1, 2)
+    assert completed_ids(str(output_path)) == {"a", "line-2", "c"}
@@ -0,0 +1,51 @@
+from gpt_oss.tools.simple_browser.simple_browser_tool import (
+    CitationNormalizer,
+    replace_citations,
+)
+
+PAGES = {"0": "https://example.com/a", "1": "https://docs.python.org/3/"}
+TEXT = (
+    "Python is popular 【1†L10-L12】 and so is the web 【0†L1】. "
+    "Unknown cursors stay 【7†L3】 and a bracket 【 alone is text."
+)
+
+
+def stream(normalizer: CitationNormalizer, text: str, chunk: int):
+    out, annotations = "", []
+    for i in range(0, len(text), chunk):
+        delta, new = normalizer.feed(text[i : i + chunk])
+        out += delta
+        annotations += new
+    return out + normalizer.flush(), annotations
+
+
+def test_streamed_normalization_matches_full_text():
+    expected_text, expected_annotations = replace_citations(TEXT, PAGES)
+    assert "(docs.python.org)" not in expected_text
+    assert "([docs.python.org](https://docs.python.org/3/))" in expected_text
+
+    for chunk in (1, 2, 3, 7, len(TEXT)):
+        text, annotations = stream(CitationNormalizer(lambda: PAGES), TEXT, chunk)
+        assert text == expected_text
+        assert annotations == expected_annotations
+        for a in annotations:
+            assert text[a["start_index"] : a["end_index"]].startswith(" ([")
+
+
+def test_partial_citation_is_held_back():
+    normalizer = CitationNormalizer(lambda: PAGES)
+    assert normalizer.feed("See 【0") == ("See ", [])
+    assert normalizer.has_partial_citation
+    assert normalizer.feed("†L1") == ("", [])
+    delta, annotations = normalizer.feed("】 done")
+    assert delta == " ([example.com](https://example.com/a))  done"
+    assert annotations[0]["start_index"] == len("See ")
+    assert not normalizer.has_partial_citation
+
+
+def test_unfinished_citation_is_released_past_lookback():
+    normalizer = CitationNormalizer(lambda: PAGES)
+    normalizer.feed("【0†")
+    delta, _ = normalizer.feed("x" * CitationNormalizer.MAX_PENDING_CHARS)
+    assert delta.startswith("【0†x")
+    assert not normalizer.has_partial_citation
@@ -0,0 +1,103 @@
+from fastapi.testclient import TestClient
+from openai_harmony import Message, Role
+
+from gpt_oss.responses_api.api_server import create_api_server
+from gpt_oss.responses_api.inference.session import InferenceBackend, InferenceSession
+
+TOOLS = [
+    {
+        "type": "function",
+        "name": "get_weather",
+        "description": "Current weather",
+        "parameters": {"type": "object", "properties": {}},
+    }
+]
+
+
+class ScriptedSession(InferenceSession):
+    def __init__(self, script: list[int]):
+        self.tokens: list[int] = []
+        self.script = list(script)
+
+    def append(self, tokens):
+        self.tokens.extend(tokens)
+
+    def step(self):
+        token = self.script.pop(0)
+        self.tokens.append(token)
+        return [token]
+
+
+class ScriptedBackend(InferenceBackend):
+    """Replays one script per request and keeps every session's sequence."""
+
+    def __init__(self, scripts: list[list[int]]):
+        self.scripts = scripts
+        self.sessions: list[ScriptedSession] = []
+
+    def open_session(self, temperature=0.0):
+        self.sessions.append(ScriptedSession(self.scripts.pop(0)))
+        return self.sessions[-1]
+
+
+def assistant_turn(encoding, *messages: Message) -> list[int]:
+    # what the model generates after the `<|start|>assistant` completion header
+    tokens = [t for m in messages for t in encoding.render(m)][2:]
+    stop = "<|call|>" if messages[-1].recipient else "<|return|>"
+    return tokens[:-1] + encoding.encode(stop, allowed_special="all")
+
+
+def test_followups_extend_the_stored_tokens(harmony_encoding):
+    enc = harmony_encoding
+    call = assistant_turn(
+        enc,
+        Message.from_role_and_content(Role.ASSISTANT, "Need the tool.").with_channel(
+            "analysis"
+        ),
+        Message.from_role_and_content(Role.ASSISTANT, "{}")
+        .with_recipient("functions.get_weather")
+        .with_channel("commentary"),
+    )
+    answer = assistant_turn(
+        enc,
+        Message.from_role_and_content(Role.ASSISTANT, "Sunny.").with_channel("final"),
+    )
+    backend = ScriptedBackend([call, answer, answer, answer])
+    app = create_api_server(backend, enc)
+    client = TestClient(app)
+
+    first = client.post(
+        "/v1/responses", json={"input": "Weather?", "tools": TOOLS, "store": True}
+    ).json()
+    call_id = first["output"][-1]["call_id"]
+    second = client.post(
+        "/v1/responses",
+        json={
+            "previous_response_id": first["id"],
+            "input": [
+                {"type": "function_call_output", "call_id": call_id, "output": "sun"}
+            ],
+            "tools": TOOLS,
+            "store": True,
+        },
+    ).json()
+    # the tool result extends exactly what the model saw and generated
+    first_sequence = backend.sessions[0].tokens
+    assert backend.sessions[1].tokens[: len(first_sequence)] == first_sequence
+
+    client.post(
+        "/v1/responses",
+        json={"previous_response_id": second["id"], "input": "Thanks", "tools": TOOLS},
+    )
+    # force the full rendering path for the same follow-up
+    store = app.state.responses_store
+    stored = store.get(second["id"])
+    store.put("resp_full", stored.request, stored.response)
+    client.post(
+        "/v1/responses",
+        json={"previous_response_id": "resp_full", "input": "Thanks", "tools": TOOLS},
+    )
+
+    fast, full = backend.sessions[2].tokens, backend.sessions[3].tokens
+    assert fast == full
+    assert "Need the tool." not in enc.decode(fast)
@@ -0,0 +1,362 @@
+import asyncio
+import json
+import threading
+import time
+
+import httpx
+
+from gpt_oss.responses_api.api_server import create_api_server
+from gpt_oss.responses_api.engine import BatchEntry, InferenceEngine
+from gpt_oss.responses_api.inference import stub
+from gpt_oss.responses_api.inference.session import (
+    InferNextTokenBackend,
+    InferNextTokenSession,
+)
+
+STOP = 99
+
+
+class FakeBatchedModel:
+    """Samples ``1000 + sequence length`` per slot and records every batch."""
+
+    def __init__(self, max_batch_size: int = 8, stop_after: int = 3):
+        self.max_batch_size = max_batch_size
+        self.stop_after = stop_after
+        self.sequences: dict[int, list[int]] = {}
+        self.batches: list[list[BatchEntry]] = []
+        self.released: list[int] = []
+        self.forks: list[tuple[int, int]] = []
+
+    def forward(self, batch):
+        self.batches.append(batch)
+        results = []
+        for entry in batch:
+            seq = self.sequences.setdefault(entry.slot, [])
+            seq.extend(entry.tokens)
+            if not entry.sample:
+                results.append([])
+                continue
+            if sum(1 for t in seq if t >= 1000) >= self.stop_after:
+                token = STOP
+            else:
+                token = 1000 + len(seq)
+            seq.append(token)
+            results.append([token])
+        return results
+
+    def release(self, slot):
+        self.released.append(slot)
+        self.sequences.pop(slot, None)
+
+    supports_fork = True
+
+    def fork(self, src_slot, dst_slot):
+        self.forks.append((src_slot, dst_slot))
+        self.sequences[dst_slot] = list(self.sequences[src_slot])
+
+
+def test_decodes_are_batched_and_prefill_is_chunked():
+    async def main():
+        model = FakeBatchedModel()
+        engine = InferenceEngine(
+            model, stop_tokens=[STOP], prefill_chunk_size=4, max_prefill_tokens=6
+        )
+        a = engine.open_session(list(range(10)))
+        b = engine.open_session(list(range(3)))
+
+        async def collect(session):
+            tokens = []
+            while not tokens or tokens[-1] != STOP:
+                tokens.append(await session.next_token())
+            return tokens
+
+        tokens_a, tokens_b = await asyncio.gather(collect(a), collect(b))
+        return model, a, b, tokens_a, tokens_b
+
+    model, a, b, tokens_a, tokens_b = asyncio.run(main())
+
+    # prefill budget of 6 tokens: 4 for `a` and 2 for `b` in the first step
+    first = model.batches[0]
+    assert [(e.slot, len(e.tokens), e.sample) for e in first] == [
+        (a.id, 4, False),
+        (b.id, 2, False),
+    ]
+    assert all(len(e.tokens) <= 4 for batch in model.batches for e in batch)
+    # once both sessions decode, they share a batch
+    assert any(
+        {e.slot for e in batch} == {a.id, b.id} and all(not e.tokens for e in batch)
+        for batch in model.batches
+    )
+    assert tokens_a == [1010, 1011, 1012, STOP]
+    assert tokens_b == [1003, 1004, 1005, STOP]
+
+
+def test_append_resumes_parked_session():
+    async def main():
+        model = FakeBatchedModel(stop_after=1)
+        engine = InferenceEngine(model, stop_tokens=[STOP])
+        session = engine.open_session([1, 2])
+        first = [await session.next_token(), await session.next_token()]
+        await asyncio.sleep(0)
+        steps_while_parked = len(model.batches)
+        await asyncio.sleep(0.01)
+        assert len(model.batches) == steps_while_parked
+
+        session.append([7, 8])
+        third = await session.next_token()
+        session.close()
+        return model, session, first, third
+
+    model, session, first, third = asyncio.run(main())
+    assert first == [1002, STOP]
+    # the sampled stop token is already part of the sequence
+    resumed = model.batches[-1][0]
+    assert resumed.tokens == [7, 8]
+    assert model.sequences == {}
+    assert resumed.new_request
+    assert third == STOP
+    assert model.released == [session.id]
+
+
+def test_samples_share_one_prefill():
+    async def main():
+        model = FakeBatchedModel(stop_after=2)
+        engine = InferenceEngine(model, stop_tokens=[STOP], prefill_chunk_size=4)
+        sessions = engine.open_sessions(list(range(10)), n=3)
+
+        async def collect(session):
+            tokens = []
+            while not tokens or tokens[-1] != STOP:
+                tokens.append(await session.next_token())
+            return tokens
+
+        return model, sessions, await asyncio.gather(*map(collect, sessions))
+
+    model, sessions, outputs = asyncio.run(main())
+    leader, *forks = sessions
+    assert model.forks == [(leader.id, fork.id) for fork in forks]
+    # the prompt minus its last token is prefilled once, then every sample
+    # feeds the last token itself
+    prefill = [
+        (e.slot, len(e.tokens)) for batch in model.batches for e in batch if e.tokens
+    ]
+    assert prefill == [
+        (leader.id, 4),
+        (leader.id, 4),
+        (leader.id, 1),
+        (leader.id, 1),
+        (forks[0].id, 1),
+        (forks[1].id, 1),
+    ]
+    assert outputs == [[1010, 1011, STOP]] * 3
+
+
+def test_concurrent_requests_with_stub_backend(harmony_encoding, monkeypatch):
+    monkeypatch.setattr(stub.time, "sleep", lambda _: None)
+    app = create_api_server(stub.setup_model(""), harmony_encoding)
+
+    async def main():
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(
+            transport=transport, base_url="http://test"
+        ) as client:
+            return await asyncio.gather(
+                *[
+                    client.post("/v1/responses", json={"input": f"Question {i}"})
+                    for i in range(3)
+                ]
+            )
+
+    responses = asyncio.run(main())
+    for response in responses:
+        assert response.status_code == 200
+        output = response.json()["output"]
+        assert output[-1]["content"][0]["text"].startswith("2 + 2 = 4.")
+
+
+def test_legacy_infer_next_token_adapter():
+    calls = []
+
+    def infer_next_token(tokens, temperature=0.0, new_request=False):
+        calls.append((list(tokens), new_request))
+        return len(tokens)
+
+    session = InferNextTokenBackend(infer_next_token).open_session()
+    session.append([5, 6])
+    assert session.step() == [2]
+    assert session.step() == [3]
+    session.append([9])
+    assert session.step() == [5]
+    assert calls == [([5, 6], True), ([5, 6, 2], False), ([5, 6, 2, 3, 9], True)]
+
+
+def test_forward_runs_off_the_event_loop():
+    class SlowModel(FakeBatchedModel):
+        def forward(self, batch):
+            self.thread = threading.current_thread().name
+            time.sleep(0.2)
+            return super().forward(batch)
+
+    async def main():
+        model = SlowModel(stop_after=1)
+        engine = InferenceEngine(model, stop_tokens=[STOP])
+        session = engine.open_session([1, 2])
+        ticks = 0
+
+        async def ticker():
+            nonlocal ticks
+            while True:
+                await asyncio.sleep(0.01)
+                ticks += 1
+
+        task = asyncio.create_task(ticker())
+        await session.next_token()
+        task.cancel()
+        session.close()
+        return model, engine, ticks
+
+    model, engine, ticks = asyncio.run(main())
+    assert model.thread.startswith("inference")
+    # the loop kept serving other coroutines while forward was sleeping
+    assert ticks >= 5
+    assert engine.stats.steps == 1
+    assert engine.stats.forward_seconds >= 0.2
+
+
+def test_release_never_overlaps_forward():
+    class CheckedModel(FakeBatchedModel):
+        running = False
+
+        def forward(self, batch):
+            self.running = True
+            time.sleep(0.02)
+            results = super().forward(batch)
+            self.running = False
+            return results
+
+        def release(self, slot):
+            self.released_during_forward = self.running
+            super().release(slot)
+
+    async def main():
+        model = CheckedModel(stop_after=1000)
+        engine = InferenceEngine(model, stop_tokens=[STOP])
+        busy = engine.open_session([1, 2], max_tokens=1000)
+        parked = engine.open_session([3], max_tokens=1)
+        await parked.next_token()
+        await busy.next_token()
+        # the next step of `busy` is running on the worker
+        await asyncio.sleep(0.01)
+        assert model.running
+        parked.close()
+        assert model.released == []
+        await engine.wait_for_steps(1)
+        released = list(model.released)
+        busy.close()
+        return model, parked, released
+
+    model, parked, released = asyncio.run(main())
+    assert released == [parked.id]
+    assert not model.released_during_forward
+
+
+def test_client_disconnect_cancels_session(harmony_encoding):
+    closed = []
+
+    class EndlessSession(InferNextTokenSession):
+        def close(self):
+            closed.append(self)
+
+    class EndlessBackend(InferNextTokenBackend):
+        def open_session(self, temperature=0.0):
+            return EndlessSession(self.infer_next_token, temperature)
+
+    text = harmony_encoding.encode("<|channel|>final<|message|>", allowed_special="all")
+    word = harmony_encoding.encode(" la")[0]
+
+    def infer_next_token(tokens, temperature=0.0, new_request=False):
+        time.sleep(0.001)
+        generated = len(tokens) - prompt_length[0]
+        return text[generated] if generated < len(text) else word
+
+    prompt_length = [0]
+    backend = EndlessBackend(infer_next_token)
+    app = create_api_server(backend, harmony_encoding)
+    engine = app.state.engine
+
+    async def main():
+        body = json.dumps({"input": "Sing", "max_output_tokens": 100_000}).encode()
+        disconnect = asyncio.Event()
+        messages = [{"type": "http.request", "body": body, "more_body": False}]
+        sent = []
+
+        async def receive():
+            if messages:
+                return messages.pop(0)
+            await disconnect.wait()
+            return {"type": "http.disconnect"}
+
+        async def send(message):
+            sent.append(message)
+
+        scope = {
+            "type": "http",
+            "asgi": {"version": "3.0"},
+            "http_version": "1.1",
+            "method": "POST",
+            "scheme": "http",
+            "path": "/v1/responses",
+            "raw_path": b"/v1/responses",
+            "query_string": b"",
+            "headers": [(b"content-type", b"application/json")],
+            "client": ("test", 1),
+            "server": ("test", 80),
+        }
+        handler = asyncio.create_task(app(scope, receive, send))
+        while engine.num_sessions == 0:
+            await asyncio.sleep(0.01)
+        session = next(iter(engine._sessions.values()))
+        prompt_length[0] = len(session.pending)
+        await asyncio.sleep(0.05)
+        disconnect.set()
+        await asyncio.wait_for(handler, timeout=5)
+        # a slot that was part of the running step is released when it returns
+        await asyncio.sleep(0.05)
+        return sent
+
+    sent = asyncio.run(main())
+    assert engine.stats.cancelled_sessions == 1
+    assert engine.num_sessions == 0
+    assert len(closed) == 1
+    assert sent[0]["status"] == 499
+
+
+def test_n_samples_are_returned_together(harmony_encoding, monkeypatch):
+    monkeypatch.setattr(stub.time, "sleep", lambda _: None)
+    app = create_api_server(stub.setup_model(""), harmony_encoding)
+
+    async def main():
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(
+            transport=transport, base_url="http://test"
+        ) as client:
+            streamed = await client.post(
+                "/v1/responses", json={"input": "Hi", "n": 2, "stream": True}
+            )
+            assert streamed.status_code == 400
+            return await client.post(
+                "/v1/responses", json={"input": "Hi", "n": 3, "store": True}
+            )
+
+    response = asyncio.run(main())
+    assert response.status_code == 200
+    body = response.json()
+    samples = body["samples"]
+    assert len(samples) == 3
+    assert samples[0]["id"] == body["id"]
+    assert len({sample["id"] for sample in samples}) == 3
+    for sample in samples:
+        assert sample["samples"] is None
+        assert sample["output"][-1]["content"][0]["text"].startswith("2 + 2 = 4.")
+        assert sample["id"] in app.state.responses_store
+    assert app.state.engine.num_sessions == 0
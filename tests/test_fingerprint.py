@@ -0,0 +1,39 @@
+from gpt_oss.responses_api.inference.fingerprint import (
+    TokenFingerprint,
+    common_prefix_length,
+)
+
+
+def test_extension_is_detected_from_hashes():
+    cached = TokenFingerprint([1, 2, 3])
+    session = TokenFingerprint([1, 2])
+    assert not cached.is_prefix_of(session)
+
+    # grows past the initial capacity one token at a time
+    for token in [3] + list(range(100)):
+        session.extend([token])
+    assert cached.is_prefix_of(session)
+    assert cached.common_prefix_length(session) == 3
+    assert session.common_prefix_length(cached) == 3
+    assert session.key() == TokenFingerprint(session.tolist()).key()
+
+    forked = session.copy()
+    forked.extend([7])
+    assert len(session) == 103
+    assert session.is_prefix_of(forked)
+
+
+def test_divergence_falls_back_to_comparing_tokens():
+    cached = TokenFingerprint([5, 6, 7, 8, 9])
+    assert cached.common_prefix_length(TokenFingerprint([5, 6, 0, 8, 9, 10])) == 2
+    assert cached.common_prefix_length([5, 6, 7]) == 3
+    assert cached.common_prefix_length([4]) == 0
+
+    cached.truncate(2)
+    assert cached.key() == TokenFingerprint([5, 6]).key()
+    cached.extend([1])
+    assert cached.tolist() == [5, 6, 1]
+    assert cached.key() == TokenFingerprint([5, 6, 1]).key()
+
+    assert common_prefix_length([1, 2, 3], [1, 2, 3, 4]) == 3
+    assert common_prefix_length([], [1]) == 0
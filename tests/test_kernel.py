@@ -0,0 +1,87 @@
+import asyncio
+
+from fastapi.testclient import TestClient
+from openai_harmony import Message, Role
+
+from gpt_oss.responses_api.api_server import create_api_server
+from gpt_oss.responses_api.inference import stub
+from gpt_oss.tools.python_docker.docker_tool import PythonTool
+from gpt_oss.tools.python_docker.kernel import KernelSessions, LocalKernel
+
+
+def test_python_tool_sessions_keep_state():
+    sessions = KernelSessions(LocalKernel, timeout_s=10)
+    tool = PythonTool(sessions=sessions, session_id="conversation")
+    assert "stateful Jupyter notebook" in tool.instruction
+
+    async def call(code: str) -> str:
+        message = (
+            Message.from_role_and_content(Role.ASSISTANT, code)
+            .with_channel("analysis")
+            .with_recipient("python")
+        )
+        return [m async for m in tool.process(message)][0].content[0].text
+
+    try:
+        assert asyncio.run(call("import math\nx = 6 * 7\nprint('set')")) == "set\n"
+        # a trailing expression is echoed like in a notebook
+        assert asyncio.run(call("math.sqrt(x * x)")) == "42.0\n"
+        error = asyncio.run(call("undefined_name"))
+        assert "NameError: name 'undefined_name' is not defined" in error
+        assert "_run" not in error
+
+        # a follow-up response continues the session of the conversation
+        sessions.alias("resp_2", "conversation")
+        sessions.alias("resp_3", "resp_2")
+        assert sessions.execute("resp_3", "x") == "42\n"
+        assert sessions.execute("other", "'x' in globals()") == "False\n"
+    finally:
+        sessions.close()
+
+    assert sessions.stats.created == 2
+    assert sessions.stats.reused == 3
+
+
+def test_sessions_are_evicted_and_restarted():
+    sessions = KernelSessions(LocalKernel, max_sessions=2, timeout_s=0.5)
+    try:
+        sessions.execute("a", "x = 1")
+        sessions.execute("b", "x = 2")
+        # over the limit: the least recently used session is closed
+        sessions.execute("c", "x = 3")
+        assert len(sessions) == 2
+        assert sessions.execute("a", "'x' in globals()") == "False\n"
+        assert sessions.stats.evicted_lru == 2
+
+        output = sessions.execute("a", "x = 4\nwhile True: pass")
+        assert output.startswith("TimeoutError: execution exceeded 0.5 seconds")
+        assert sessions.execute("a", "'x' in globals()") == "False\n"
+        assert sessions.stats.timeouts == 1
+
+        sessions.idle_timeout_s = 0
+        assert sessions.evict_idle() == 2
+        assert len(sessions) == 0
+    finally:
+        sessions.close()
+
+
+def test_only_the_first_sample_continues_the_conversation_kernel(
+    harmony_encoding, monkeypatch
+):
+    monkeypatch.setattr(stub.time, "sleep", lambda _: None)
+    sessions = KernelSessions(LocalKernel, timeout_s=10)
+    app = create_api_server(
+        stub.setup_model(""), harmony_encoding, python_sessions=sessions
+    )
+    client = TestClient(app)
+    body = {"input": "Hi", "tools": [{"type": "code_interpreter"}], "store": True}
+    try:
+        first = client.post("/v1/responses", json=body).json()["id"]
+        sessions.execute(first, "x = 1")
+        body.update(previous_response_id=first, n=2)
+        samples = client.post("/v1/responses", json=body).json()["samples"]
+        assert sessions.execute(samples[0]["id"], "x") == "1\n"
+        # the other sample does not run its code in the same kernel
+        assert sessions.execute(samples[1]["id"], "'x' in globals()") == "False\n"
+    finally:
+        sessions.close()
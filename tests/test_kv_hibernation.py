@@ -0,0 +1,44 @@
+from gpt_oss.responses_api.kv_hibernation import (
+    KVHibernationStore,
+    prefix_block_hashes,
+)
+
+
+def test_prefix_hashes_are_chained():
+    a = prefix_block_hashes([1, 2, 3, 4, 5], block_size=2)
+    b = prefix_block_hashes([1, 2, 9, 4], block_size=2)
+    c = prefix_block_hashes([7, 7, 3, 4], block_size=2)
+
+    assert len(a) == 2
+    assert a[0] == b[0]
+    assert a[1] != b[1]
+    # the same block after a different prefix hashes differently
+    assert a[1] != c[1]
+
+
+def test_put_get_roundtrip(tmp_path):
+    store = KVHibernationStore(str(tmp_path / "kv.bin"), block_nbytes=8, max_bytes=64)
+    hashes = prefix_block_hashes(list(range(8)), block_size=4)
+
+    store.put(hashes[0])[:] = b"abcdefgh"
+    store.put(hashes[1])[:] = b"12345678"
+
+    assert bytes(store.get(hashes[0])) == b"abcdefgh"
+    assert bytes(store.get(hashes[1])) == b"12345678"
+    assert store.get(b"missing") is None
+    assert store.stats.misses == 1
+    assert store.used_bytes == 16
+
+
+def test_lru_eviction_respects_disk_budget(tmp_path):
+    store = KVHibernationStore(str(tmp_path / "kv.bin"), block_nbytes=4, max_bytes=8)
+    store.put(b"a")[:] = b"aaaa"
+    store.put(b"b")[:] = b"bbbb"
+    store.get(b"a")
+    store.put(b"c")[:] = b"cccc"
+
+    assert b"a" in store
+    assert b"b" not in store
+    assert bytes(store.get(b"c")) == b"cccc"
+    assert store.stats.evicted_blocks == 1
+    assert (tmp_path / "kv.bin").stat().st_size == 8
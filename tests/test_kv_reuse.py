@@ -0,0 +1,77 @@
+from gpt_oss.responses_api.inference.fingerprint import TokenFingerprint
+from gpt_oss.responses_api.inference.kv_reuse import KVCacheSync
+from gpt_oss.responses_api.kv_hibernation import (
+    KVHibernationStore,
+    prefix_block_hashes,
+)
+from gpt_oss.responses_api.prefix_cache import RadixPrefixCache
+
+
+class FakeCache:
+    def __init__(self):
+        self.length = 0
+
+    def truncate(self, length):
+        self.length = length
+
+
+class FakeKVPool:
+    """Records the block copies between the caches and the pool."""
+
+    def __init__(self):
+        self.calls = []
+
+    def save(self, caches, start, block_ids):
+        self.calls.append(("save", start, list(block_ids)))
+
+    def load(self, caches, start, block_ids):
+        self.calls.append(("load", start, list(block_ids)))
+
+    def restore(self, caches, start, buffer):
+        self.calls.append(("restore", start, bytes(buffer)))
+
+
+def run(sync, tokens, new_request=False, fingerprint=None):
+    overlap = sync.sync(tokens, new_request, fingerprint)
+    sync.extend(tokens[overlap:])
+    return overlap
+
+
+def test_switching_sequences_restores_prefixes_from_the_prefix_cache():
+    pool = FakeKVPool()
+    cache = FakeCache()
+    sync = KVCacheSync([cache], pool, RadixPrefixCache(block_size=4, num_blocks=8))
+    first = list(range(10))
+    second = list(range(6)) + [50, 51, 52, 53]
+
+    assert run(sync, first, new_request=True) == 0
+    # decoding extends the cache without touching the prefix cache
+    fingerprint = TokenFingerprint(first + [10])
+    assert run(sync, first + [10], fingerprint=fingerprint) == 10
+    assert pool.calls == []
+
+    # a diverging sequence stashes the live cache and keeps the common prefix
+    assert run(sync, second, new_request=True) == 6
+    assert pool.calls[0][0] == "save"
+    assert cache.length == 6
+    assert sync.prefix_cache.last_hit_tokens == 6
+
+    # switching back stashes the second sequence's own block and loads the
+    # first one's past the common prefix
+    pool.calls.clear()
+    assert run(sync, first + [10, 11]) == 8
+    assert [call[:2] for call in pool.calls] == [("save", 4), ("load", 4)]
+    assert sync.cached.tolist() == first + [10, 11]
+
+
+def test_evicted_blocks_come_back_from_hibernation(tmp_path):
+    pool = FakeKVPool()
+    hibernation = KVHibernationStore(str(tmp_path / "kv.bin"), 8, 64)
+    for prefix_hash in prefix_block_hashes(list(range(9)), 4):
+        hibernation.put(prefix_hash)[:] = b"\x01" * 8
+    sync = KVCacheSync(
+        [FakeCache()], pool, RadixPrefixCache(block_size=4, num_blocks=8), hibernation
+    )
+
+    assert run(sync, list(range(9)), new_request=True) == 8
+    assert [call[:2] for call in pool.calls] == [("restore", 0), ("restore", 4)]
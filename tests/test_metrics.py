@@ -0,0 +1,66 @@
+import asyncio
+
+import httpx
+
+from gpt_oss.responses_api.api_server import create_api_server
+from gpt_oss.responses_api.inference import stub
+from gpt_oss.responses_api.metrics import Gauge, Histogram, MetricsRegistry
+
+
+def parse_samples(text: str) -> dict[str, float]:
+    samples = {}
+    for line in text.splitlines():
+        if line and not line.startswith("#"):
+            name, value = line.rsplit(" ", 1)
+            samples[name] = float(value)
+    return samples
+
+
+def test_histogram_buckets_are_cumulative():
+    registry = MetricsRegistry()
+    histogram = registry.register(Histogram("latency_seconds", "Latency.", (0.1, 1)))
+    registry.register(Gauge("unknown", "Omitted when None.", lambda: None))
+    for value in (0.05, 0.1, 0.5, 2):
+        histogram.observe(value)
+
+    text = registry.render()
+    samples = parse_samples(text)
+    assert "# TYPE latency_seconds histogram" in text
+    assert samples['latency_seconds_bucket{le="0.1"}'] == 2
+    assert samples['latency_seconds_bucket{le="1"}'] == 3
+    assert samples['latency_seconds_bucket{le="+Inf"}'] == 4
+    assert samples["latency_seconds_count"] == 4
+    assert samples["latency_seconds_sum"] == 2.65
+    assert "# TYPE unknown gauge" in text
+    assert not any(name.startswith("unknown") for name in samples)
+
+
+def test_metrics_endpoint_reports_engine_latencies(harmony_encoding, monkeypatch):
+    monkeypatch.setattr(stub.time, "sleep", lambda _: None)
+    app = create_api_server(stub.setup_model(""), harmony_encoding)
+
+    async def main():
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(
+            transport=transport, base_url="http://test"
+        ) as client:
+            response = await client.post("/v1/responses", json={"input": "Hi"})
+            assert response.status_code == 200
+            return await client.get("/metrics")
+
+    response = asyncio.run(main())
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("text/plain; version=0.0.4")
+    samples = parse_samples(response.text)
+
+    assert samples["gpt_oss_time_to_first_token_seconds_count"] == 1
+    assert samples["gpt_oss_queue_wait_seconds_count"] == 1
+    generated = samples["gpt_oss_generated_tokens_total"]
+    assert generated > 1
+    assert samples["gpt_oss_inter_token_latency_seconds_count"] == generated - 1
+    assert samples["gpt_oss_prefill_tokens_per_second_count"] >= 1
+    assert samples["gpt_oss_active_sessions"] == 0
+    assert samples["gpt_oss_prompt_tokens_total"] > 0
+    assert samples["gpt_oss_preamble_cache_hit_ratio"] == 0
+    # the stub backend has no KV cache to report
+    assert "gpt_oss_kv_cache_usage_ratio" not in samples
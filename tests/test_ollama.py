@@ -0,0 +1,247 @@
+import asyncio
+import json
+import random
+import threading
+import time
+
+from aiohttp import web
+from fastapi.testclient import TestClient
+
+from gpt_oss.responses_api.api_server import create_api_server
+from gpt_oss.responses_api.inference.ollama import (
+    EOS_TOKEN,
+    IncrementalEncoder,
+    OllamaBackend,
+)
+
+
+class FakeOllama:
+    """Streams "reply to <last word of the prompt>" from a background thread."""
+
+    def __init__(self):
+        self.requests = []
+        self.client_ports = set()
+        self.loop = asyncio.new_event_loop()
+        app = web.Application()
+        app.router.add_post("/api/generate", self.generate)
+        self.runner = web.AppRunner(app)
+        self.loop.run_until_complete(self.runner.setup())
+        site = web.TCPSite(self.runner, "127.0.0.1", 0)
+        self.loop.run_until_complete(site.start())
+        port = self.runner.addresses[0][1]
+        self.url = f"http://127.0.0.1:{port}"
+        self.thread = threading.Thread(target=self.loop.run_forever, daemon=True)
+        self.thread.start()
+
+    async def generate(self, request: web.Request) -> web.StreamResponse:
+        payload = await request.json()
+        self.requests.append(payload)
+        self.client_ports.add(request.transport.get_extra_info("peername")[1])
+        if payload["prompt"] == "fail":
+            return web.json_response({"error": "model not found"}, status=404)
+        response = web.StreamResponse()
+        await response.prepare(request)
+        if payload["prompt"] != "stall":
+            for word in ["reply", "to", payload["prompt"].split()[-1]]:
+                chunk = {"response": f" {word}", "done": False}
+                await response.write(json.dumps(chunk).encode() + b"\n")
+                await asyncio.sleep(0.01)
+            await response.write(json.dumps({"response": "", "done": True}).encode())
+        else:
+            await asyncio.sleep(5)
+        return response
+
+    def close(self):
+        asyncio.run_coroutine_threadsafe(self.runner.cleanup(), self.loop).result()
+        self.loop.call_soon_threadsafe(self.loop.stop)
+        self.thread.join()
+
+
+def generate(backend, sessions):
+    outputs = {id(session): [] for session in sessions}
+    running = list(sessions)
+    while running:
+        # step sessions in turns like the engine does with a batch
+        for session in list(running):
+            tokens = session.step()
+            outputs[id(session)].extend(tokens)
+            if EOS_TOKEN in tokens:
+                running.remove(session)
+    return [
+        backend.encoding.decode(
+            [t for t in outputs[id(session)] if t != EOS_TOKEN]
+        ).strip()
+        for session in sessions
+    ]
+
+
+def test_concurrent_sessions_stream_independently():
+    server = FakeOllama()
+    backend = OllamaBackend("gpt-oss:20b", base_url=server.url)
+    try:
+        first = backend.open_session(temperature=0.5)
+        second = backend.open_session()
+        first.append(backend.encoding.encode("one two three"))
+        second.append(backend.encoding.encode("four"))
+        assert generate(backend, [first, second]) == [
+            "reply to three",
+            "reply to four",
+        ]
+        # new tokens restart the stream with the whole sequence
+        first.append(backend.encoding.encode(" five"))
+        [text] = generate(backend, [first])
+        assert text == "reply to five"
+        assert server.requests[-1]["prompt"].startswith("one two three reply to")
+        first.close()
+        second.close()
+    finally:
+        backend.close()
+        server.close()
+
+    assert [r["options"]["temperature"] for r in server.requests] == [0.5, 0, 0.5]
+    assert all(r["raw"] and r["model"] == "gpt-oss:20b" for r in server.requests)
+    # the later request reused a pooled keep-alive connection
+    assert len(server.client_ports) == 2
+
+
+def test_stalled_and_failed_streams():
+    server = FakeOllama()
+    backend = OllamaBackend(
+        "gpt-oss:20b", base_url=server.url, first_byte_timeout_s=0.3
+    )
+    try:
+        stalled = backend.open_session()
+        stalled.append(backend.encoding.encode("stall"))
+        steps = []
+        while EOS_TOKEN not in steps[-1:]:
+            steps.extend(stalled.step() or [None])
+        # empty steps until the timeout, never a placeholder token
+        assert steps[-1] == EOS_TOKEN and set(steps[:-1]) == {None}
+
+        failed = backend.open_session()
+        failed.append(backend.encoding.encode("fail"))
+        try:
+            failed.step()
+        except RuntimeError as e:
+            assert "404" in str(e)
+        else:
+            raise AssertionError("expected the stream error to be raised")
+    finally:
+        backend.close()
+        server.close()
+
+
+def test_idle_sessions_of_a_batch_share_one_wait():
+    server = FakeOllama()
+    backend = OllamaBackend("gpt-oss:20b", base_url=server.url)
+    try:
+        stalled = [backend.open_session() for _ in range(4)]
+        for session in stalled:
+            session.wait_s = 0.2
+            session.append(backend.encoding.encode("stall"))
+        started = time.monotonic()
+        assert backend.step_sessions(stalled) == [[], [], [], []]
+        # one wait for the batch, not one per session
+        assert time.monotonic() - started < 0.4
+
+        streaming = backend.open_session()
+        streaming.append(backend.encoding.encode("hi"))
+        batch = stalled + [streaming]
+        received, started = [], time.monotonic()
+        while EOS_TOKEN not in received:
+            steps = backend.step_sessions(batch)
+            assert steps[:4] == [[], [], [], []]
+            received += steps[4]
+        # the stalled sessions did not hold back the streaming one
+        assert time.monotonic() - started < 0.4
+        text = backend.encoding.decode([t for t in received if t != EOS_TOKEN])
+        assert text.strip() == "reply to hi"
+    finally:
+        backend.close()
+        server.close()
+
+
+def test_server_shutdown_closes_the_backend(harmony_encoding):
+    server = FakeOllama()
+    backend = OllamaBackend("gpt-oss:20b", base_url=server.url)
+    try:
+        session = backend.open_session()
+        session.append(backend.encoding.encode("hi"))
+        assert generate(backend, [session]) == ["reply to hi"]
+        with TestClient(create_api_server(backend, harmony_encoding)):
+            pass
+        assert backend._client.closed
+        assert backend.loop.loop.is_closed()
+    finally:
+        server.close()
+
+
+STREAMED_TEXTS = [
+    "The quick brown fox doesn't jump over 1234567 lazy dogs... really?!",
+    "def f(x):\n    if x:\n\n        return {'a': [1, 2]}  # done\n\treturn None\n",
+    "analysis<|message|>Compute 2+2.<|end|><|start|>assistant<|channel|>final"
+    "<|message|>It is 4.<|call|>",
+    "========\n--------  \n\n\nend   \n",
+    "数学是一门科学。\n它研究数量、结构、变化和空间。\nЗдравствуй, мир! café naïve",
+]
+
+
+def test_incremental_encoder_matches_full_encoding(harmony_encoding):
+    rng = random.Random(0)
+    calls = []
+
+    class CountingEncoding:
+        def encode(self, text, allowed_special):
+            calls.append(len(text))
+            return harmony_encoding.encode(text, allowed_special=allowed_special)
+
+    for text in STREAMED_TEXTS * 20:
+        encoder = IncrementalEncoder(CountingEncoding())
+        tokens, i = [], 0
+        while i < len(text):
+            n = rng.randint(1, 6)
+            tokens += encoder.feed(text[i : i + n])
+            i += n
+        tokens += encoder.flush()
+        assert tokens == harmony_encoding.encode(text, allowed_special="all")
+
+    # every character is encoded once, not once per chunk
+    assert sum(calls) == sum(len(text) for text in STREAMED_TEXTS * 20)
+
+
+def test_incremental_encoder_commits_text_without_boundaries(harmony_encoding):
+    rng = random.Random(0)
+    alphabet = "ABCDEFGHIJKLMNOPQRSTUVWXYZabcdefghijklmnopqrstuvwxyz0123456789+/"
+    base64 = "".join(rng.choice(alphabet) for _ in range(3000))
+    cjk = "数学是一门科学它研究数量结构变化和空间𝔘𝔫𝔦𝔠𝔬𝔡𝔢" * 100
+    end = harmony_encoding.encode("<|end|>", allowed_special="all")
+    calls = []
+
+    class CountingEncoding:
+        def encode(self, text, allowed_special):
+            calls.append(len(text))
+            return harmony_encoding.encode(text, allowed_special=allowed_special)
+
+        def decode(self, tokens):
+            return harmony_encoding.decode(tokens)
+
+    for text in [base64, cjk, base64[:1000] + "<|end|>" + base64[1000:2000]]:
+        encoder = IncrementalEncoder(CountingEncoding())
+        tokens, i = [], 0
+        while i < len(text):
+            n = rng.randint(1, 6)
+            tokens += encoder.feed(text[i : i + n])
+            i += n
+            # the held back text stays bounded
+            assert len(encoder._tail) <= encoder.max_pending_chars + n
+        held_back = encoder.flush()
+        assert len(harmony_encoding.decode(held_back)) <= encoder.max_pending_chars
+        tokens += held_back
+        assert harmony_encoding.decode(tokens) == text
+        if "<|end|>" in text:
+            # special tokens are never cut apart
+            assert end[0] in tokens
+
+    total = len(base64) + len(cjk) + 2007
+    # held back text is re-encoded a few times at most, not once per chunk
+    assert sum(calls) < 1.5 * total
@@ -0,0 +1,63 @@
+import pytest
+from openai_harmony import Conversation, Message, ReasoningEffort, Role
+
+from gpt_oss.responses_api.preamble import PreambleRenderer, build_preamble_messages
+from gpt_oss.responses_api.types import (
+    BrowserToolConfig,
+    FunctionToolDefinition,
+)
+
+WEATHER = FunctionToolDefinition(
+    type="function",
+    name="get_weather",
+    description="Current weather",
+    parameters={"type": "object", "properties": {"city": {"type": "string"}}},
+)
+
+
+@pytest.mark.parametrize(
+    "effort, instructions, tools",
+    [
+        (None, None, []),
+        (ReasoningEffort.HIGH, "Be brief.", []),
+        (ReasoningEffort.LOW, None, [WEATHER]),
+        (
+            ReasoningEffort.MEDIUM,
+            "Be brief.",
+            [WEATHER, BrowserToolConfig(type="browser_search")],
+        ),
+    ],
+)
+def test_cached_preamble_matches_full_render(
+    harmony_encoding, effort, instructions, tools
+):
+    renderer = PreambleRenderer(harmony_encoding)
+    args = ("2025-08-05", effort, [], instructions, tools)
+    user = Message.from_role_and_content(Role.USER, "Hi")
+
+    expected = harmony_encoding.render_conversation_for_completion(
+        Conversation.from_messages([*build_preamble_messages(*args), user]),
+        Role.ASSISTANT,
+    )
+    for _ in range(2):
+        tokens = [
+            *renderer.render(*args),
+            *harmony_encoding.render_conversation_for_completion(
+                Conversation.from_messages([user]), Role.ASSISTANT
+            ),
+        ]
+        assert tokens == expected
+    assert (renderer.stats.hits, renderer.stats.misses) == (1, 1)
+
+
+def test_cache_is_bounded_and_keyed_by_inputs(harmony_encoding):
+    renderer = PreambleRenderer(harmony_encoding, max_entries=2)
+    renderer.render("2025-08-05", None, [], "a", [])
+    renderer.render("2025-08-05", None, [], "b", [])
+    renderer.render("2025-08-06", None, [], "a", [])
+    assert len(renderer) == 2
+    assert renderer.stats.evictions == 1
+    assert renderer.stats.hits == 0
+
+    renderer.render("2025-08-06", None, [], "a", [])
+    assert renderer.stats.hit_ratio == 0.25
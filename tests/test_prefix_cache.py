@@ -0,0 +1,76 @@
+from gpt_oss.responses_api.prefix_cache import RadixPrefixCache
+
+
+def _fill_recorder(calls):
+    def fill(start, block_ids):
+        calls.append((start, list(block_ids)))
+
+    return fill
+
+
+def test_match_returns_longest_block_aligned_prefix():
+    cache = RadixPrefixCache(block_size=4, num_blocks=8)
+    calls = []
+    inserted = cache.insert(list(range(10)), _fill_recorder(calls))
+
+    assert inserted == 8
+    assert calls == [(0, calls[0][1])]
+    assert len(calls[0][1]) == 2
+
+    num_tokens, blocks = cache.match(list(range(10)) + [99])
+    assert num_tokens == 8
+    assert blocks == calls[0][1]
+
+    num_tokens, blocks = cache.match([0, 1, 2, 3, 4, 5, 6, 42])
+    assert num_tokens == 4
+    assert blocks == calls[0][1][:1]
+
+    assert cache.match([7, 7, 7, 7])[0] == 0
+
+
+def test_shared_prefix_is_stored_once():
+    cache = RadixPrefixCache(block_size=2, num_blocks=16)
+    system = [1, 2, 3, 4]
+    calls = []
+    cache.insert(system + [10, 11], _fill_recorder(calls))
+    cache.insert(system + [20, 21], _fill_recorder(calls))
+
+    # the second insert only needs to fill the diverging block
+    assert calls[1][0] == 4
+    assert len(calls[1][1]) == 1
+    assert cache.used_blocks == 4
+
+    tokens_a, blocks_a = cache.match(system + [10, 11])
+    tokens_b, blocks_b = cache.match(system + [20, 21])
+    assert tokens_a == tokens_b == 6
+    assert blocks_a[:2] == blocks_b[:2]
+    assert blocks_a[2] != blocks_b[2]
+
+
+def test_lru_eviction_under_budget():
+    evicted = []
+    cache = RadixPrefixCache(
+        block_size=2,
+        num_blocks=4,
+        on_evict=lambda prefix, blocks: evicted.append((prefix, blocks)),
+    )
+    cache.insert([1, 1, 1, 1], _fill_recorder([]))
+    cache.insert([2, 2, 2, 2], _fill_recorder([]))
+    # touch the first sequence so the second becomes least recently used
+    cache.match([1, 1, 1, 1])
+    cache.insert([3, 3, 3, 3], _fill_recorder([]))
+
+    assert [prefix for prefix, _ in evicted] == [[2, 2, 2, 2]]
+    assert cache.match([1, 1, 1, 1])[0] == 4
+    assert cache.match([2, 2, 2, 2])[0] == 0
+    assert cache.match([3, 3, 3, 3])[0] == 4
+    assert cache.stats.evicted_blocks == 2
+
+
+def test_stats_track_hit_ratio():
+    cache = RadixPrefixCache(block_size=2, num_blocks=4)
+    cache.insert([1, 2, 3, 4], _fill_recorder([]))
+    cache.match([1, 2, 3, 4])
+    cache.match([5, 6, 7, 8])
+    assert cache.stats.lookups == 2
+    assert cache.stats.hit_ratio == 0.5
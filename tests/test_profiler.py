@@ -0,0 +1,101 @@
+import asyncio
+import json
+import os
+import threading
+from types import SimpleNamespace
+
+import httpx
+
+from gpt_oss.responses_api.api_server import create_api_server
+from gpt_oss.responses_api.inference import stub
+from gpt_oss.responses_api.profiler import summarize_regions
+
+
+def event(key, cpu, device=0.0, is_user_annotation=None):
+    event = SimpleNamespace(
+        key=key,
+        count=2,
+        cpu_time_total=cpu,
+        self_cpu_time_total=cpu / 2,
+        device_time_total=device,
+    )
+    if is_user_annotation is not None:
+        event.is_user_annotation = is_user_annotation
+    return event
+
+
+class FakeProfiler:
+    def __init__(self):
+        self.threads = []
+
+    def start(self):
+        self.threads.append(threading.current_thread().name)
+
+    def stop(self):
+        self.threads.append(threading.current_thread().name)
+
+    def export_chrome_trace(self, path):
+        with open(path, "w") as f:
+            json.dump({"traceEvents": []}, f)
+
+    def key_averages(self):
+        return [event("attn", 10.0), event("aten::mm", 50.0), event("mlp", 30.0)]
+
+
+def test_summarize_regions_keeps_annotations():
+    regions = summarize_regions(
+        [
+            event("attn", 10.0, device=5.0),
+            event("aten::mm", 50.0),
+            event("cudaLaunchKernel", 40.0),
+            event("mlp", 30.0, device=20.0),
+            event("flagged", 1.0, is_user_annotation=True),
+            event("not_flagged", 1.0, is_user_annotation=False),
+        ]
+    )
+    assert [region["name"] for region in regions] == ["mlp", "attn", "flagged"]
+    assert regions[0] == {
+        "name": "mlp",
+        "count": 2,
+        "cpu_time_total_us": 30.0,
+        "self_cpu_time_total_us": 15.0,
+        "device_time_total_us": 20.0,
+    }
+
+
+def test_profile_endpoint_captures_engine_steps(
+    harmony_encoding, monkeypatch, tmp_path
+):
+    monkeypatch.setattr(stub, "STEP_DELAY_S", 0.001)
+    app = create_api_server(
+        stub.setup_model(""), harmony_encoding, profile_dir=str(tmp_path)
+    )
+    fake = FakeProfiler()
+    app.state.profiler.profiler_factory = lambda: fake
+
+    async def main():
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(
+            transport=transport, base_url="http://test"
+        ) as client:
+            invalid = await client.post("/admin/profile", json={})
+            assert invalid.status_code == 400
+            profile, response = await asyncio.gather(
+                client.post("/admin/profile", json={"steps": 3, "seconds": 10}),
+                client.post("/v1/responses", json={"input": "Hi"}),
+            )
+            assert response.status_code == 200
+            return profile
+
+    profile = asyncio.run(main())
+    assert profile.status_code == 200
+    result = profile.json()
+    assert result["steps"] >= 3
+    assert [region["name"] for region in result["regions"]] == ["mlp", "attn"]
+    assert os.path.exists(result["trace_path"])
+    with open(result["summary_path"]) as f:
+        assert json.load(f)["regions"] == result["regions"]
+    # the profiler only sees the model's thread if it is started there
+    assert len(fake.threads) == 2
+    assert all(name.startswith("inference") for name in fake.threads)
+    assert not app.state.profiler.running
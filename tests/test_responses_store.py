@@ -0,0 +1,125 @@
+import sqlite3
+import time
+
+import pytest
+
+from gpt_oss.responses_api import store as store_module
+from gpt_oss.responses_api.store import MemoryResponsesStore, SQLiteResponsesStore
+from gpt_oss.responses_api.types import ResponseObject, ResponsesRequest
+
+
+def make_entry(i: int):
+    request = ResponsesRequest(input=f"question {i}")
+    response = ResponseObject(
+        output=[],
+        created_at=0,
+        usage=None,
+        status="completed",
+        id=f"resp_{i}",
+    )
+    return request, response
+
+
+def test_lru_eviction_by_entry_count():
+    store = MemoryResponsesStore(max_entries=2)
+    for i in range(2):
+        store.put(f"r{i}", *make_entry(i))
+    assert store.get("r0") is not None
+    store.put("r2", *make_entry(2))
+
+    assert "r1" not in store
+    assert store.get("r0").request.input == "question 0"
+    assert store.get("r1") is None
+    assert store.stats.evictions == 1
+    assert store.stats.hits == 2
+    assert store.stats.misses == 1
+
+
+def test_memory_budget_and_ttl():
+    request, response = make_entry(0)
+    store = MemoryResponsesStore(ttl_seconds=0.01)
+    store.put("r", request, response)
+    size = store.used_bytes
+    store = MemoryResponsesStore(max_bytes=2 * size, ttl_seconds=0.01)
+    for i in range(3):
+        store.put(f"r{i}", request, response)
+    assert len(store) == 2
+    assert store.used_bytes == 2 * size
+
+    time.sleep(0.02)
+    assert store.get("r2") is None
+    assert store.stats.expirations == 1
+
+
+def test_sqlite_tier_survives_restart(tmp_path):
+    path = str(tmp_path / "responses.db")
+    store = SQLiteResponsesStore(path, memory=MemoryResponsesStore(max_entries=1))
+    for i in range(3):
+        store.put(f"r{i}", *make_entry(i), tokens=[i, 200006, 2], turn_start=1)
+    # r0 was evicted from memory but is still readable before it is written
+    assert store.get("r0").response.id == "resp_0"
+    store.close()
+
+    reopened = SQLiteResponsesStore(path)
+    stored = reopened.get("r1")
+    assert stored.request.input == "question 1"
+    assert stored.response.id == "resp_1"
+    assert list(stored.tokens) == [1, 200006, 2]
+    assert stored.turn_start == 1
+    assert reopened.stats.disk_hits == 1
+    assert reopened.get("missing") is None
+    # a disk hit is one hit, not a memory-tier miss as well
+    assert (reopened.stats.hits, reopened.stats.misses) == (1, 1)
+    reopened.close()
+
+
+def test_size_estimate_grows_with_text_and_tokens():
+    store = MemoryResponsesStore()
+    request, response = make_entry(0)
+    store.put("short", request, response)
+    short = store.used_bytes
+    store.put("long", ResponsesRequest(input="x" * 10_000), response, tokens=[1] * 100)
+    assert store.used_bytes - short >= 10_000 + 400
+
+
+def test_failed_writes_are_retried(tmp_path, monkeypatch):
+    path = str(tmp_path / "responses.db")
+    store = SQLiteResponsesStore(path, memory=MemoryResponsesStore(max_entries=1))
+    write = store._write
+    calls = []
+
+    def fail_once(conn, items):
+        calls.append(items)
+        if len(calls) == 1:
+            raise sqlite3.OperationalError("disk I/O error")
+        write(conn, items)
+
+    monkeypatch.setattr(store, "_write", fail_once)
+    store.put("r0", *make_entry(0))
+    with pytest.raises(sqlite3.OperationalError):
+        store.flush()
+    # the error is reported once, and the row was written on the retry
+    store.flush()
+    store.close()
+
+    reopened = SQLiteResponsesStore(path)
+    assert reopened.get("r0").response.id == "resp_0"
+    assert reopened.stats.disk_hits == 1
+    reopened.close()
+
+
+def test_rows_are_dropped_after_repeated_failures(tmp_path, monkeypatch):
+    monkeypatch.setattr(store_module, "WRITE_RETRY_DELAY_S", 0)
+    path = str(tmp_path / "responses.db")
+    store = SQLiteResponsesStore(path, memory=MemoryResponsesStore(max_entries=1))
+    with sqlite3.connect(path) as conn:
+        conn.execute("DROP TABLE responses")
+    store.put("r0", *make_entry(0))
+    store.put("r1", *make_entry(1))
+    with pytest.raises(sqlite3.OperationalError):
+        store.flush()
+    assert store.stats.dropped_writes == 2
+    # only the memory tier still has the latest row; the other one is gone
+    assert store.get("r1").response.id == "resp_1"
+    assert "r0" not in store.memory and not store._unwritten
+    store.close()
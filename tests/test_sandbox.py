@@ -0,0 +1,101 @@
+import time
+
+from gpt_oss.tools.python_docker.docker_tool import PythonTool
+from gpt_oss.tools.python_docker.sandbox import (
+    DockerSandbox,
+    LocalSandbox,
+    SandboxPool,
+)
+
+
+def wait_for_idle(pool: SandboxPool, n: int) -> None:
+    deadline = time.monotonic() + 10
+    while pool.idle < n:
+        assert time.monotonic() < deadline, "sandboxes did not start"
+        time.sleep(0.01)
+
+
+def test_pool_reuses_reset_sandboxes():
+    pool = SandboxPool(LocalSandbox, size=1, max_uses=2, timeout_s=10)
+    pool.start()
+    try:
+        wait_for_idle(pool, 1)
+        script = "import os\nprint(os.listdir('.'))\nopen('left_behind', 'w')\n"
+        assert pool.run(script) == "[]\n"
+        wait_for_idle(pool, 1)
+        # reset between uses: the file written by the last script is gone
+        assert pool.run(script) == "[]\n"
+        wait_for_idle(pool, 1)
+        assert "ZeroDivisionError" in pool.run("1 / 0")
+    finally:
+        pool.close()
+
+    stats = pool.stats
+    assert (stats.warm_runs, stats.cold_runs) == (3, 0)
+    assert stats.hit_ratio == 1
+    # the second run reached max_uses and the sandbox was replaced
+    assert stats.recycled == 1
+    assert stats.mean_warm_latency_s > 0
+
+
+def test_pool_times_out_and_discards_the_sandbox():
+    pool = SandboxPool(LocalSandbox, size=1, timeout_s=0.5)
+    try:
+        output = pool.run("print('started', flush=True)\nwhile True: pass")
+        assert output.startswith("started\n")
+        assert output.endswith("TimeoutError: execution exceeded 0.5 seconds")
+        wait_for_idle(pool, 1)
+        assert pool.run("print(6 * 7)") == "42\n"
+    finally:
+        pool.close()
+
+    stats = pool.stats
+    assert stats.timeouts == 1
+    assert stats.discarded == 1
+    # the first run had to start a sandbox, the replacement was started ahead
+    assert (stats.warm_runs, stats.cold_runs) == (1, 1)
+
+
+def test_limits_apply_to_sandboxes_started_from_threads():
+    script = "import resource\nprint(resource.getrlimit(resource.RLIMIT_CPU))\n"
+    pool = SandboxPool(
+        lambda: LocalSandbox(cpu_seconds=7, memory_bytes=None), size=1, timeout_s=10
+    )
+    pool.start()
+    try:
+        # started on one of the pool's threads
+        wait_for_idle(pool, 1)
+        assert pool.run(script) == "(7, 7)\n"
+    finally:
+        pool.close()
+
+
+def test_pool_replaces_sandboxes_that_reset_cannot_clean():
+    class DirtySandbox(LocalSandbox):
+        def reset(self):
+            super().reset()
+            return False
+
+    pool = SandboxPool(DirtySandbox, size=1, timeout_s=10)
+    pool.start()
+    try:
+        wait_for_idle(pool, 1)
+        first = pool.run("import os\nprint(os.getcwd())")
+        wait_for_idle(pool, 1)
+        assert pool.run("import os\nprint(os.getcwd())") != first
+    finally:
+        pool.close()
+
+    assert pool.stats.dirty == 1
+    assert pool.stats.warm_runs == 2
+
+
+def test_tool_instruction_names_the_sandbox_backend():
+    local, docker = SandboxPool(LocalSandbox), SandboxPool(DockerSandbox)
+    try:
+        assert "in a stateless sandbox," in PythonTool(sandbox_pool=local).instruction
+        instruction = PythonTool(sandbox_pool=docker).instruction
+        assert "in a stateless docker container," in instruction
+    finally:
+        local.close()
+        docker.close()
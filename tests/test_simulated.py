@@ -0,0 +1,124 @@
+import json
+
+from fastapi.testclient import TestClient
+from openai_harmony import Role
+
+from gpt_oss.responses_api.api_server import create_api_server
+from gpt_oss.responses_api.engine import BatchEntry
+from gpt_oss.responses_api.inference import simulated
+from gpt_oss.responses_api.inference.simulated import (
+    SimulatedModel,
+    SimulationConfig,
+)
+
+TOOLS = [
+    {
+        "type": "function",
+        "name": "get_weather",
+        "description": "Current weather",
+        "parameters": {
+            "type": "object",
+            "properties": {"location": {"type": "string"}},
+            "required": ["location"],
+        },
+    }
+]
+
+PROMPT = (
+    "<|start|>developer<|message|># Tools\n\n## functions\n\n"
+    "namespace functions {\n\n// Current weather\ntype get_weather = (_: {\n"
+    "location: string,\n}) => any;\n\n} // namespace functions<|end|>"
+    "<|start|>user<|message|>Weather in Paris?<|end|><|start|>assistant"
+)
+
+
+def run_turn(model, slot, tokens, stop_tokens):
+    generated = []
+    while not generated or generated[-1] not in stop_tokens:
+        entry = BatchEntry(slot=slot, tokens=tokens, sample=True)
+        generated += model.forward([entry])[0]
+        tokens = []
+    return generated
+
+
+def test_turns_are_well_formed_harmony(harmony_encoding, monkeypatch):
+    sleeps = []
+    monkeypatch.setattr(simulated.time, "sleep", sleeps.append)
+    config = SimulationConfig(tool_call_probability=1.0, seed=3)
+    model = SimulatedModel(config)
+    stop_tokens = set(harmony_encoding.stop_tokens_for_assistant_actions())
+    prompt = harmony_encoding.encode(PROMPT, allowed_special="all")
+
+    generated = run_turn(model, 0, prompt, stop_tokens)
+    assert sleeps[0] == config.step_seconds(len(prompt), 1)
+    assert sleeps[1] == config.step_seconds(0, 1)
+    messages = harmony_encoding.parse_messages_from_completion_tokens(
+        generated, Role.ASSISTANT
+    )
+    assert [m.channel for m in messages] == ["analysis", "commentary"]
+    assert messages[-1].recipient == "functions.get_weather"
+    assert list(json.loads(messages[-1].content[0].text)) == ["location"]
+
+    # the turn after the tool result answers
+    result = harmony_encoding.encode(
+        "<|start|>functions.get_weather to=assistant<|channel|>commentary"
+        "<|message|>sunny<|end|><|start|>assistant",
+        allowed_special="all",
+    )
+    generated = run_turn(model, 0, result, stop_tokens)
+    messages = harmony_encoding.parse_messages_from_completion_tokens(
+        generated, Role.ASSISTANT
+    )
+    assert [m.channel for m in messages] == ["analysis", "final"]
+    # the <|call|> token goes through the model along with the tool result
+    assert model.stats.prefill_tokens == len(prompt) + 1 + len(result)
+    assert model.stats.recomputed_tokens == 0
+
+
+def test_full_kv_cache_preempts_least_recently_stepped(monkeypatch):
+    monkeypatch.setattr(simulated.time, "sleep", lambda _: None)
+    model = SimulatedModel(SimulationConfig(kv_capacity_tokens=30))
+    model.forward([BatchEntry(slot=0, tokens=list(range(20)), sample=True)])
+    model.forward([BatchEntry(slot=1, tokens=list(range(20)), sample=True)])
+    assert model.stats.preemptions == 1
+    assert model.kv_cache_usage() == 20 / 30
+
+    # slot 0 lost its KV entries and prefills its whole sequence again
+    model.forward([BatchEntry(slot=0, tokens=[], sample=True)])
+    assert model.stats.recomputed_tokens == 20
+    assert model.stats.preemptions == 2
+
+    model.release(0)
+    model.release(1)
+    assert model.kv_cache_usage() == 0
+
+
+def test_function_call_end_to_end(harmony_encoding, monkeypatch):
+    monkeypatch.setattr(simulated.time, "sleep", lambda _: None)
+    model = SimulatedModel(SimulationConfig(tool_call_probability=1.0))
+    client = TestClient(create_api_server(model, harmony_encoding))
+
+    response = client.post(
+        "/v1/responses", json={"input": "Hi", "tools": TOOLS, "store": True}
+    )
+    assert response.status_code == 200
+    call = response.json()["output"][-1]
+    assert call["type"] == "function_call"
+    assert call["name"] == "get_weather"
+
+    response = client.post(
+        "/v1/responses",
+        json={
+            "previous_response_id": response.json()["id"],
+            "input": [
+                {
+                    "type": "function_call_output",
+                    "call_id": call["call_id"],
+                    "output": "sunny",
+                }
+            ],
+            "tools": TOOLS,
+        },
+    )
+    assert response.status_code == 200
+    assert response.json()["output"][-1]["type"] == "message"
@@ -0,0 +1,165 @@
+import asyncio
+import itertools
+import json
+import threading
+
+import pytest
+from fastapi.testclient import TestClient
+
+from gpt_oss.responses_api.api_server import create_api_server
+from gpt_oss.responses_api.events import (
+    ResponseOutputTextDelta,
+    ResponseReasoningTextDelta,
+)
+from gpt_oss.responses_api.inference import stub
+from gpt_oss.responses_api.sse import DeltaEmitter, format_sse
+
+
+def payloads(frames: str) -> list[dict]:
+    return [
+        json.loads(line[len("data: ") :])
+        for line in frames.splitlines()
+        if line.startswith("data: ")
+    ]
+
+
+DELTAS = ["plain", 'quo"te\\', "new\nline\ttab", "ünïcödé 🐔", "\x00\x1f\x7f", "</s>"]
+
+
+@pytest.mark.parametrize(
+    "event_cls", [ResponseOutputTextDelta, ResponseReasoningTextDelta]
+)
+def test_template_matches_pydantic_serialization(event_cls):
+    counter = itertools.count(7)
+    emitter = DeltaEmitter(lambda: next(counter))
+    event_type = event_cls.model_fields["type"].default
+    for delta in DELTAS:
+        expected = event_cls(output_index=2, content_index=1, delta=delta)
+        frame = emitter.add(event_type, 2, 1, delta)
+        expected.sequence_number = payloads(frame)[0]["sequence_number"]
+        assert frame == format_sse(expected)
+
+
+def test_coalesces_by_token_count_and_content_part():
+    counter = itertools.count()
+    emitter = DeltaEmitter(lambda: next(counter), max_tokens=3)
+    text = "response.output_text.delta"
+    assert emitter.add(text, 0, 0, "a") == ""
+    assert emitter.add(text, 0, 0, "b") == ""
+    frame = emitter.add(text, 0, 0, "c")
+    assert payloads(frame)[0]["delta"] == "abc"
+
+    emitter.add(text, 0, 0, "d")
+    # a different content part flushes the buffered delta first
+    frames = emitter.add(text, 1, 0, "e") + emitter.flush()
+    events = payloads(frames)
+    assert [(e["output_index"], e["delta"]) for e in events] == [(0, "d"), (1, "e")]
+    assert [e["sequence_number"] for e in events] == [1, 2]
+
+
+def test_coalesced_stream_has_same_text(harmony_encoding, monkeypatch):
+    monkeypatch.setattr(stub, "STEP_DELAY_S", 0)
+    client = TestClient(create_api_server(stub.setup_model(""), harmony_encoding))
+
+    def stream(stream_options):
+        body = {"input": "Hi", "stream": True, "stream_options": stream_options}
+        events = payloads(client.post("/v1/responses", json=body).text)
+        assert [e["sequence_number"] for e in events] == list(range(len(events)))
+        deltas = [e for e in events if e["type"].endswith("text.delta")]
+        return "".join(e["delta"] for e in deltas), len(deltas)
+
+    text, num_deltas = stream(None)
+    coalesced_text, num_coalesced = stream({"coalesce_tokens": 8})
+    assert coalesced_text == text
+    assert num_coalesced < num_deltas / 4
+
+
+def test_held_back_citation_text_is_streamed_at_message_end(harmony_encoding):
+    script = harmony_encoding.encode(
+        "<|channel|>final<|message|>See the docs 【3†L1<|return|>",
+        allowed_special="all",
+    )
+
+    def infer_next_token(tokens, temperature=0.0, new_request=False):
+        if new_request:
+            script_iter[0] = iter(script)
+        return next(script_iter[0])
+
+    script_iter = [iter(script)]
+    client = TestClient(create_api_server(infer_next_token, harmony_encoding))
+    body = {"input": "Hi", "stream": True, "tools": [{"type": "browser_search"}]}
+    events = payloads(client.post("/v1/responses", json=body).text)
+
+    deltas = [e["delta"] for e in events if e["type"] == "response.output_text.delta"]
+    (done,) = [e for e in events if e["type"] == "response.output_text.done"]
+    assert "".join(deltas) == done["text"]
+    assert done["text"].endswith("【3†L1")
+
+
+def test_lone_delta_goes_out_after_coalesce_ms(harmony_encoding):
+    script = harmony_encoding.encode(
+        "<|channel|>final<|message|>Hello world<|return|>", allowed_special="all"
+    )
+    stall_at = script.index(harmony_encoding.encode(" world")[0])
+    resume = threading.Event()
+
+    def infer_next_token(tokens, temperature=0.0, new_request=False):
+        if new_request:
+            script_iter[0] = enumerate(script)
+        i, token = next(script_iter[0])
+        if i == stall_at:
+            # no further token until the test has seen the first delta
+            resume.wait(timeout=5)
+        return token
+
+    script_iter = [enumerate(script)]
+    app = create_api_server(infer_next_token, harmony_encoding)
+    body = {"input": "Hi", "stream": True, "stream_options": {"coalesce_ms": 20}}
+
+    async def main():
+        messages = [
+            {"type": "http.request", "body": json.dumps(body).encode()},
+        ]
+        frames = []
+
+        async def receive():
+            if messages:
+                return messages.pop(0)
+            await asyncio.Event().wait()
+
+        async def send(message):
+            frames.append(message.get("body", b"").decode())
+
+        scope = {
+            "type": "http",
+            "asgi": {"version": "3.0"},
+            "http_version": "1.1",
+            "method": "POST",
+            "scheme": "http",
+            "path": "/v1/responses",
+            "raw_path": b"/v1/responses",
+            "query_string": b"",
+            "headers": [(b"content-type", b"application/json")],
+            "client": ("test", 1),
+            "server": ("test", 80),
+        }
+        handler = asyncio.create_task(app(scope, receive, send))
+
+        async def first_delta():
+            while True:
+                for event in payloads("".join(frames)):
+                    if event["type"] == "response.output_text.delta":
+                        return event["delta"]
+                await asyncio.sleep(0.01)
+
+        try:
+            delta = await asyncio.wait_for(first_delta(), timeout=2)
+        finally:
+            resume.set()
+        await asyncio.wait_for(handler, timeout=5)
+        return delta, payloads("".join(frames))
+
+    delta, events = asyncio.run(main())
+    assert delta == "Hello"
+    deltas = [e["delta"] for e in events if e["type"] == "response.output_text.delta"]
+    assert deltas == ["Hello", " world"]
@@ -0,0 +1,96 @@
+import asyncio
+import threading
+import time
+from typing import AsyncIterator
+
+from openai_harmony import Author, Message, Role, TextContent
+
+from gpt_oss.responses_api.tool_executor import ToolExecutor, ToolLimits
+from gpt_oss.tools.tool import Tool, call_on_background_thread
+
+
+class SleepTool(Tool):
+    """Blocks for the number of seconds in the message."""
+
+    def __init__(self):
+        self.threads = []
+
+    @property
+    def name(self) -> str:
+        return "sleep"
+
+    def instruction(self) -> str:
+        return ""
+
+    def _sleep(self, seconds: float) -> str:
+        self.threads.append(threading.current_thread().name)
+        time.sleep(seconds)
+        return "done"
+
+    async def _process(self, message: Message) -> AsyncIterator[Message]:
+        seconds = float(message.content[0].text)
+        output = await call_on_background_thread(self._sleep, seconds)
+        yield Message.from_author_and_content(
+            Author.new(Role.TOOL, self.name), TextContent(text=output)
+        ).with_channel(message.channel)
+
+
+def call(seconds: float) -> Message:
+    return (
+        Message.from_role_and_content(Role.ASSISTANT, str(seconds))
+        .with_channel("analysis")
+        .with_recipient("sleep")
+    )
+
+
+def test_blocking_tools_do_not_stall_the_event_loop():
+    async def main():
+        executor = ToolExecutor()
+        tool = SleepTool()
+        ticks = 0
+
+        async def ticker():
+            nonlocal ticks
+            while True:
+                ticks += 1
+                await asyncio.sleep(0.005)
+
+        ticking = asyncio.create_task(ticker())
+        result = await executor.run("sleep", tool, call(0.1))
+        ticking.cancel()
+        executor.close()
+        return executor, tool, ticks, result
+
+    executor, tool, ticks, result = asyncio.run(main())
+    assert result[0].content[0].text == "done"
+    assert tool.threads[0].startswith("tool")
+    assert ticks > 5
+    assert executor.latency.labels("sleep").count == 1
+
+
+def test_tool_calls_are_limited_and_time_out():
+    async def main():
+        executor = ToolExecutor(
+            limits={"sleep": ToolLimits(max_concurrency=1, timeout_s=0.15)}
+        )
+        tool = SleepTool()
+        start = time.monotonic()
+        first, second = await asyncio.gather(
+            executor.run("sleep", tool, call(0.1)),
+            executor.run("sleep", tool, call(0.1)),
+        )
+        serialized = time.monotonic() - start
+        timed_out = await executor.run("sleep", tool, call(1))
+        executor.close()
+        return executor, first, second, serialized, timed_out
+
+    executor, first, second, serialized, timed_out = asyncio.run(main())
+    assert first[0].content[0].text == second[0].content[0].text == "done"
+    assert serialized >= 0.2
+    message = timed_out[0]
+    assert message.author.role == Role.TOOL
+    assert message.channel == "analysis"
+    assert message.recipient == "assistant"
+    assert "timed out after 0.15 seconds" in message.content[0].text
+    assert executor.stats.calls == {"sleep": 3}
+    assert executor.stats.timeouts == {"sleep": 1}
@@ -0,0 +1,60 @@
+import pytest
+
+torch = pytest.importorskip("torch")
+transformers = pytest.importorskip("transformers")
+
+from gpt_oss.responses_api.inference.fingerprint import TokenFingerprint
+from gpt_oss.responses_api.inference.transformers import TransformersBackend
+
+
+@pytest.fixture
+def tiny_model():
+    torch.manual_seed(0)
+    config = transformers.LlamaConfig(
+        vocab_size=64,
+        hidden_size=32,
+        intermediate_size=64,
+        num_hidden_layers=2,
+        num_attention_heads=4,
+        num_key_value_heads=2,
+        max_position_embeddings=128,
+    )
+    return transformers.LlamaForCausalLM(config).eval()
+
+
+def _greedy_without_cache(model, tokens):
+    with torch.inference_mode():
+        logits = model(input_ids=torch.tensor([tokens]), use_cache=False).logits
+    return int(torch.argmax(logits[0, -1]))
+
+
+def test_cached_steps_match_full_recompute(tiny_model):
+    backend = TransformersBackend(tiny_model)
+    session = backend.open_session()
+    session.append([1, 5, 9, 13])
+    for _ in range(4):
+        expected = _greedy_without_cache(tiny_model, session.tokens)
+        assert session.step() == [expected]
+    # a tool result extends the cache instead of recomputing the sequence
+    session.append([7, 8])
+    expected = _greedy_without_cache(tiny_model, session.tokens)
+    assert session.step() == [expected]
+    assert session.cached.tolist() == session.tokens[:-1]
+
+
+def test_divergence_crops_cache_and_fork_is_independent(tiny_model):
+    backend = TransformersBackend(tiny_model)
+    session = backend.open_session()
+    session.append([3, 4, 5, 6])
+    session.step()
+    forked = session.fork()
+
+    # rewrite the sequence past the shared prefix
+    session.tokens = session.tokens[:2] + [20, 21]
+    session.fingerprint = TokenFingerprint(session.tokens)
+    expected = _greedy_without_cache(tiny_model, session.tokens)
+    assert session.step() == [expected]
+    assert session.cache.get_seq_length() == 4
+
+    expected = _greedy_without_cache(tiny_model, forked.tokens)
+    assert forked.step() == [expected]
@@ -0,0 +1,179 @@
+import asyncio
+import time
+from types import SimpleNamespace
+
+from fastapi.testclient import TestClient
+
+from gpt_oss.responses_api.api_server import create_api_server
+from gpt_oss.responses_api.engine import InferenceEngine, SessionModel
+from gpt_oss.responses_api.inference.vllm import VLLMBackend, VLLMSession
+
+STOP = 99
+
+
+class FakeAsyncEngine:
+    """
+    Implements the ``generate`` stream of vLLM's async engine. A request
+    continues ``10 * last prompt token`` for three tokens and stops; a prompt
+    ending in 0 generates until it is aborted, one ending in 9 produces
+    nothing until it is aborted.
+    """
+
+    def __init__(self):
+        self.requests = []
+        self.aborted = []
+        self.active = 0
+        self.max_active = 0
+        self.shut_down = False
+
+    def shutdown(self):
+        self.shut_down = True
+
+    async def generate(self, prompt, sampling_params, request_id):
+        self.requests.append((prompt["prompt_token_ids"], sampling_params))
+        self.active += 1
+        self.max_active = max(self.max_active, self.active)
+        finished = False
+        try:
+            base = prompt["prompt_token_ids"][-1] * 10
+            limit = sampling_params["max_tokens"]
+            token_ids = []
+            if base == 90:
+                await asyncio.Event().wait()
+            while base == 0 or len(token_ids) < 3:
+                await asyncio.sleep(0.005)
+                token_ids.append(base + len(token_ids) + 1)
+                if len(token_ids) == limit:
+                    break
+                yield self.output(token_ids, finished=False)
+            finished = True
+            # like some vLLM versions, leave the stop token out of the output
+            stopped = len(token_ids) != limit
+            yield self.output(
+                token_ids,
+                finished=True,
+                finish_reason="stop" if stopped else "length",
+                stop_reason=STOP if stopped else None,
+            )
+        finally:
+            self.active -= 1
+            if not finished:
+                self.aborted.append(request_id)
+
+    @staticmethod
+    def output(token_ids, finished, finish_reason=None, stop_reason=None):
+        completion = SimpleNamespace(
+            token_ids=list(token_ids),
+            finish_reason=finish_reason,
+            stop_reason=stop_reason,
+        )
+        return SimpleNamespace(
+            outputs=[completion], finished=finished, num_cached_tokens=0
+        )
+
+
+async def generate(session, limit=100):
+    tokens = []
+    while len(tokens) < limit:
+        tokens.append(await session.next_token())
+        if tokens[-1] == STOP:
+            break
+    return tokens
+
+
+def test_one_streamed_request_per_turn():
+    fake = FakeAsyncEngine()
+    backend = VLLMBackend(lambda: fake, [STOP], dict)
+
+    async def main():
+        engine = InferenceEngine(SessionModel(backend), stop_tokens=[STOP])
+        a = engine.open_session([1, 2], temperature=0.5, max_tokens=10)
+        b = engine.open_session([5], max_tokens=2)
+        first = await asyncio.gather(generate(a), generate(b, limit=2))
+        # a tool result continues the response with a new request
+        a.append([7])
+        resumed = await generate(a)
+        a.close()
+        b.close()
+        return first, resumed
+
+    try:
+        (tokens_a, tokens_b), resumed = asyncio.run(main())
+    finally:
+        backend.close()
+
+    assert tokens_a == [21, 22, 23, STOP]
+    assert tokens_b == [51, 52]
+    assert resumed == [71, 72, 73, STOP]
+    # both requests were in vLLM at the same time
+    assert fake.max_active == 2
+    prompts = [prompt for prompt, _ in fake.requests]
+    assert prompts == [[1, 2], [5], [1, 2, 21, 22, 23, STOP, 7]]
+    params = [params for _, params in fake.requests]
+    assert params[0] == {
+        "temperature": 0.5,
+        "max_tokens": 10,
+        "n": 1,
+        "stop_token_ids": [STOP],
+    }
+    assert params[1]["max_tokens"] == 2
+    # the budget left after the first turn
+    assert params[2]["max_tokens"] == 6
+    assert fake.aborted == []
+
+
+def test_closing_a_session_aborts_its_request():
+    fake = FakeAsyncEngine()
+    backend = VLLMBackend(lambda: fake, [STOP], dict)
+
+    async def main():
+        engine = InferenceEngine(SessionModel(backend), stop_tokens=[STOP])
+        session = engine.open_session([0])
+        tokens = await generate(session, limit=3)
+        session.cancel()
+        for _ in range(100):
+            if fake.aborted:
+                break
+            await asyncio.sleep(0.01)
+        return tokens
+
+    try:
+        assert asyncio.run(main()) == [1, 2, 3]
+    finally:
+        backend.close()
+    assert len(fake.aborted) == 1
+
+
+def test_slow_request_does_not_delay_the_batch(monkeypatch):
+    fake = FakeAsyncEngine()
+    backend = VLLMBackend(lambda: fake, [STOP], dict)
+    # each idle session used to block the engine step for this long
+    monkeypatch.setattr(VLLMSession, "wait_s", 0.5)
+
+    async def main():
+        engine = InferenceEngine(SessionModel(backend), stop_tokens=[STOP])
+        slow = engine.open_session([9])
+        fast = engine.open_session([1])
+        started = time.monotonic()
+        tokens = await generate(fast)
+        elapsed = time.monotonic() - started
+        slow.close()
+        fast.close()
+        return tokens, elapsed
+
+    try:
+        tokens, elapsed = asyncio.run(main())
+    finally:
+        backend.close()
+    assert tokens == [11, 12, 13, STOP]
+    # far less than one wait per token
+    assert elapsed < 1.0
+
+
+def test_server_shutdown_stops_the_engine(harmony_encoding):
+    fake = FakeAsyncEngine()
+    backend = VLLMBackend(lambda: fake, [STOP], dict)
+    with TestClient(create_api_server(backend, harmony_encoding)):
+        pass
+    assert fake.shut_down
+    assert backend.loop.loop.is_closed()